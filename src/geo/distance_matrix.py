@@ -0,0 +1,117 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# Distance and bearing matrices between a set of N points, such as CBSDs,
+# and a set of M targets, such as protection points. The N x M pairs are
+# solved with the vectorized Vincenty formula in blocks of rows, so memory
+# use stays bounded by the block size rather than by N x M intermediate
+# arrays for every iteration of the solver.
+#
+# With a distance cutoff only the pairs within the cutoff are returned, as
+# sparse coordinate arrays. Each block is first screened with the bounded
+# error fast distance, so pairs which are clearly beyond the cutoff are
+# never passed to the Vincenty solver.
+#
+# Example use:
+#   dist, az, raz = DistanceMatrix(cbsd_lats, cbsd_lngs, pt_lats, pt_lngs)
+#   near = SparseDistanceMatrix(cbsd_lats, cbsd_lngs, pt_lats, pt_lngs, 150.0)
+#   for i, j, d in zip(near.rows, near.cols, near.dist): ...
+
+import numpy
+
+import fast_distance
+import vincenty
+
+# Default number of (point, target) pairs solved at once. Each pair takes
+# a few hundred bytes of working arrays in the solver.
+DEFAULT_BLOCK_PAIRS = 256 * 1024
+
+def _Points(lats, lngs):
+  lats = numpy.asarray(lats, dtype=numpy.float64).ravel()
+  lngs = numpy.asarray(lngs, dtype=numpy.float64).ravel()
+  if lats.shape != lngs.shape:
+    raise Exception('Mismatched lat and lng arrays: %d and %d values' %
+                    (len(lats), len(lngs)))
+  return lats, lngs
+
+# Yields (start, stop) row ranges covering n rows of m columns each, with at
+# most block_pairs pairs per range (and at least one row).
+def RowBlocks(n, m, block_pairs=DEFAULT_BLOCK_PAIRS):
+  rows = max(int(block_pairs) // max(m, 1), 1)
+  for start in range(0, n, rows):
+    yield start, min(start + rows, n)
+
+# Returns (dist, az, raz) arrays of shape (N, M) holding the distance (km),
+# initial bearing (deg) and back azimuth (deg) from each of the N points
+# (lats1, lngs1) to each of the M targets (lats2, lngs2).
+def DistanceMatrix(lats1, lngs1, lats2, lngs2, block_pairs=DEFAULT_BLOCK_PAIRS):
+  lats1, lngs1 = _Points(lats1, lngs1)
+  lats2, lngs2 = _Points(lats2, lngs2)
+  n, m = len(lats1), len(lats2)
+  dist = numpy.empty((n, m))
+  az = numpy.empty((n, m))
+  raz = numpy.empty((n, m))
+  for start, stop in RowBlocks(n, m, block_pairs):
+    d, a, r = vincenty.dist_bear_vincenty_array(
+        lats1[start:stop, numpy.newaxis], lngs1[start:stop, numpy.newaxis],
+        lats2[numpy.newaxis, :], lngs2[numpy.newaxis, :])
+    dist[start:stop] = d
+    az[start:stop] = a
+    raz[start:stop] = r
+  return dist, az, raz
+
+# The pairs within the cutoff distance of a SparseDistanceMatrix, in
+# coordinate form: pair k is point rows[k] and target cols[k], at distance
+# dist[k] (km) with bearing az[k] and back azimuth raz[k] (deg). Pairs are
+# ordered by row, then by column. shape is the (N, M) shape of the full
+# matrix.
+class SparseDistances:
+  def __init__(self, shape, rows, cols, dist, az, raz):
+    self.shape = shape
+    self.rows = rows
+    self.cols = cols
+    self.dist = dist
+    self.az = az
+    self.raz = raz
+
+  def __len__(self):
+    return len(self.rows)
+
+  # Returns the pair indices of the given target column.
+  def ColumnPairs(self, col):
+    return numpy.nonzero(self.cols == col)[0]
+
+# Returns a SparseDistances holding the pairs of points (lats1, lngs1) and
+# targets (lats2, lngs2) whose exact distance is at most max_dist_km.
+def SparseDistanceMatrix(lats1, lngs1, lats2, lngs2, max_dist_km,
+                         block_pairs=DEFAULT_BLOCK_PAIRS):
+  lats1, lngs1 = _Points(lats1, lngs1)
+  lats2, lngs2 = _Points(lats2, lngs2)
+  n, m = len(lats1), len(lats2)
+  parts = []
+  for start, stop in RowBlocks(n, m, block_pairs):
+    lower, upper = fast_distance.ConservativeDistance(
+        lats1[start:stop, numpy.newaxis], lngs1[start:stop, numpy.newaxis],
+        lats2[numpy.newaxis, :], lngs2[numpy.newaxis, :])
+    rows, cols = numpy.nonzero(lower <= max_dist_km)
+    rows += start
+    d, a, r = vincenty.dist_bear_vincenty_array(
+        lats1[rows], lngs1[rows], lats2[cols], lngs2[cols])
+    keep = d <= max_dist_km
+    parts.append((rows[keep], cols[keep], d[keep], a[keep], r[keep]))
+
+  if not parts:
+    empty = numpy.zeros(0)
+    parts = [(empty.astype(int), empty.astype(int), empty, empty, empty)]
+  return SparseDistances((n, m), *[numpy.concatenate(p) for p in zip(*parts)])
@@ -0,0 +1,84 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import unittest
+
+import distance_matrix
+import vincenty
+
+class TestDistanceMatrix(unittest.TestCase):
+  def setUp(self):
+    rng = numpy.random.RandomState(3)
+    self.lats1 = rng.uniform(36, 40, 37)
+    self.lngs1 = rng.uniform(-106, -100, 37)
+    self.lats2 = rng.uniform(37, 39, 11)
+    self.lngs2 = rng.uniform(-104, -102, 11)
+
+  def test_row_blocks(self):
+    self.assertEquals([(0, 3), (3, 6), (6, 7)],
+                      list(distance_matrix.RowBlocks(7, 10, 30)))
+    self.assertEquals([(0, 1), (1, 2)],
+                      list(distance_matrix.RowBlocks(2, 100, 30)))
+
+  def test_matches_scalar(self):
+    dist, az, raz = distance_matrix.DistanceMatrix(
+        self.lats1, self.lngs1, self.lats2, self.lngs2, block_pairs=50)
+    self.assertEquals((37, 11), dist.shape)
+    for i in range(0, 37, 5):
+      for j in range(11):
+        d, a, r = vincenty.dist_bear_vincenty(self.lats1[i], self.lngs1[i],
+                                              self.lats2[j], self.lngs2[j])
+        self.assertAlmostEqual(d, dist[i, j], 9)
+        self.assertAlmostEqual(a, az[i, j], 9)
+        self.assertAlmostEqual(r, raz[i, j], 9)
+
+  def test_sparse_matches_dense(self):
+    dist, az, raz = distance_matrix.DistanceMatrix(
+        self.lats1, self.lngs1, self.lats2, self.lngs2)
+    near = distance_matrix.SparseDistanceMatrix(
+        self.lats1, self.lngs1, self.lats2, self.lngs2, 150.0, block_pairs=50)
+    self.assertEquals((37, 11), near.shape)
+    rows, cols = numpy.nonzero(dist <= 150.0)
+    self.assertTrue(0 < len(rows) < dist.size)
+    self.assertEquals(rows.tolist(), near.rows.tolist())
+    self.assertEquals(cols.tolist(), near.cols.tolist())
+    self.assertTrue(numpy.allclose(dist[rows, cols], near.dist))
+    self.assertTrue(numpy.allclose(az[rows, cols], near.az))
+    self.assertEquals(len(near.ColumnPairs(4)), numpy.sum(dist[:, 4] <= 150.0))
+
+  def test_sparse_far(self):
+    # Cutoffs beyond the verified range of the fast distance error bound.
+    rng = numpy.random.RandomState(5)
+    lats1 = rng.uniform(25, 48, 20)
+    lngs1 = rng.uniform(-125, -70, 20)
+    dist, az, raz = distance_matrix.DistanceMatrix(
+        lats1, lngs1, self.lats2, self.lngs2)
+    near = distance_matrix.SparseDistanceMatrix(
+        lats1, lngs1, self.lats2, self.lngs2, 2100.0)
+    rows, cols = numpy.nonzero(dist <= 2100.0)
+    self.assertTrue(numpy.any(dist > 2100.0))
+    self.assertTrue(numpy.any((dist > 2000.0) & (dist <= 2100.0)))
+    self.assertEquals(rows.tolist(), near.rows.tolist())
+    self.assertEquals(cols.tolist(), near.cols.tolist())
+
+  def test_sparse_empty(self):
+    near = distance_matrix.SparseDistanceMatrix(
+        self.lats1, self.lngs1, self.lats2, self.lngs2, 0.1)
+    self.assertEquals(0, len(near))
+    near = distance_matrix.SparseDistanceMatrix([], [], self.lats2, self.lngs2,
+                                                10.0)
+    self.assertEquals(0, len(near))
+
+if __name__ == '__main__':
+  unittest.main()
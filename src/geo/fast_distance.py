@@ -0,0 +1,117 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# Fast approximate geodesic distances for bulk screening, such as finding
+# which CBSDs are within 40, 80 or 150 km of a protection point. Distances
+# use the Andoyer-Lambert formula: the great circle distance between the
+# points at their reduced latitudes on the WGS84 ellipsoid, with a first
+# order flattening correction. It is a single closed-form pass, with no
+# iteration, and is exact to a relative error below 1.5e-6 (1.5 mm per
+# kilometer) for distances up to 2000 km, against Vincenty's formula.
+#
+# For decisions which must match the exact distance, WithinDistance uses
+# the bounded error to settle the clear cases and falls back to the Vincenty
+# formula only for pairs within the error bound of the threshold.
+#
+# Example use:
+#   near = WithinDistance(cbsd_lats, cbsd_lngs, lat, lng, 150.0)
+
+import numpy
+
+import vincenty
+
+A = 6378.1370         # semi-major axis (km), WGS84
+F = 1./298.257223563  # flattening of the ellipsoid, WGS84
+
+# Bound on the relative error of FastDistance, and an absolute allowance
+# (km) for floating point error at very short distances. The largest
+# relative error seen against Vincenty's formula is 1.41e-6.
+MAX_RELATIVE_ERROR = 2.0E-6
+MAX_ABSOLUTE_ERROR_KM = 1.0E-6
+
+# Distance (km) up to which the error bound has been verified. Pairs further
+# apart than this are always checked with Vincenty's formula.
+MAX_BOUNDED_DISTANCE_KM = 2000.0
+
+# Returns the approximate distance (km) between the points, which may be
+# scalars or NumPy arrays which broadcast together. See the module comment
+# for the accuracy.
+def FastDistance(lat1, lng1, lat2, lng2):
+  lat1 = numpy.radians(numpy.asarray(lat1, dtype=numpy.float64))
+  lat2 = numpy.radians(numpy.asarray(lat2, dtype=numpy.float64))
+  dlng = numpy.radians(numpy.asarray(lng2, dtype=numpy.float64) -
+                       numpy.asarray(lng1, dtype=numpy.float64))
+  beta1 = numpy.arctan((1 - F) * numpy.tan(lat1))
+  beta2 = numpy.arctan((1 - F) * numpy.tan(lat2))
+  P = 0.5 * (beta1 + beta2)
+  Q = 0.5 * (beta2 - beta1)
+
+  # Central angle between the points at the reduced latitudes (haversine).
+  h = numpy.sin(Q)**2 + numpy.cos(beta1) * numpy.cos(beta2) * numpy.sin(0.5 * dlng)**2
+  sigma = 2 * numpy.arcsin(numpy.sqrt(numpy.clip(h, 0.0, 1.0)))
+
+  with numpy.errstate(invalid='ignore', divide='ignore'):
+    X = ((sigma - numpy.sin(sigma)) * numpy.sin(P)**2 * numpy.cos(Q)**2 /
+         numpy.cos(0.5 * sigma)**2)
+    Y = ((sigma + numpy.sin(sigma)) * numpy.cos(P)**2 * numpy.sin(Q)**2 /
+         numpy.sin(0.5 * sigma)**2)
+  # Coincident points have no correction.
+  Y = numpy.where(sigma == 0, 0.0, Y)
+  return A * (sigma - 0.5 * F * (X + Y))
+
+# Returns the largest error (km) of a FastDistance result d.
+def ErrorBound(d):
+  return MAX_RELATIVE_ERROR * numpy.asarray(d) + MAX_ABSOLUTE_ERROR_KM
+
+# Returns (lower, upper) arrays which are guaranteed to bracket the exact
+# distance (km) between the points. Pairs further apart than
+# MAX_BOUNDED_DISTANCE_KM are solved with Vincenty's formula, and both bounds
+# are the exact distance.
+def ConservativeDistance(lat1, lng1, lat2, lng2):
+  lat1, lng1, lat2, lng2 = numpy.broadcast_arrays(
+      numpy.asarray(lat1, dtype=numpy.float64),
+      numpy.asarray(lng1, dtype=numpy.float64),
+      numpy.asarray(lat2, dtype=numpy.float64),
+      numpy.asarray(lng2, dtype=numpy.float64))
+  d = numpy.asarray(FastDistance(lat1, lng1, lat2, lng2))
+  err = ErrorBound(d)
+  lower = numpy.array(numpy.maximum(d - err, 0.0))
+  upper = numpy.array(d + err)
+  far = d > MAX_BOUNDED_DISTANCE_KM
+  if far.any():
+    exact, az, raz = vincenty.dist_bear_vincenty_array(
+        lat1[far], lng1[far], lat2[far], lng2[far])
+    lower[far] = exact
+    upper[far] = exact
+  return lower[()], upper[()]
+
+# Returns a boolean array which is True where the exact (Vincenty) distance
+# between the points is at most threshold_km. The fast distance decides all
+# pairs further than its error bound from the threshold; only the remaining
+# pairs are solved with Vincenty's formula.
+def WithinDistance(lat1, lng1, lat2, lng2, threshold_km):
+  lat1, lng1, lat2, lng2 = numpy.broadcast_arrays(
+      numpy.asarray(lat1, dtype=numpy.float64),
+      numpy.asarray(lng1, dtype=numpy.float64),
+      numpy.asarray(lat2, dtype=numpy.float64),
+      numpy.asarray(lng2, dtype=numpy.float64))
+  d = FastDistance(lat1, lng1, lat2, lng2)
+  within = d <= threshold_km
+  uncertain = ((numpy.abs(d - threshold_km) <= ErrorBound(d)) |
+               (d > MAX_BOUNDED_DISTANCE_KM))
+  if uncertain.any():
+    exact, az, raz = vincenty.dist_bear_vincenty_array(
+        lat1[uncertain], lng1[uncertain], lat2[uncertain], lng2[uncertain])
+    within[uncertain] = exact <= threshold_km
+  return within
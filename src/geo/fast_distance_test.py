@@ -0,0 +1,77 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import unittest
+
+import fast_distance
+import vincenty
+
+class TestFastDistance(unittest.TestCase):
+  def setUp(self):
+    rng = numpy.random.RandomState(7)
+    n = 20000
+    self.lat1 = rng.uniform(-80, 80, n)
+    self.lng1 = rng.uniform(-180, 180, n)
+    self.dist = rng.uniform(0.001, 2000, n)
+    bearing = rng.uniform(0, 360, n)
+    self.lat2, self.lng2, az = vincenty.to_dist_bear_vincenty_array(
+        self.lat1, self.lng1, self.dist, bearing)
+
+  def test_error_bound(self):
+    d = fast_distance.FastDistance(self.lat1, self.lng1, self.lat2, self.lng2)
+    self.assertTrue(numpy.all(numpy.abs(d - self.dist) <=
+                              fast_distance.ErrorBound(d)))
+
+  def test_conservative_distance(self):
+    lower, upper = fast_distance.ConservativeDistance(
+        self.lat1, self.lng1, self.lat2, self.lng2)
+    self.assertTrue(numpy.all(lower <= self.dist))
+    self.assertTrue(numpy.all(upper >= self.dist))
+
+  def test_conservative_distance_far(self):
+    # Beyond the verified range both bounds are the Vincenty distance.
+    dist = numpy.array([1500.0, 2500.0, 9000.0])
+    lat2, lng2, az = vincenty.to_dist_bear_vincenty_array(
+        10.0, 20.0, dist, 77.0)
+    lower, upper = fast_distance.ConservativeDistance(10.0, 20.0, lat2, lng2)
+    exact, az, raz = vincenty.dist_bear_vincenty_array(
+        numpy.full(3, 10.0), numpy.full(3, 20.0), lat2, lng2)
+    self.assertTrue(lower[0] < dist[0] < upper[0])
+    self.assertEquals(exact[1:].tolist(), lower[1:].tolist())
+    self.assertEquals(exact[1:].tolist(), upper[1:].tolist())
+    self.assertAlmostEqual(9000.0, upper[2], places=6)
+    # Scalar points give scalar bounds.
+    lower, upper = fast_distance.ConservativeDistance(10.0, 20.0, lat2[2],
+                                                      lng2[2])
+    self.assertEquals((), numpy.shape(lower))
+    self.assertEquals(exact[2], lower)
+    self.assertEquals(exact[2], upper)
+
+  def test_coincident_points(self):
+    self.assertEquals(0.0, fast_distance.FastDistance(40.0, -105.0, 40.0, -105.0))
+
+  def test_within_distance(self):
+    within = fast_distance.WithinDistance(self.lat1, self.lng1,
+                                          self.lat2, self.lng2, 150.0)
+    self.assertEquals((self.dist <= 150.0).tolist(), within.tolist())
+
+  def test_within_distance_at_threshold(self):
+    # Points just inside and outside the threshold need the exact distance.
+    lat2, lng2, az = vincenty.to_dist_bear_vincenty_array(
+        40.0, -105.0, numpy.array([80.0 - 1e-7, 80.0 + 1e-7]), 33.0)
+    within = fast_distance.WithinDistance(40.0, -105.0, lat2, lng2, 80.0)
+    self.assertEquals([True, False], within.tolist())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,127 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module provides a zero-copy reader for GridFloat (ESRI .flt/.hdr)
+# raster tiles such as the USGS NED 1-arcsecond degree tiles. Rather than
+# reading the whole raster into memory, the .flt file is memory-mapped with
+# numpy.memmap using the geometry from the companion .hdr file. Only the
+# pages actually touched by lookups are brought in, and the OS page cache
+# backing them is shared by every process which maps the same tile.
+
+import numpy
+import os
+import re
+
+# Returns the degree tile key ('<lat>.<lng>' of the northwest corner) for a
+# NED GridFloat filename such as usgs_ned_1_n33w083_gridfloat.flt or
+# floatn33w083_1.flt, along with a flag which is True for the older 'float*'
+# files. Returns (None, False) if the name does not identify a tile.
+def NedTileKey(filename):
+  m = re.match('(.*?)([ns])(\d+)([ew])(\d+)(.*)', os.path.basename(filename))
+  if not m:
+    return None, False
+  lat = int(m.group(3))
+  lng = int(m.group(5))
+  if m.group(2) == 's':
+    lat = -lat
+  if m.group(4) == 'w':
+    lng = -lng
+  return '%s.%s' % (lat, lng), m.group(1) == 'float'
+
+# Returns the .hdr filename which accompanies the given .flt file.
+def HeaderFilename(flt_filename):
+  return os.path.splitext(flt_filename)[0] + '.hdr'
+
+# Parses an ESRI .hdr file into a dict of lowercase keys to values. Numeric
+# values are converted to float (ncols and nrows to int).
+def ReadHeader(hdr_filename):
+  with open(hdr_filename, 'r') as f:
+    return ParseHeader(f.read(), hdr_filename)
+
+# Parses the text of an ESRI .hdr file; see ReadHeader. The name is used for
+# error messages.
+def ParseHeader(text, name=''):
+  hdr = {}
+  for line in text.splitlines():
+    parts = line.split()
+    if len(parts) < 2:
+      continue
+    key = parts[0].lower()
+    value = parts[1]
+    if key in ('ncols', 'nrows'):
+      hdr[key] = int(value)
+    elif key == 'byteorder':
+      hdr[key] = value.upper()
+    else:
+      try:
+        hdr[key] = float(value)
+      except ValueError:
+        hdr[key] = value
+
+  for required in ('ncols', 'nrows', 'cellsize'):
+    if required not in hdr:
+      raise Exception('GridFloat header %s missing %s' % (name, required))
+
+  # Normalize cell-center registration to cell-corner registration.
+  if 'xllcorner' not in hdr:
+    hdr['xllcorner'] = hdr['xllcenter'] - 0.5 * hdr['cellsize']
+  if 'yllcorner' not in hdr:
+    hdr['yllcorner'] = hdr['yllcenter'] - 0.5 * hdr['cellsize']
+  return hdr
+
+# Returns the numpy dtype of the raster values described by the header.
+def DataType(hdr):
+  if hdr.get('byteorder', 'LSBFIRST') in ('MSBFIRST', 'M'):
+    return numpy.dtype('>f4')
+  return numpy.dtype('<f4')
+
+# Returns the GDAL-style geo transform corresponding to the header geometry:
+# (ulx, xres, 0, uly, 0, -yres)
+def GeoTransform(hdr):
+  cellsize = hdr['cellsize']
+  return (hdr['xllcorner'], cellsize, 0.0,
+          hdr['yllcorner'] + hdr['nrows'] * cellsize, 0.0, -cellsize)
+
+# Returns the inverse of a north-up geo transform, mapping (lng, lat) to
+# (pixel, line) coordinates. This is the same form returned by
+# gdal.InvGeoTransform for unrotated rasters.
+def InvGeoTransform(txf):
+  return (-txf[0] / txf[1], 1.0 / txf[1], 0.0,
+          -txf[3] / txf[5], 0.0, 1.0 / txf[5])
+
+# A single memory-mapped GridFloat tile. The data attribute is a read-only
+# (nrows, ncols) float32 numpy.memmap; txf and inv_txf are the forward and
+# inverse geo transforms for the tile.
+class GridFloatTile:
+  def __init__(self, flt_filename, hdr_filename=None):
+    if hdr_filename is None:
+      hdr_filename = HeaderFilename(flt_filename)
+    self.filename = flt_filename
+    self.header = ReadHeader(hdr_filename)
+
+    dtype = DataType(self.header)
+    self.nodata = self.header.get('nodata_value', None)
+    self.txf = GeoTransform(self.header)
+    self.inv_txf = InvGeoTransform(self.txf)
+    self.data = numpy.memmap(flt_filename, dtype=dtype, mode='r',
+                             shape=(self.header['nrows'], self.header['ncols']))
+
+  # Returns the elevations at the given arrays of row and column indices.
+  def Values(self, rows, cols):
+    return self.data[rows, cols]
+
+  # The number of bytes of the file mapping. Note that resident memory for
+  # the tile is only the pages which have actually been touched.
+  def MappedBytes(self):
+    return self.data.size * self.data.itemsize
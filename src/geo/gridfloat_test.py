@@ -0,0 +1,110 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+import gridfloat
+
+HEADER = """ncols         4
+nrows         3
+xllcorner     -106.00166666667
+yllcorner     38.99833333333
+cellsize      0.5
+NODATA_value  -9999
+byteorder     %s
+"""
+
+# Returns the inverse of a GDAL geo transform by inverting the affine matrix,
+# as gdal.InvGeoTransform does.
+def GeneralInverse(txf):
+  m = numpy.array([[txf[1], txf[2], txf[0]],
+                   [txf[4], txf[5], txf[3]],
+                   [0.0, 0.0, 1.0]])
+  inv = numpy.linalg.inv(m)
+  return (inv[0, 2], inv[0, 0], inv[0, 1], inv[1, 2], inv[1, 0], inv[1, 1])
+
+class TestGridFloat(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.data = numpy.arange(12, dtype=numpy.float32).reshape(3, 4) * 10.5
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def WriteTile(self, name, byteorder='LSBFIRST'):
+    flt = os.path.join(self.dir, name)
+    with open(gridfloat.HeaderFilename(flt), 'w') as f:
+      f.write(HEADER % byteorder)
+    dtype = '>f4' if byteorder == 'MSBFIRST' else '<f4'
+    self.data.astype(dtype).tofile(flt)
+    return flt
+
+  def test_parse_header(self):
+    hdr = gridfloat.ParseHeader(HEADER % 'LSBFIRST')
+    self.assertEquals(4, hdr['ncols'])
+    self.assertEquals(3, hdr['nrows'])
+    self.assertEquals(-9999.0, hdr['nodata_value'])
+    self.assertEquals('LSBFIRST', hdr['byteorder'])
+
+  def test_parse_header_centers(self):
+    hdr = gridfloat.ParseHeader('ncols 2\nnrows 2\nxllcenter -105.75\n'
+                                'yllcenter 39.25\ncellsize 0.5\n')
+    self.assertEquals(-106.0, hdr['xllcorner'])
+    self.assertEquals(39.0, hdr['yllcorner'])
+
+  def test_parse_header_missing(self):
+    self.assertRaises(Exception, gridfloat.ParseHeader, 'ncols 2\nnrows 2\n')
+
+  def test_transforms(self):
+    hdr = gridfloat.ParseHeader(HEADER % 'LSBFIRST')
+    txf = gridfloat.GeoTransform(hdr)
+    # GDAL convention: the upper left corner of the upper left pixel, with a
+    # negative line step.
+    self.assertAlmostEqual(-106.00166666667, txf[0])
+    self.assertAlmostEqual(38.99833333333 + 1.5, txf[3])
+    self.assertEquals(0.5, txf[1])
+    self.assertEquals(-0.5, txf[5])
+    inv = gridfloat.InvGeoTransform(txf)
+    for a, b in zip(GeneralInverse(txf), inv):
+      self.assertAlmostEqual(a, b, 9)
+    # The center of pixel (line 2, pixel 1) maps to (2.5, 1.5).
+    lng = txf[0] + 1.5 * txf[1]
+    lat = txf[3] + 2.5 * txf[5]
+    self.assertAlmostEqual(1.5, inv[0] + inv[1] * lng + inv[2] * lat)
+    self.assertAlmostEqual(2.5, inv[3] + inv[4] * lng + inv[5] * lat)
+
+  def test_tile_values(self):
+    for byteorder in ('LSBFIRST', 'MSBFIRST'):
+      tile = gridfloat.GridFloatTile(
+          self.WriteTile('float_%s.flt' % byteorder, byteorder))
+      self.assertEquals((3, 4), tile.data.shape)
+      self.assertEquals(-9999.0, tile.nodata)
+      self.assertEquals(self.data.tolist(), tile.data.tolist())
+      self.assertEquals([21.0, 115.5],
+                        tile.Values(numpy.array([0, 2]),
+                                    numpy.array([2, 3])).tolist())
+      self.assertEquals(48, tile.MappedBytes())
+
+  def test_ned_tile_key(self):
+    self.assertEquals(('33.-83', False),
+                      gridfloat.NedTileKey('usgs_ned_1_n33w083_gridfloat.flt'))
+    self.assertEquals(('-14.170', True),
+                      gridfloat.NedTileKey('floats14e170_1.flt'))
+    self.assertEquals((None, False), gridfloat.NedTileKey('readme.txt'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,194 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module builds and reads a land category raster: the NLCD land cover
+# collapsed to the NLCD_LAND_CATEGORY designations of land_use.py (URBAN,
+# SUBURBAN, RURAL), with open water (NLCD code 11) flagged, resampled onto a
+# regular lat/lng grid. The raster is stored as one uint8 .npy file per
+# degree tile and memory-mapped, so a lookup is a little arithmetic and one
+# array read, with no reprojection and no NLCD raster access.
+#
+# Example use:
+#   python land_category.py ../../data/nlcd           # build the raster
+#   indx = LandCategoryIndexer('../../data/nlcd/categories')
+#   print indx.Region(39.7, -104.9)                    # e.g. 'SUBURBAN'
+
+import math
+import numpy
+import os
+import sys
+
+import land_use
+
+# Category values stored in the raster. Water is a rural area as far as the
+# land category is concerned.
+RURAL = 0
+SUBURBAN = 1
+URBAN = 2
+WATER = 3
+# Value of cells not covered by the NLCD data.
+NODATA = 255
+
+CATEGORY_NAMES = {
+  RURAL: 'RURAL',
+  SUBURBAN: 'SUBURBAN',
+  URBAN: 'URBAN',
+  WATER: 'RURAL',
+}
+
+# NLCD code of open water.
+NLCD_OPEN_WATER = 11
+
+# Default subdirectory of the NLCD directory holding the raster.
+DEFAULT_SUBDIRECTORY = 'categories'
+
+# Returns the lookup table mapping NLCD codes (as uint8) to category values,
+# following land_use.NlcdLandCategory. Code 0 marks cells with no data.
+def CategoryTable():
+  table = numpy.zeros(256, dtype=numpy.uint8)
+  values = {'RURAL': RURAL, 'SUBURBAN': SUBURBAN, 'URBAN': URBAN}
+  for code in range(256):
+    table[code] = values[land_use.NlcdLandCategory(code)]
+  table[NLCD_OPEN_WATER] = WATER
+  table[0] = NODATA
+  return table
+
+# Returns the filename of the raster for the degree tile whose northwest
+# corner is at lat, lng.
+def TileFilename(directory, lat, lng):
+  return os.path.join(directory, 'landcat_%d_%d.npy' % (lat, lng))
+
+class LandCategoryIndexer:
+  def __init__(self, directory):
+    self.directory = directory
+    # Maps (lat, lng) of the northwest corner of each degree tile present to
+    # its memory-mapped raster, or None until the raster is first used.
+    self.tiles = {}
+    for f in os.listdir(directory):
+      if f.startswith('landcat_') and f.endswith('.npy'):
+        lat, lng = f[len('landcat_'):-len('.npy')].split('_')
+        self.tiles[(int(lat), int(lng))] = None
+
+  # Returns the memory-mapped raster of the degree tile whose northwest
+  # corner is key = (lat, lng). Raises KeyError if there is no such tile.
+  def Tile(self, key):
+    raster = self.tiles[key]
+    if raster is None:
+      raster = numpy.load(TileFilename(self.directory, key[0], key[1]),
+                          mmap_mode='r')
+      self.tiles[key] = raster
+    return raster
+
+  # Returns the category value (RURAL, SUBURBAN, URBAN, WATER or NODATA) at
+  # the lat/lng. Raises an Exception if no tile covers the point.
+  def RegionCode(self, lat, lng):
+    key = (int(math.ceil(lat)), int(math.floor(lng)))
+    if key not in self.tiles:
+      raise Exception('No land category tile for lat lng %f %f' % (lat, lng))
+    raster = self.Tile(key)
+    n = raster.shape[0]
+    row = min(int((key[0] - lat) * n), n - 1)
+    col = min(int((lng - key[1]) * n), n - 1)
+    return raster[row, col]
+
+  # Returns the NLCD_LAND_CATEGORY ('URBAN', 'SUBURBAN' or 'RURAL') at the
+  # lat/lng. Raises an Exception if the point has no land cover data.
+  def Region(self, lat, lng):
+    code = self.RegionCode(lat, lng)
+    if code == NODATA:
+      raise Exception('No land category for lat lng %f %f' % (lat, lng))
+    return CATEGORY_NAMES[code]
+
+  # Returns True if the land cover at the lat/lng is open water.
+  def IsWater(self, lat, lng):
+    return self.RegionCode(lat, lng) == WATER
+
+  # Returns a numpy array of the category values at the given arrays of lats
+  # and lngs. Points not covered by any tile are NODATA.
+  def RegionCodeBatch(self, lats, lngs):
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    codes = numpy.full(lats.shape, NODATA, dtype=numpy.uint8)
+    north = numpy.ceil(lats).astype(int)
+    west = numpy.floor(lngs).astype(int)
+    for key in set(zip(north.ravel(), west.ravel())):
+      if key not in self.tiles:
+        continue
+      raster = self.Tile(key)
+      n = raster.shape[0]
+      sel = (north == key[0]) & (west == key[1])
+      rows = numpy.minimum(((key[0] - lats[sel]) * n).astype(int), n - 1)
+      cols = numpy.minimum(((lngs[sel] - key[1]) * n).astype(int), n - 1)
+      codes[sel] = raster[rows, cols]
+    return codes
+
+# Builds the raster tile for the degree tile whose northwest corner is at
+# lat, lng, with cells of resolution arc seconds, from the codes returned by
+# the NlcdIndexer at the cell centers. Rows are classified a block at a time
+# to bound memory.
+def BuildTile(nlcd_indexer, lat, lng, resolution=1.0, rows_per_block=200):
+  n = int(round(3600.0 / resolution))
+  table = CategoryTable()
+  raster = numpy.zeros((n, n), dtype=numpy.uint8)
+  lngs = lng + (numpy.arange(n) + 0.5) / n
+  for row0 in range(0, n, rows_per_block):
+    rows = numpy.arange(row0, min(row0 + rows_per_block, n))
+    lats = lat - (rows + 0.5) / n
+    grid_lats, grid_lngs = numpy.meshgrid(lats, lngs, indexing='ij')
+    codes = nlcd_indexer.NlcdCodeBatch(grid_lats, grid_lngs, missing=0)
+    raster[rows, :] = table[codes.astype(numpy.uint8)]
+  return raster
+
+# Builds the land category raster for every degree tile touched by the
+# NLCD tiles of the indexer, writing the tiles to output_directory. Tiles
+# with no land cover data at all are not written.
+def BuildLandCategories(nlcd_indexer, output_directory, resolution=1.0):
+  if not os.path.isdir(output_directory):
+    os.makedirs(output_directory)
+  keys = set()
+  for t in nlcd_indexer.nlcd_file.values():
+    for lat in range(int(math.ceil(t.min_lat)), int(math.ceil(t.max_lat)) + 1):
+      for lng in range(int(math.floor(t.min_lng)),
+                       int(math.floor(t.max_lng)) + 1):
+        keys.add((lat, lng))
+
+  for lat, lng in sorted(keys):
+    print 'Building land categories for tile %d %d' % (lat, lng)
+    raster = BuildTile(nlcd_indexer, lat, lng, resolution)
+    if numpy.all(raster == NODATA):
+      continue
+    filename = TileFilename(output_directory, lat, lng)
+    tmp_filename = '%s.%d.tmp.npy' % (filename[:-len('.npy')], os.getpid())
+    numpy.save(tmp_filename, raster)
+    os.rename(tmp_filename, filename)
+
+# If run directly, builds the raster. Arguments are the NLCD directory, and
+# optionally the output directory and the resolution in arc seconds.
+if __name__ == '__main__':
+  import nlcd_indexer
+  if len(sys.argv) > 1:
+    nlcdDir = sys.argv[1]
+  else:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    rootDir = os.path.dirname(os.path.dirname(dir))
+    nlcdDir = os.path.join(os.path.join(rootDir, 'data'), 'nlcd')
+  if len(sys.argv) > 2:
+    output = sys.argv[2]
+  else:
+    output = os.path.join(nlcdDir, DEFAULT_SUBDIRECTORY)
+  resolution = 1.0
+  if len(sys.argv) > 3:
+    resolution = float(sys.argv[3])
+
+  BuildLandCategories(nlcd_indexer.NlcdIndexer(nlcdDir), output, resolution)
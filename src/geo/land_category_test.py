@@ -0,0 +1,76 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import shutil
+import tempfile
+import unittest
+
+import land_category
+
+# Stands in for an NlcdIndexer covering lats 39-40 and lngs -105 to -104.5,
+# with open water west of -104.9, urban land north of 39.8, suburban land
+# north of 39.5 and rural land elsewhere.
+class FakeNlcdIndexer:
+  def NlcdCodeBatch(self, lats, lngs, missing=None):
+    codes = numpy.full(lats.shape, 81, dtype=numpy.byte)
+    codes[lats > 39.5] = 22
+    codes[lats > 39.8] = 24
+    codes[lngs < -104.9] = 11
+    codes[lngs > -104.5] = missing
+    return codes
+
+class TestLandCategory(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    raster = land_category.BuildTile(FakeNlcdIndexer(), 40, -105,
+                                     resolution=30.0, rows_per_block=7)
+    numpy.save(land_category.TileFilename(self.directory, 40, -105), raster)
+    self.indx = land_category.LandCategoryIndexer(self.directory)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_category_table(self):
+    table = land_category.CategoryTable()
+    self.assertEquals(land_category.SUBURBAN, table[22])
+    self.assertEquals(land_category.URBAN, table[23])
+    self.assertEquals(land_category.WATER, table[11])
+    self.assertEquals(land_category.RURAL, table[41])
+    self.assertEquals(land_category.NODATA, table[0])
+
+  def test_region(self):
+    self.assertEquals('URBAN', self.indx.Region(39.9, -104.7))
+    self.assertEquals('SUBURBAN', self.indx.Region(39.6, -104.7))
+    self.assertEquals('RURAL', self.indx.Region(39.2, -104.7))
+    self.assertEquals('RURAL', self.indx.Region(39.2, -104.95))
+    self.assertTrue(self.indx.IsWater(39.2, -104.95))
+    self.assertFalse(self.indx.IsWater(39.2, -104.7))
+
+  def test_missing(self):
+    self.assertRaises(Exception, self.indx.Region, 39.2, -104.2)
+    self.assertRaises(Exception, self.indx.Region, 35.0, -104.7)
+
+  def test_batch(self):
+    lats = numpy.array([39.9, 39.6, 39.2, 39.2, 39.2, 35.0])
+    lngs = numpy.array([-104.7, -104.7, -104.7, -104.95, -104.2, -104.7])
+    codes = self.indx.RegionCodeBatch(lats, lngs)
+    self.assertEquals([land_category.URBAN, land_category.SUBURBAN,
+                       land_category.RURAL, land_category.WATER,
+                       land_category.NODATA, land_category.NODATA],
+                      codes.tolist())
+    for i in range(4):
+      self.assertEquals(self.indx.RegionCode(lats[i], lngs[i]), codes[i])
+
+if __name__ == '__main__':
+  unittest.main()
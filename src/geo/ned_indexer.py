@@ -17,131 +17,261 @@
 # data files and uses them to lookup elevations. Interpolation method is
 # bilinear. The class uses an LRU system to manage degree tiles, making
 # repeated lookups in the same geographical area very fast.
+#
+# Tiles which have a GridFloat .hdr file alongside the .flt file are
+# memory-mapped (see gridfloat.py) rather than read through GDAL, so only the
+# touched pages are resident and the page cache is shared between processes.
+# Other tiles fall back to a full GDAL read. If the directory contains a
+# terrain store built by terrain_store.py, all tiles are served from it.
+#
+# Lookups and profiles may also be made at the reduced resolutions of the
+# terrain pyramid (see terrain_pyramid.py), either as an approximation of the
+# terrain or as an upper or lower bound on the terrain elevation itself.
+# The bounds apply to the terrain only, not to path loss computed from it.
 
 import gdal
 import math
 import numpy
 import os
-import re
 import sys
-import time
 
+import gridfloat
+import terrain_pyramid
+import terrain_store
+import tile_cache
+import tile_prefetch
 import waypoints
 import vincenty
 
+# A NED tile read completely into memory through GDAL, used for tiles which
+# have no GridFloat header. Provides the same inv_txf and Values interface as
+# gridfloat.GridFloatTile. If a shared_tiles.SharedTileStore is given, the
+# decoded raster is shared with the other processes attached to it.
+class GdalTile:
+  def __init__(self, filename, shared=None):
+    self.filename = filename
+    dataset = gdal.Open(filename)
+    # Store the inverse geo transform which will map (lat, lng) to array
+    # indices in this tile.
+    self.inv_txf = gdal.InvGeoTransform(dataset.GetGeoTransform())
+    # The nodata elevation of the raster, or None if it has none.
+    self.nodata = dataset.GetRasterBand(1).GetNoDataValue()
+    if shared is None:
+      self.data = dataset.ReadAsArray().astype(numpy.float)
+    else:
+      self.data = shared.Attach(
+          filename, lambda: dataset.ReadAsArray().astype(numpy.float))
+    # close the file
+    dataset = None
+
+  # Returns the elevations at the given arrays of row and column indices.
+  def Values(self, rows, cols):
+    return self.data[rows, cols]
+
 class NedIndexer:
-  def __init__(self, directory, lru_size=10):
+  def __init__(self, directory,
+               cache_bytes=tile_cache.DEFAULT_CACHE_BYTES,
+               cache=None, shared=None, pyramid_dir=None):
     print 'Initializing NED index from %s' % directory
     self.directory = directory
-    files = os.listdir(self.directory)
-    files.sort()
+    # Optional shared_tiles.SharedTileStore through which tiles decoded by
+    # GDAL are shared between worker processes.
+    self.shared = shared
+    # Optional directory of pyramid levels saved by terrain_pyramid.py. Levels
+    # not found there are built from the full resolution tiles.
+    self.pyramid_dir = pyramid_dir
     self.latlng_file = {}
-    for f in files:
-      if f.endswith('.flt'):
-        m = re.match('(.*?)([ns])(\d+)([ew])(\d+)(.*)', f)
-        if m:
-          lat = m.group(3)
-          lng = m.group(5)
-          # print 'found %s %s for file %s' % (lat, lng, f)
-          if m.group(2) == 's':
-            lat = lat * -1
-          if m.group(4) == 'w':
-            lng = str(int(lng) * -1)
-          k = '%s.%s' % (lat, lng)
-          # print 'found %s for file %s' % (k, f)
-          if k in self.latlng_file and m.group(1) == 'float':
-            continue
-          self.latlng_file[k] = os.path.join(directory, f)
+
+    # If a pre-built terrain store is present (or directory names one), tiles
+    # are served from it and the directory scan is skipped.
+    self.store = None
+    store_filename = os.path.join(directory, terrain_store.STORE_FILENAME)
+    if os.path.isfile(directory):
+      store_filename = directory
+    if os.path.exists(store_filename):
+      print 'Using terrain store %s' % store_filename
+      self.store = terrain_store.TerrainStore(store_filename)
+    else:
+      files = os.listdir(self.directory)
+      files.sort()
+      for f in files:
+        if f.endswith('.flt'):
+          k, is_float = gridfloat.NedTileKey(f)
+          if k:
+            # print 'found %s for file %s' % (k, f)
+            if k in self.latlng_file and is_float:
+              continue
+            self.latlng_file[k] = os.path.join(directory, f)
     # latlng_file now has a list of the correct FLT sources for each degree tile.
 
-    # tile_cache will hold numpy arrays of the specific tiles as they are read in
-    # by the indexer.
-    self.tile_cache = {}
-    self.tile_lru = {}
-    self.tile_lru_size = lru_size
+    # tile_cache holds the tiles as they are read in by the indexer, keyed by
+    # degree tile key. Each tile has an inverse geo transform inv_txf mapping
+    # (lng, lat) to array indices, a Values(rows, cols) accessor and its data
+    # array. A cache may be passed in to share one memory budget between
+    # several indexers.
+    if cache is None:
+      cache = tile_cache.TileCache(cache_bytes)
+    self.tile_cache = cache
 
-    # txf will contain the inverse geo transform functions for specific tiles as
-    # they are created by reading the tiles
-    self.txf = {}
+  # Returns the key of the degree tile which includes the lat/lng provided.
+  def TileKey(self, lat, lng):
+    return '%s.%s' % (int(math.ceil(lat)), int(math.floor(lng)))
 
-  # This method loads a specific geo tile which includes the lat/lng provided.
-  # It manages the LRU such that a new tile replaces the least-recently-used tile
-  # if needed to remain under the size constraint.
+  # Returns the keys of the degree tiles in the data set.
+  def TileKeys(self):
+    if self.store:
+      return self.store.Keys()
+    return self.latlng_file.keys()
+
+  # This method returns the geo tile which includes the lat/lng provided,
+  # loading it if needed. The tile cache evicts least-recently-used tiles as
+  # needed to remain under its memory budget.
   def LoadTileForLatLng(self, lat, lng):
-    latf = int(math.ceil(lat))
-    lngf = int(math.floor(lng))
-    k = '%s.%s' % (latf, lngf)
-    if k in self.tile_cache:
-      return
+    return self._GetTile(self.TileKey(lat, lng))
+
+  # Loads a pinned copy of the tile which includes the lat/lng provided. The
+  # tile stays in memory regardless of the cache budget.
+  def PinTileForLatLng(self, lat, lng):
+    self.LoadTileForLatLng(lat, lng)
+    self.tile_cache.Pin(self.TileKey(lat, lng))
+
+  # Yields the given (lat1, lng1, lat2, lng2, ...) paths reordered so that
+  # paths touching the same degree tiles are adjacent, while background
+  # threads load the tiles needed by the next lookahead paths. The lookahead
+  # should be small enough that its tiles fit in the tile cache budget.
+  # Example:
+  #   for path in indx.Prefetch(paths):
+  #     profile = indx.Profile(*path[:4])
+  def Prefetch(self, paths, lookahead=32, num_threads=2):
+    path_tiles = [['%s.%s' % (lat, lng)
+                   for lat, lng in tile_prefetch.PathTiles(*p[:4])]
+                  for p in paths]
+    return tile_prefetch.PrefetchPaths(paths, path_tiles, self._PrefetchTile,
+                                       lookahead, num_threads)
+
+  def _GetTile(self, k):
+    return self.tile_cache.GetOrLoad(k, lambda: self._LoadTile(k),
+                                     self._ReleaseTile)
+
+  # Loads the tile for key k if the data set has one. Paths may cross areas
+  # (such as open ocean) without tiles; those are found on use.
+  def _PrefetchTile(self, k):
+    if self.store:
+      if k in self.store:
+        self._GetTile(k)
+    elif k in self.latlng_file:
+      self._GetTile(k)
+
+  def _LoadTile(self, k):
+    if self.store:
+      tile = self.store.Tile(k)
+      return tile, tile.data.nbytes
 
     filename = self.latlng_file[k]
     print 'Loading tile %s from %s' % (k, filename)
-    dataset = gdal.Open(filename)
-    # Store the inverse geo transform which will map (lat, lng) to array indices
-    # in this tile.
-    tx = dataset.GetGeoTransform()
-    self.txf[k] = gdal.InvGeoTransform(tx)
-
-    self.tile_cache[k] = dataset.ReadAsArray().astype(numpy.float)
-    self.tile_lru[k] = time.clock()
-
-    # evict a tile if there are more than tile_lru_size elements in the cache
-    if len(self.tile_lru) > self.tile_lru_size:
-      mint = 0
-      mink = ''
-      for k in self.tile_lru.keys():
-        if self.tile_lru[k] > mint:
-          mint = self.tile_lru[k]
-          mink = k
-      print 'Evicting tile %s' % k
-      del self.tile_cache[k]
-      del self.tile_lru[k]
+    if os.path.exists(gridfloat.HeaderFilename(filename)):
+      # Zero-copy path: map the raw float32 raster in place.
+      tile = gridfloat.GridFloatTile(filename)
+    else:
+      tile = GdalTile(filename, self.shared)
+    return tile, tile.data.nbytes
 
-    # close the file
-    dataset = None
+  # Returns the terrain_pyramid.PyramidTile for degree tile key k at the given
+  # resolution (arc seconds, one of terrain_pyramid.LEVELS). Levels share the
+  # tile cache with the full resolution tiles.
+  def LevelTile(self, k, resolution):
+    terrain_pyramid.LevelFactor(resolution)
+    return self.tile_cache.GetOrLoad('%s@%d' % (k, resolution),
+                                     lambda: self._LoadLevel(k, resolution))
+
+  def _LoadLevel(self, k, resolution):
+    level = None
+    if self.pyramid_dir:
+      level = terrain_pyramid.LoadLevel(self.pyramid_dir, k, resolution)
+    if level is None:
+      level = terrain_pyramid.BuildLevel(self._GetTile(k), resolution)
+    return level, level.Bytes()
+
+  def _ReleaseTile(self, k, tile):
+    if self.shared is not None and isinstance(tile, GdalTile):
+      self.shared.Detach(tile.filename)
 
   # Returns elevation in meters at the given lat,lng. The result uses
   # bilinear interpolation for values between the sample points of the
   # elevation raster data.
   def Elevation(self, lat, lng):
-    self.LoadTileForLatLng(lat, lng)
+    return self.ElevationBatch([lat], [lng])[0]
+
+  # Returns a numpy array of elevations in meters for the given arrays of lat
+  # and lng coordinates, with the same bilinear interpolation as Elevation.
+  # Points are grouped by degree tile and each group is interpolated with
+  # array operations.
+  #
+  # If resolution (arc seconds) is one of the coarser terrain_pyramid.LEVELS,
+  # the elevations are interpolated from the mean elevations of that level.
+  # If bound is terrain_pyramid.BOUND_MAX (or BOUND_MIN), each elevation is
+  # instead an upper (or lower) bound on the full resolution elevation, taken
+  # from the maximum (or minimum) aggregates of the level. At full resolution
+  # the bound is the maximum (or minimum) of the four samples the bilinear
+  # interpolation uses, read from the tile itself.
+  def ElevationBatch(self, lats, lngs, resolution=1, bound=None):
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    elev = numpy.zeros(lats.shape)
+    if lats.size == 0:
+      return elev
+
+    latfs = numpy.ceil(lats).astype(int)
+    lngfs = numpy.floor(lngs).astype(int)
+    tile_ids, tile_index = numpy.unique((latfs + 90) * 1000 + (lngfs + 180),
+                                        return_inverse=True)
+    tile_index = tile_index.reshape(lats.shape)
+
+    for i in range(len(tile_ids)):
+      sel = (tile_index == i)
+      lat = lats[sel]
+      lng = lngs[sel]
+      if resolution != 1:
+        level = self.LevelTile(self.TileKey(lat[0], lng[0]), resolution)
+        if bound:
+          elev[sel] = level.Bound(lat, lng, bound)
+        else:
+          elev[sel] = level.Elevations(lat, lng)
+        continue
 
-    latf = int(math.ceil(lat))
-    lngf = int(math.floor(lng))
-    k = '%s.%s' % (latf, lngf)
-    #print 'lat, lng = %f, %f' % (lat, lng)
-
-    tx = self.txf[k]
-    ipx = tx[0] + tx[1] * lng + tx[2] * lat
-    iln = tx[3] + tx[4] * lng + tx[5] * lat
-
-    a = self.tile_cache[k]
-    self.tile_lru[k] = time.clock()
-    #print 'Retrieving (%s, %s) from (%f, %f) from tile %s' % (lat, lng, ipx, iln, k)
-
-    ilnf = int(math.floor(iln))
-    ipxf = int(math.floor(ipx))
-    ilnc = int(math.ceil(iln))
-    ipxc = int(math.ceil(ipx))
-    if ilnc == ilnf:
-      ilnc = ilnc + 1
-    if ipxc == ipxf:
-      ipxc = ipxc + 1
-    eff = a[ilnf][ipxf]
-    efc = a[ilnf][ipxc]
-    ecf = a[ilnc][ipxf]
-    ecc = a[ilnc][ipxc]
-    #print 'Elevations: %f, %f, %f, %f' % (eff, efc, ecf, ecc)
-
-    a1 = (iln - float(ilnf)) * (ipx - float(ipxf))
-    a2 = (iln - float(ilnf)) * (float(ipxc) - ipx)
-    a3 = (float(ilnc) - iln) * (ipx - float(ipxf))
-    a4 = (float(ilnc) - iln) * (float(ipxc) - ipx)
-    #print 'Areas: %f, %f, %f, %f' % (a1, a2, a3, a4)
-
-    # interpolation multiplies each corner by the opposite area. Since the area
-    # is normalized to index lookups, the total area is 1.
-    elev = a1*ecc + a2*efc + a3*ecf + a4*eff
+      tile = self.LoadTileForLatLng(lat[0], lng[0])
+
+      tx = tile.inv_txf
+      ipx = tx[0] + tx[1] * lng + tx[2] * lat
+      iln = tx[3] + tx[4] * lng + tx[5] * lat
+
+      ilnf = numpy.floor(iln).astype(int)
+      ipxf = numpy.floor(ipx).astype(int)
+      ilnc = ilnf + 1
+      ipxc = ipxf + 1
+      eff = tile.Values(ilnf, ipxf)
+      efc = tile.Values(ilnf, ipxc)
+      ecf = tile.Values(ilnc, ipxf)
+      ecc = tile.Values(ilnc, ipxc)
+
+      if bound == terrain_pyramid.BOUND_MAX:
+        elev[sel] = numpy.maximum(numpy.maximum(eff, efc),
+                                  numpy.maximum(ecf, ecc))
+        continue
+      elif bound == terrain_pyramid.BOUND_MIN:
+        elev[sel] = numpy.minimum(numpy.minimum(eff, efc),
+                                  numpy.minimum(ecf, ecc))
+        continue
+      elif bound:
+        raise Exception('Unknown terrain bound %s' % bound)
+
+      # interpolation multiplies each corner by the opposite area. Since the
+      # area is normalized to index lookups, the total area is 1.
+      a1 = (iln - ilnf) * (ipx - ipxf)  # weight for ecc
+      a2 = (iln - ilnf) * (ipxc - ipx)  # weight for ecf
+      a3 = (ilnc - iln) * (ipx - ipxf)  # weight for efc
+      a4 = (ilnc - iln) * (ipxc - ipx)  # weight for eff
+      elev[sel] = a1*ecc + a2*ecf + a3*efc + a4*eff
 
     return elev
 
@@ -153,19 +283,60 @@ class NedIndexer:
   # followed by waypoint elevations from point 1 to point 2, ending with the
   # elevation at point 2. The elevations given are ground level relative to the
   # NED dataset datum.
-  def Profile(self, lat1, lng1, lat2, lng2):
-    sample_pts = waypoints.waypoints(lat1, lng1, lat2, lng2)
-    distance, a1, a2 = vincenty.dist_bear_vincenty(sample_pts[0][0], sample_pts[0][1],
-                                                   sample_pts[1][0], sample_pts[1][1])
-    print "Using sample points ", len(sample_pts)
+  #
+  # The resolution and bound arguments select a reduced resolution or bound
+  # profile as described for ElevationBatch. The sample points are the same
+  # as those of the full profile. A bound profile bounds the terrain
+  # elevations only, not the propagation loss computed from them: higher
+  # terrain usually raises diffraction loss, and ITM is not monotone in the
+  # terrain irregularity, so neither bound mode gives a bound on ITM loss.
+  # Example, an upper envelope of the terrain along the path:
+  #   upper = indx.Profile(lat1, lng1, lat2, lng2, resolution=30,
+  #                        bound=terrain_pyramid.BOUND_MAX)
+  def Profile(self, lat1, lng1, lat2, lng2, resolution=1, bound=None):
+    pts = waypoints.waypoints_array(lat1, lng1, lat2, lng2)
+    distance, a1, a2 = vincenty.dist_bear_vincenty(pts[0][0], pts[0][1],
+                                                   pts[1][0], pts[1][1])
+    print "Using sample points ", len(pts)
     print "distance=", distance
 
-    profile = [len(sample_pts)-1, distance*1000.0]
-    for pt in sample_pts:
-      profile.append(self.Elevation(pt[0], pt[1]))
+    profile = [len(pts)-1, distance*1000.0]
+    profile.extend(self.ElevationBatch(pts[:, 0], pts[:, 1],
+                                       resolution, bound).tolist())
 
     return profile
-    
+
+  # Returns a 2-D array of terrain elevations along radials from (lat, lng),
+  # one row per azimuth (degrees) and one column per range sample. The range
+  # samples run from 0 to max_dist (meters) evenly spaced no more than
+  # spacing meters apart, as returned by RadialRanges. All sample points are
+  # placed with one vectorized geodesic solve and their elevations looked up
+  # with ElevationBatch, to which resolution and bound are passed.
+  # Use RadialProfile to extract the ITS format profile to any range sample.
+  def RadialProfiles(self, lat, lng, azimuths, max_dist, spacing=30.0,
+                     resolution=1, bound=None):
+    azimuths = numpy.asarray(azimuths, dtype=numpy.float64).reshape(-1, 1)
+    ranges = RadialRanges(max_dist, spacing)
+    lats, lngs, az = vincenty.to_dist_bear_vincenty_array(
+        lat, lng, ranges.reshape(1, -1) / 1000.0, azimuths)
+    return self.ElevationBatch(lats, lngs, resolution, bound)
+
+# Returns the range samples (meters) used by NedIndexer.RadialProfiles: the
+# fewest evenly spaced samples from 0 to max_dist no more than spacing apart.
+def RadialRanges(max_dist, spacing=30.0):
+  n = max(int(math.ceil(max_dist / spacing)), 1)
+  return numpy.linspace(0, max_dist, n + 1)
+
+# Returns the profile, in the format of NedIndexer.Profile, from the
+# transmitter out to range sample index range_index along radial
+# azimuth_index of the array returned by RadialProfiles with the given
+# max_dist and spacing.
+def RadialProfile(radials, max_dist, azimuth_index, range_index, spacing=30.0):
+  ranges = RadialRanges(max_dist, spacing)
+  profile = [range_index, ranges[1]]
+  profile.extend(radials[azimuth_index, :range_index + 1].tolist())
+  return profile
+
 # If run directly, takes command line arguments for lat and lng and prints elevation.
 # If given four arguments, prints the profile between the given points.
 if __name__ == '__main__':
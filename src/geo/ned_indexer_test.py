@@ -0,0 +1,196 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import math
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+import gridfloat
+import ned_indexer
+import vincenty
+
+# Synthetic degree tiles: 22x22 samples 0.05 degrees apart, offset by half a
+# sample like the NED tiles so each overlaps its neighbors. The samples are
+# taken from one terrain surface so the overlaps agree, as they do in NED.
+CELLSIZE = 0.05
+SIZE = 22
+HEADER = """ncols         %d
+nrows         %d
+xllcorner     %.3f
+yllcorner     %.3f
+cellsize      %.2f
+NODATA_value  -9999
+byteorder     LSBFIRST
+"""
+
+# The synthetic terrain elevation at the given lat and lng arrays.
+def Terrain(lats, lngs):
+  return 2000.0 + 500.0 * numpy.sin(13.0 * lats) * numpy.cos(11.0 * lngs)
+
+# Returns the elevation at (lat, lng) interpolated bilinearly, one point at a
+# time, from the samples of a tile whose upper left corner is (uly, ulx).
+def BilinearReference(data, uly, ulx, lat, lng):
+  y = (uly - lat) / CELLSIZE
+  x = (lng - ulx) / CELLSIZE
+  r = int(math.floor(y))
+  c = int(math.floor(x))
+  fy = y - r
+  fx = x - c
+  return ((1 - fy) * (1 - fx) * data[r, c] + (1 - fy) * fx * data[r, c + 1] +
+          fy * (1 - fx) * data[r + 1, c] + fy * fx * data[r + 1, c + 1])
+
+class TestNedIndexer(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    # (north edge, west edge) of each degree tile and its samples.
+    self.tiles = {}
+    steps = numpy.arange(SIZE) * CELLSIZE
+    for lat, lng in [(40, -106), (40, -105)]:
+      lats = lat + CELLSIZE / 2 - steps.reshape(-1, 1)
+      lngs = lng - CELLSIZE / 2 + steps.reshape(1, -1)
+      data = Terrain(lats, lngs).astype(numpy.float32)
+      self.WriteTile(lat, lng, data)
+      self.tiles[(lat, lng)] = data
+    self.indx = ned_indexer.NedIndexer(self.dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def WriteTile(self, lat, lng, data):
+    flt = os.path.join(self.dir, 'usgs_ned_1_n%dw%d_gridfloat.flt' %
+                       (lat, -lng))
+    with open(gridfloat.HeaderFilename(flt), 'w') as f:
+      f.write(HEADER % (SIZE, SIZE, lng - CELLSIZE / 2,
+                        lat - 1 - 1.5 * CELLSIZE, CELLSIZE))
+    data.astype('<f4').tofile(flt)
+
+  def Reference(self, lat, lng):
+    lat0 = int(math.ceil(lat))
+    lng0 = int(math.floor(lng))
+    return BilinearReference(self.tiles[(lat0, lng0)],
+                             lat0 + CELLSIZE / 2, lng0 - CELLSIZE / 2,
+                             lat, lng)
+
+  def test_batch_matches_reference(self):
+    rng = numpy.random.RandomState(1)
+    lats = rng.uniform(39.01, 39.99, 200)
+    lngs = rng.uniform(-105.99, -105.01, 200)
+    elev = self.indx.ElevationBatch(lats, lngs)
+    self.assertEquals((200,), elev.shape)
+    for i in range(len(lats)):
+      self.assertAlmostEqual(self.Reference(lats[i], lngs[i]), elev[i],
+                             places=3)
+
+  def test_batch_matches_elevation(self):
+    lats = [39.2, 39.5, 39.123, 39.975]
+    lngs = [-105.7, -105.5, -104.321, -104.025]
+    elev = self.indx.ElevationBatch(lats, lngs)
+    for i in range(len(lats)):
+      self.assertEquals(self.indx.Elevation(lats[i], lngs[i]), elev[i])
+
+  def test_sample_points(self):
+    # The sample of each pixel is placed at its upper left corner, where the
+    # interpolation is the sample itself.
+    data = self.tiles[(40, -106)]
+    elev = self.indx.ElevationBatch([39.525, 39.975], [-105.525, -105.975])
+    self.assertAlmostEqual(data[10, 10], elev[0], places=3)
+    self.assertAlmostEqual(data[1, 1], elev[1], places=3)
+
+  def test_batch_spans_tiles(self):
+    # Interleaved points from both tiles, in a 2-D array, are grouped by tile
+    # and returned in their original positions.
+    lats = numpy.array([[39.3, 39.6, 39.9], [39.1, 39.45, 39.8]])
+    lngs = numpy.array([[-105.2, -104.3, -105.9], [-104.8, -105.05, -104.01]])
+    elev = self.indx.ElevationBatch(lats, lngs)
+    self.assertEquals((2, 3), elev.shape)
+    for i in range(2):
+      for j in range(3):
+        self.assertAlmostEqual(self.Reference(lats[i, j], lngs[i, j]),
+                               elev[i, j], places=3)
+    self.assertEquals(2, len(self.indx.tile_cache))
+
+  def test_full_resolution_bounds(self):
+    # The bounds are the extremes of the four samples around each point,
+    # taken without building a pyramid level.
+    data = self.tiles[(40, -106)]
+    lats = [39.5, 39.123, 39.96]
+    lngs = [-105.5, -105.321, -105.99]
+    hi = self.indx.ElevationBatch(lats, lngs,
+                                  bound=ned_indexer.terrain_pyramid.BOUND_MAX)
+    lo = self.indx.ElevationBatch(lats, lngs,
+                                  bound=ned_indexer.terrain_pyramid.BOUND_MIN)
+    for i in range(len(lats)):
+      r = int(math.floor((40 + CELLSIZE / 2 - lats[i]) / CELLSIZE))
+      c = int(math.floor((lngs[i] + 106 + CELLSIZE / 2) / CELLSIZE))
+      corners = data[r:r + 2, c:c + 2]
+      self.assertEquals(corners.max(), hi[i])
+      self.assertEquals(corners.min(), lo[i])
+    self.assertEquals(1, len(self.indx.tile_cache))
+    self.assertRaises(Exception, self.indx.ElevationBatch, lats, lngs,
+                      bound='mean')
+
+  def test_empty_batch(self):
+    self.assertEquals(0, len(self.indx.ElevationBatch([], [])))
+
+  def test_no_tile(self):
+    self.assertRaises(KeyError, self.indx.Elevation, 45.5, -105.5)
+    self.assertRaises(KeyError, self.indx.ElevationBatch,
+                      [39.5, 45.5], [-105.5, -105.5])
+
+  def test_radial_ranges(self):
+    ranges = ned_indexer.RadialRanges(20000.0)
+    self.assertEquals(668, len(ranges))
+    self.assertEquals(0.0, ranges[0])
+    self.assertEquals(20000.0, ranges[-1])
+    self.assertTrue(numpy.allclose(numpy.diff(ranges), 20000.0 / 667))
+    self.assertTrue(ranges[1] <= 30.0)
+    self.assertEquals([0.0, 90.0, 180.0],
+                      ned_indexer.RadialRanges(180.0, 90.0).tolist())
+    self.assertEquals([0.0, 10.0], ned_indexer.RadialRanges(10.0).tolist())
+
+  def test_radial_profiles_match_profile(self):
+    # Each radial holds the elevations of Profile out to the end of the
+    # radial, sampled at the same waypoints. The radials cross both tiles.
+    lat, lng = 39.5, -105.0
+    azimuths = [0.0, 45.0, 100.0, 200.0, 290.0]
+    radials = self.indx.RadialProfiles(lat, lng, azimuths, 20000.0)
+    self.assertEquals((5, 668), radials.shape)
+    for i, az in enumerate(azimuths):
+      lat2, lng2, _ = vincenty.to_dist_bear_vincenty(lat, lng, 20.0, az)
+      profile = self.indx.Profile(lat, lng, lat2, lng2)
+      self.assertEquals(667, profile[0])
+      self.assertTrue(numpy.allclose(profile[2:], radials[i], atol=1e-6))
+
+  def test_radial_profile(self):
+    lat, lng = 39.5, -105.0
+    radials = self.indx.RadialProfiles(lat, lng, [30.0, 250.0], 20000.0)
+    ranges = ned_indexer.RadialRanges(20000.0)
+    profile = ned_indexer.RadialProfile(radials, 20000.0, 1, 100)
+    # ITM layout: [number of steps, step in meters, elevations...]
+    self.assertEquals(100, profile[0])
+    self.assertEquals(ranges[1], profile[1])
+    self.assertEquals(101, len(profile[2:]))
+    self.assertEquals(radials[1, :101].tolist(), profile[2:])
+    # The same as Profile out to the 100th range sample.
+    lat2, lng2, _ = vincenty.to_dist_bear_vincenty(lat, lng,
+                                                   ranges[100] / 1000.0, 250.0)
+    expected = self.indx.Profile(lat, lng, lat2, lng2)
+    self.assertEquals(expected[0], profile[0])
+    self.assertAlmostEqual(expected[1], profile[1], places=6)
+    self.assertTrue(numpy.allclose(expected[2:], profile[2:], atol=1e-6))
+
+if __name__ == '__main__':
+  unittest.main()
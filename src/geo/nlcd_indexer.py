@@ -12,25 +12,79 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import collections
 import gdal
+import json
 import math
 import numpy
 import osr
 import os
 import osgeo.gdal
 import sys
-import time
+import threading
 
 import land_use
+import tile_cache
+import tile_index
+
+# Name of the file, in the NLCD directory, which persists the metadata of the
+# tiles so that the indexer can start without opening every tile.
+INDEX_FILENAME = 'nlcd_tiles.json'
+
+# Default size (pixels) of the square windows in which NLCD tiles are read.
+DEFAULT_BLOCK_SIZE = 256
+
+# Number of tile files kept open for reading windows.
+MAX_OPEN_DATASETS = 16
+
+# Returns the metadata NlcdTileInfo needs from a tile file: its geo
+# transform, projection and raster size.
+def ReadTileMetadata(filename):
+  ds = gdal.Open(filename)
+  metadata = {
+    'txf': list(ds.GetGeoTransform()),
+    'projection': ds.GetProjection(),
+    'width': ds.RasterXSize,
+    'height': ds.RasterYSize,
+  }
+  # Close file
+  ds = None
+  return metadata
+
+# Returns the dict of tile metadata saved by SaveTileIndex, keyed by the
+# tile filename relative to the NLCD directory, or an empty dict if there is
+# no readable index.
+def LoadTileIndex(index_filename):
+  if not os.path.exists(index_filename):
+    return {}
+  try:
+    with open(index_filename, 'r') as f:
+      return json.load(f)
+  except (IOError, ValueError), err:
+    print 'Ignoring unreadable NLCD tile index %s: %s' % (index_filename, err)
+    return {}
+
+# Saves the dict of tile metadata. Failure to write (for instance to a
+# read-only data directory) is reported but not fatal.
+def SaveTileIndex(index_filename, metadata):
+  tmp_filename = '%s.%d.tmp' % (index_filename, os.getpid())
+  try:
+    with open(tmp_filename, 'w') as f:
+      json.dump(metadata, f, indent=1, sort_keys=True)
+    os.rename(tmp_filename, index_filename)
+  except (IOError, OSError), err:
+    print 'Could not save NLCD tile index %s: %s' % (index_filename, err)
 
 # This class contains metadata about a particular tile and can be used to quickly
-# determine whether a lat/lng coordinate is within the tile.
+# determine whether a lat/lng coordinate is within the tile. The metadata is
+# read from the file unless given, as returned by ReadTileMetadata.
 class NlcdTileInfo:
-  def __init__(self, filename):
+  def __init__(self, filename, metadata=None):
     self.filename = filename
 
-    ds = gdal.Open(filename)
-    self.txf = ds.GetGeoTransform()
+    if metadata is None:
+      metadata = ReadTileMetadata(filename)
+    self.txf = tuple(metadata['txf'])
     
     # Handles difference in return from gdal.InvGeoTransform between gdal version 1 and 2
     gdal_version = osgeo.gdal.__version__
@@ -42,9 +96,9 @@ class NlcdTileInfo:
     wgs84_ref = osr.SpatialReference()
     wgs84_ref.ImportFromEPSG(4326)
     sref = osr.SpatialReference()
-    sref.ImportFromWkt(ds.GetProjection())
-    self.width = ds.RasterXSize
-    self.height = ds.RasterYSize
+    sref.ImportFromWkt(str(metadata['projection']))
+    self.width = metadata['width']
+    self.height = metadata['height']
 
     self.transform = osr.CoordinateTransformation(wgs84_ref, sref)
     self.inv_transform = osr.CoordinateTransformation(sref, wgs84_ref)
@@ -53,14 +107,14 @@ class NlcdTileInfo:
     self.coord_bounds = [
       self.txf[0],     # upper left x
       self.txf[3],     # upper left y
-      self.txf[0] + self.txf[1] * ds.RasterXSize + self.txf[2] * ds.RasterYSize,  # lower right x
-      self.txf[3] + self.txf[4] * ds.RasterXSize + self.txf[5] * ds.RasterYSize   # lower right y
+      self.txf[0] + self.txf[1] * self.width + self.txf[2] * self.height,  # lower right x
+      self.txf[3] + self.txf[4] * self.width + self.txf[5] * self.height   # lower right y
     ]
 
     # Find the corners of the tile for examining lat/lng to find intersection with tile.
     corners = []
-    for x in [0, ds.RasterXSize]:
-      for y in [0, ds.RasterYSize]:
+    for x in [0, self.width]:
+      for y in [0, self.height]:
         corners.append([self.txf[0] + self.txf[1] * x + self.txf[2] * y,
                         self.txf[3] + self.txf[4] * x + self.txf[5] * y])
 
@@ -80,9 +134,6 @@ class NlcdTileInfo:
       if p[1] < self.min_lat:
         self.min_lat = p[1]
 
-    # Close file
-    ds = None
-
   def WithinTile(self, lat, lng):
     #if abs(lng - self.max_lng) < 2 and abs(lat - self.max_lat) < 2:
     #  print 'Compare %f %f to %f %f' % (lat, lng, self.min_lat, self.min_lng)
@@ -121,82 +172,266 @@ class NlcdTileInfo:
       
     return [x, y]
 
+  # Returns arrays of the (x, y) index coordinates of the given arrays of
+  # lats and lngs, as IndexCoords, with all points projected by a single
+  # bulk transform.
+  def IndexCoordsBatch(self, lats, lngs):
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    if lats.size == 0:
+      return numpy.zeros(lats.shape), numpy.zeros(lats.shape)
+    coords = numpy.array(self.transform.TransformPoints(
+        numpy.column_stack((lngs.ravel(), lats.ravel())).tolist()))
+    cx = coords[:, 0].reshape(lats.shape)
+    cy = coords[:, 1].reshape(lats.shape)
+    x = self.inv_txf[0] + self.inv_txf[1] * cx + self.inv_txf[2] * cy
+    y = self.inv_txf[3] + self.inv_txf[4] * cx + self.inv_txf[5] * cy
+    return x, y
+
 class NlcdIndexer:
-  def __init__(self, directory, lru_size=10):
+  def __init__(self, directory,
+               cache_bytes=tile_cache.DEFAULT_CACHE_BYTES,
+               cache=None, shared=None, block_size=DEFAULT_BLOCK_SIZE):
     print 'init NLCD indexer for %s' % directory
     self.directory = directory
+    # Optional shared_tiles.SharedTileStore through which tile data is shared
+    # between worker processes.
+    self.shared = shared
+    # Tiles are read in block_size x block_size windows, so that memory
+    # scales with the area looked up rather than the tile size. If
+    # block_size is None, whole tiles are read.
+    self.block_size = block_size
+    # Open GDAL datasets from which windows are read, least recently used
+    # first. GDAL datasets may not be read from several threads at once, so
+    # reads hold dataset_lock.
+    self.datasets = collections.OrderedDict()
+    self.dataset_lock = threading.Lock()
     files = os.listdir(self.directory)
     files.sort()
-    self.nlcd_file = {}
+    tile_filenames = []
     for f in files:
       filename = os.path.join(directory, f)
       if f.endswith('.img'):
         # skip the AK file if present -- contents are split into a *_tiles directory
         if f.startswith('ak_nlcd_2011'):
           continue
-        self.nlcd_file[filename] = NlcdTileInfo(filename)
+        tile_filenames.append(filename)
       if f.endswith('_tiles') and os.path.isdir(filename):
         tilepath = os.path.join(directory, f)
         tile_files = os.listdir(tilepath)
+        tile_files.sort()
         for ft in tile_files:
           if ft.endswith('.img'):
-            filename = os.path.join(tilepath, ft)
-            self.nlcd_file[filename] = NlcdTileInfo(filename)
+            tile_filenames.append(os.path.join(tilepath, ft))
 
-    # tile_cache holds maps of NlcdTileInfo to numpy arrays with data for that tile
-    self.tile_cache = {}
-    self.tile_lru = {}
-    self.tile_lru_size = lru_size
+    # Tile metadata is taken from the persisted index when the tile file is
+    # unchanged, and read from the file (and the index updated) otherwise.
+    self.index_filename = os.path.join(directory, INDEX_FILENAME)
+    saved = LoadTileIndex(self.index_filename)
+    metadata = {}
+    self.nlcd_file = {}
+    # tile_index maps a lat/lng to the few tiles whose bounds may contain it.
+    self.tile_index = tile_index.TileGridIndex()
+    for filename in tile_filenames:
+      name = os.path.relpath(filename, directory)
+      stat = os.stat(filename)
+      entry = saved.get(name)
+      if (entry is None or entry.get('mtime') != stat.st_mtime or
+          entry.get('size') != stat.st_size):
+        entry = ReadTileMetadata(filename)
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+      metadata[name] = entry
+      t = NlcdTileInfo(filename, entry)
+      self.nlcd_file[filename] = t
+      self.tile_index.Add(t, t.min_lat, t.max_lat, t.min_lng, t.max_lng)
+    if metadata != saved:
+      SaveTileIndex(self.index_filename, metadata)
 
-  def LoadTileForLatLng(self, lat, lng):
-    for t in self.tile_cache:
-      if t.WithinTile(lat, lng):
-        return
+    # tile_cache holds maps of NlcdTileInfo to numpy arrays with data for that
+    # tile, and of (NlcdTileInfo, block row, block column) to numpy arrays
+    # with data for a window of the tile. A cache may be passed in to share
+    # one memory budget between several indexers.
+    if cache is None:
+      cache = tile_cache.TileCache(cache_bytes)
+    self.tile_cache = cache
 
-    #print 'Searching tiles...'
-    for fn in self.nlcd_file:
-      t = self.nlcd_file[fn]
+  # Returns the NlcdTileInfo of the tile which includes the lat/lng provided.
+  # Only the tiles the grid index gives as candidates are tested; where tiles
+  # overlap, one which is already in use is preferred.
+  def FindTileForLatLng(self, lat, lng):
+    candidates = self._Candidates(lat, lng)
+    for t in candidates:
       if t.WithinTile(lat, lng):
-        #print 'Found within tile %s' % fn
-        dataset = gdal.Open(fn)
-        self.tile_cache[t] = dataset.ReadAsArray().astype(numpy.byte)
-        self.tile_lru[t] = time.clock()
-
-        if len(self.tile_lru) > self.tile_lru_size:
-          mint = 0
-          mink = ''
-          for k in self.tile_lru.keys():
-            if self.tile_lru[k] > mint:
-              mint = self.tile_lru[k]
-              mink = k
-          print 'Evicting tile %s' % k.filename
-          del self.tile_cache[k]
-          del self.tile_lru[k]
-
-        # close the file
-        dataset = None
-        return
+        #print 'Found within tile %s' % t.filename
+        return t
 
     raise Exception('No tile found for lat lng %f %f' % (lat, lng))
 
+  # Returns the grid index candidates for the lat/lng, those in use first.
+  def _Candidates(self, lat, lng):
+    candidates = self.tile_index.Candidates(lat, lng)
+    return ([t for t in candidates if self._InUse(t)] +
+            [t for t in candidates if not self._InUse(t)])
+
+  def _InUse(self, t):
+    return t in self.tile_cache or t in self.datasets
+
+  # Returns the NlcdTileInfo and whole data array of the tile which includes
+  # the lat/lng provided, loading the tile if needed. The tile cache evicts
+  # least-recently-used tiles as needed to remain under its memory budget.
+  def LoadTileForLatLng(self, lat, lng):
+    t = self.FindTileForLatLng(lat, lng)
+    return t, self.tile_cache.GetOrLoad(t, lambda: self._LoadTile(t),
+                                        self._ReleaseTile)
+
+  # Loads a pinned copy of the tile which includes the lat/lng provided. The
+  # tile stays in memory regardless of the cache budget.
+  def PinTileForLatLng(self, lat, lng):
+    t, a = self.LoadTileForLatLng(lat, lng)
+    self.tile_cache.Pin(t)
+
+  def _LoadTile(self, t):
+    if self.shared is not None:
+      a = self.shared.Attach(t.filename, lambda: self._ReadTile(t))
+    else:
+      a = self._ReadTile(t)
+    return a, a.nbytes
+
+  def _ReadTile(self, t):
+    dataset = gdal.Open(t.filename)
+    a = dataset.ReadAsArray().astype(numpy.byte)
+    # close the file
+    dataset = None
+    return a
+
+  def _ReleaseTile(self, k, a):
+    if self.shared is not None:
+      self.shared.Detach(self._SharedKey(k))
+
+  # Returns the key under which a whole tile, or a (tile, block row, block
+  # column) window, is shared.
+  def _SharedKey(self, k):
+    if isinstance(k, tuple):
+      return '%s.%d.%d' % (k[0].filename, k[1], k[2])
+    return k.filename
+
+  # Returns the codes at the given arrays of row and column indices of tile
+  # t. A whole copy of the tile is used if it is cached (for instance because
+  # it was pinned); otherwise, unless whole tiles are read, only the windows
+  # containing the pixels are read.
+  def _Values(self, t, rows, cols):
+    if not self.block_size or t in self.tile_cache:
+      a = self.tile_cache.GetOrLoad(t, lambda: self._LoadTile(t),
+                                    self._ReleaseTile)
+      return a[rows, cols]
+
+    bs = self.block_size
+    nbcols = (t.width + bs - 1) // bs
+    values = numpy.zeros(rows.shape, dtype=numpy.byte)
+    block_ids, block_index = numpy.unique((rows // bs) * nbcols + cols // bs,
+                                          return_inverse=True)
+    for i in range(len(block_ids)):
+      brow, bcol = divmod(int(block_ids[i]), nbcols)
+      k = (t, brow, bcol)
+      block = self.tile_cache.GetOrLoad(k, lambda: self._LoadBlock(k),
+                                        self._ReleaseTile)
+      sel = (block_index == i)
+      values[sel] = block[rows[sel] - brow * bs, cols[sel] - bcol * bs]
+    return values
+
+  def _LoadBlock(self, k):
+    if self.shared is not None:
+      a = self.shared.Attach(self._SharedKey(k), lambda: self._ReadBlock(k))
+    else:
+      a = self._ReadBlock(k)
+    return a, a.nbytes
+
+  # Reads the window for the (tile, block row, block column) key. Windows on
+  # the right and bottom edges of the tile may be smaller than block_size.
+  def _ReadBlock(self, k):
+    t, brow, bcol = k
+    bs = self.block_size
+    xoff = bcol * bs
+    yoff = brow * bs
+    with self.dataset_lock:
+      dataset = self.datasets.pop(t, None)
+      if dataset is None:
+        dataset = gdal.Open(t.filename)
+      self.datasets[t] = dataset
+      while len(self.datasets) > MAX_OPEN_DATASETS:
+        self.datasets.popitem(last=False)
+      return dataset.ReadAsArray(xoff, yoff, min(bs, t.width - xoff),
+                                 min(bs, t.height - yoff)).astype(numpy.byte)
+
   def NlcdCode(self, lat, lng):
     #print 'Code for %f, %f' % (lat, lng)
-    self.LoadTileForLatLng(lat, lng)
-    for t in self.tile_cache:
-      if t.WithinTile(lat, lng):
-        # print 'Found in tile %s' % t.filename
-        index = t.IndexCoords(lat, lng)
-        a = self.tile_cache[t]
-        self.tile_lru[t] = time.clock()
+    t = self.FindTileForLatLng(lat, lng)
+    # print 'Found in tile %s' % t.filename
+    index = t.IndexCoords(lat, lng)
+
+    # Points on the far edge of the tile take the edge pixel.
+    iln = min(int(round(index[1])), t.height - 1)
+    ipx = min(int(round(index[0])), t.width - 1)
+    #print 'iln=', iln
+    #print 'ipx=', ipx
+
+    return self._Values(t, numpy.array([iln]), numpy.array([ipx]))[0]
+
+  # Returns a numpy array of the NLCD codes at the given arrays of lats and
+  # lngs, with the same tile selection and rounding as NlcdCode. Points are
+  # grouped by grid index cell; each candidate tile projects the points not
+  # yet placed with one bulk transform, and the codes are gathered from the
+  # tile array with fancy indexing. Points in no tile are given the code
+  # missing if it is not None; otherwise an Exception is raised.
+  def NlcdCodeBatch(self, lats, lngs, missing=None):
+    shape = numpy.shape(lats)
+    lats = numpy.asarray(lats, dtype=numpy.float64).ravel()
+    lngs = numpy.asarray(lngs, dtype=numpy.float64).ravel()
+    codes = numpy.zeros(lats.shape, dtype=numpy.byte)
+    if lats.size == 0:
+      return codes.reshape(shape)
+
+    cell = self.tile_index.cell_degrees
+    cell_ids, cell_index = numpy.unique(
+        numpy.column_stack((numpy.floor(lats / cell), numpy.floor(lngs / cell))),
+        axis=0, return_inverse=True)
+
+    for i in range(len(cell_ids)):
+      remaining = numpy.nonzero(cell_index == i)[0]
+      for t in self._Candidates(lats[remaining[0]], lngs[remaining[0]]):
+        if remaining.size == 0:
+          break
+        lat = lats[remaining]
+        lng = lngs[remaining]
+        inside = ((lng <= t.max_lng) & (lng >= t.min_lng) &
+                  (lat <= t.max_lat) & (lat >= t.min_lat))
+        if not inside.any():
+          continue
+        x, y = t.IndexCoordsBatch(lat[inside], lng[inside])
+        within = (x >= 0) & (x <= float(t.width)) & (y >= 0) & (y <= float(t.height))
+        sel = remaining[inside][within]
+        if sel.size == 0:
+          continue
+
+        # round() as in NlcdCode; index coordinates within a tile are not
+        # negative, so this is floor(v + 0.5). Points on the far edge of the
+        # tile take the edge pixel.
+        iln = numpy.minimum(numpy.floor(y[within] + 0.5).astype(int), t.height - 1)
+        ipx = numpy.minimum(numpy.floor(x[within] + 0.5).astype(int), t.width - 1)
+        codes[sel] = self._Values(t, iln, ipx)
 
-        iln = round(index[1])
-        ipx = round(index[0])
-        #print 'iln=', iln
-        #print 'ipx=', ipx
+        placed = numpy.zeros(remaining.shape, dtype=bool)
+        placed[numpy.nonzero(inside)[0][within]] = True
+        remaining = remaining[~placed]
 
-        return a[iln][ipx]
+      if remaining.size and missing is not None:
+        codes[remaining] = missing
+      elif remaining.size:
+        raise Exception('No tile found for lat lng %f %f' %
+                        (lats[remaining[0]], lngs[remaining[0]]))
 
-    raise Exception('No NLCD data for lat lng %f, %f' % (lat, lng))
+    return codes.reshape(shape)
 
 # If run directly, takes command line lat lng arguments and prints the NLCD code.
 if __name__ == '__main__':
@@ -0,0 +1,413 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import json
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+import nlcd_indexer
+
+# Stands in for the gdal module, serving in-memory rasters and recording the
+# files opened and the windows read. Rasters are keyed by filename; those
+# given a geo transform in txfs also serve the tile metadata.
+class FakeGdal:
+  def __init__(self, rasters, txfs=None):
+    self.rasters = rasters
+    self.txfs = txfs or {}
+    self.opened = []
+    self.reads = []
+
+  def Open(self, filename):
+    self.opened.append(filename)
+    return FakeDataset(self, filename)
+
+  def InvGeoTransform(self, txf):
+    m = numpy.array([[txf[1], txf[2], txf[0]],
+                     [txf[4], txf[5], txf[3]],
+                     [0.0, 0.0, 1.0]])
+    inv = numpy.linalg.inv(m)
+    return (inv[0, 2], inv[0, 0], inv[0, 1], inv[1, 2], inv[1, 0], inv[1, 1])
+
+class FakeDataset:
+  def __init__(self, gdal, filename):
+    self.gdal = gdal
+    self.filename = filename
+    data = gdal.rasters.get(filename)
+    if data is not None:
+      self.RasterYSize, self.RasterXSize = data.shape
+
+  def GetGeoTransform(self):
+    return self.gdal.txfs[self.filename]
+
+  def GetProjection(self):
+    return PROJECTION
+
+  def ReadAsArray(self, xoff=0, yoff=0, xsize=None, ysize=None):
+    data = self.gdal.rasters[self.filename]
+    if xsize is None:
+      xsize = data.shape[1] - xoff
+    if ysize is None:
+      ysize = data.shape[0] - yoff
+    self.gdal.reads.append((self.filename, xoff, yoff, xsize, ysize))
+    return data[yoff:yoff + ysize, xoff:xoff + xsize].copy()
+
+# Stands in for the osr module with a projection whose coordinates are lng
+# and lat in units of 1/SCALE degree, so that tile edges are exact.
+SCALE = 1024.0
+PROJECTION = 'PROJCS["scaled degrees"]'
+
+class FakeSpatialReference:
+  def ImportFromEPSG(self, code):
+    self.geographic = True
+
+  def ImportFromWkt(self, wkt):
+    assert wkt == PROJECTION
+    self.geographic = False
+
+class FakeCoordinateTransformation:
+  def __init__(self, src, dst):
+    self.scale = SCALE if src.geographic else 1 / SCALE
+
+  def TransformPoint(self, x, y):
+    return (x * self.scale, y * self.scale, 0.0)
+
+  def TransformPoints(self, points):
+    return [self.TransformPoint(x, y) for x, y in points]
+
+class FakeOsr:
+  SpatialReference = FakeSpatialReference
+  CoordinateTransformation = FakeCoordinateTransformation
+
+# Returns the geo transform of a tile of the fake projection, 1/SCALE degree
+# per pixel, with its upper left corner at lat, lng.
+def GeoTransform(lat, lng):
+  return [lng * SCALE, 1.0, 0.0, lat * SCALE, 0.0, -1.0]
+
+# The west edge of a 700 pixel wide tile east of one at lng -100.
+WEST_B = -100.0 + 700 / SCALE
+
+# The parts of NlcdTileInfo used to read tile data.
+class FakeTile:
+  def __init__(self, filename, width, height):
+    self.filename = filename
+    self.width = width
+    self.height = height
+
+class TestNlcdIndexerReads(unittest.TestCase):
+  def setUp(self):
+    rng = numpy.random.RandomState(9)
+    self.tiles = {}
+    rasters = {}
+    for name in ('a.img', 'b.img', 'c.img'):
+      codes = rng.choice([11, 21, 41, 82], (600, 700))
+      rasters[name] = codes.astype(numpy.uint8)
+      self.tiles[name] = FakeTile(name, 700, 600)
+    self.gdal = FakeGdal(rasters)
+    self.real_gdal = nlcd_indexer.gdal
+    nlcd_indexer.gdal = self.gdal
+    self.max_open_datasets = nlcd_indexer.MAX_OPEN_DATASETS
+    # An indexer with no tiles of its own, which is given tiles directly.
+    self.directory = tempfile.mkdtemp()
+    self.indexer = nlcd_indexer.NlcdIndexer(self.directory, block_size=256)
+
+  def tearDown(self):
+    nlcd_indexer.gdal = self.real_gdal
+    nlcd_indexer.MAX_OPEN_DATASETS = self.max_open_datasets
+    shutil.rmtree(self.directory)
+
+  def test_windowed_values(self):
+    t = self.tiles['a.img']
+    data = self.gdal.rasters['a.img']
+    rng = numpy.random.RandomState(1)
+    rows = rng.randint(0, 600, 500)
+    cols = rng.randint(0, 700, 500)
+    values = self.indexer._Values(t, rows, cols)
+    self.assertEquals(data[rows, cols].tolist(), values.tolist())
+    # The windows on the right and bottom edges are cut to the tile.
+    reads = sorted(self.gdal.reads)
+    self.assertEquals(9, len(reads))
+    self.assertTrue(('a.img', 512, 512, 188, 88) in reads)
+    self.assertTrue(('a.img', 0, 512, 256, 88) in reads)
+    self.assertTrue(('a.img', 512, 0, 188, 256) in reads)
+    # The windows are cached and the dataset stays open.
+    self.indexer._Values(t, rows, cols)
+    self.assertEquals(9, len(self.gdal.reads))
+    self.assertEquals(['a.img'], self.gdal.opened)
+
+  def test_edge_window(self):
+    t = self.tiles['a.img']
+    data = self.gdal.rasters['a.img']
+    rows = numpy.array([599, 512, 599])
+    cols = numpy.array([699, 512, 600])
+    self.assertEquals(data[rows, cols].tolist(),
+                      self.indexer._Values(t, rows, cols).tolist())
+    self.assertEquals([('a.img', 512, 512, 188, 88)], self.gdal.reads)
+    block = self.indexer.tile_cache.Get((t, 2, 2))
+    self.assertEquals((88, 188), block.shape)
+
+  def test_open_dataset_lru(self):
+    nlcd_indexer.MAX_OPEN_DATASETS = 2
+    row = numpy.array([0])
+    for name, col in (('a.img', 0), ('b.img', 0), ('a.img', 300),
+                      ('c.img', 0)):
+      self.indexer._Values(self.tiles[name], row, numpy.array([col]))
+    # a.img was read more recently than b.img, so b.img was closed.
+    self.assertEquals(['a.img', 'c.img'],
+                      [t.filename for t in self.indexer.datasets])
+    self.assertEquals(['a.img', 'b.img', 'c.img'], self.gdal.opened)
+    self.indexer._Values(self.tiles['b.img'], row, numpy.array([300]))
+    self.assertEquals(['a.img', 'b.img', 'c.img', 'b.img'], self.gdal.opened)
+    self.assertEquals(['c.img', 'b.img'],
+                      [t.filename for t in self.indexer.datasets])
+
+  def test_pinned_tile(self):
+    t = self.tiles['a.img']
+    data = self.gdal.rasters['a.img']
+    cache = self.indexer.tile_cache
+    cache.GetOrLoad(t, lambda: self.indexer._LoadTile(t))
+    cache.Pin(t)
+    self.assertEquals([('a.img', 0, 0, 700, 600)], self.gdal.reads)
+    rows = numpy.array([0, 300, 599])
+    cols = numpy.array([0, 650, 699])
+    # Values come from the pinned copy without reading windows.
+    self.assertEquals(data[rows, cols].tolist(),
+                      self.indexer._Values(t, rows, cols).tolist())
+    self.assertEquals(1, len(self.gdal.reads))
+
+  def test_whole_tiles(self):
+    indexer = nlcd_indexer.NlcdIndexer(self.directory, block_size=None)
+    t = self.tiles['b.img']
+    data = self.gdal.rasters['b.img']
+    rows = numpy.array([5, 580])
+    cols = numpy.array([690, 3])
+    self.assertEquals(data[rows, cols].tolist(),
+                      indexer._Values(t, rows, cols).tolist())
+    self.assertEquals([('b.img', 0, 0, 700, 600)], self.gdal.reads)
+
+class TestNlcdCodeBatch(unittest.TestCase):
+  def setUp(self):
+    rng = numpy.random.RandomState(3)
+    # Two 700x600 pixel tiles side by side with their upper left corners at
+    # lat 40 and lng -100 (a) and lng WEST_B (b).
+    self.data = {}
+    txfs = {}
+    for name, lng in (('a.img', -100.0), ('b.img', WEST_B)):
+      codes = rng.choice([11, 21, 41, 82], (600, 700))
+      self.data[name] = codes.astype(numpy.uint8)
+      txfs[name] = GeoTransform(40.0, lng)
+    self.gdal = FakeGdal(self.data, txfs)
+    self.real_gdal = nlcd_indexer.gdal
+    self.real_osr = nlcd_indexer.osr
+    nlcd_indexer.gdal = self.gdal
+    nlcd_indexer.osr = FakeOsr
+    self.directory = tempfile.mkdtemp()
+    self.indexer = nlcd_indexer.NlcdIndexer(self.directory)
+    for name in ('a.img', 'b.img'):
+      t = nlcd_indexer.NlcdTileInfo(name)
+      self.indexer.nlcd_file[name] = t
+      self.indexer.tile_index.Add(t, t.min_lat, t.max_lat, t.min_lng,
+                                  t.max_lng)
+
+  def tearDown(self):
+    nlcd_indexer.gdal = self.real_gdal
+    nlcd_indexer.osr = self.real_osr
+    shutil.rmtree(self.directory)
+
+  # Returns the lat and lng arrays of the given (fractional) row and column
+  # index coordinates of the tile with west edge lng.
+  def LatLngs(self, lng, rows, cols):
+    return (40.0 - numpy.asarray(rows, dtype=float) / SCALE,
+            lng + numpy.asarray(cols, dtype=float) / SCALE)
+
+  def AssertMatchesScalar(self, lats, lngs, codes):
+    for lat, lng, code in zip(lats, lngs, codes):
+      self.assertEquals(self.indexer.NlcdCode(lat, lng), code)
+
+  def test_matches_scalar(self):
+    rng = numpy.random.RandomState(1)
+    lats_a, lngs_a = self.LatLngs(-100.0, rng.uniform(0.1, 599.9, 150),
+                                  rng.uniform(0.1, 699.9, 150))
+    lats_b, lngs_b = self.LatLngs(WEST_B, rng.uniform(0.1, 599.9, 150),
+                                  rng.uniform(0.1, 699.9, 150))
+    lats = numpy.concatenate((lats_a, lats_b))
+    lngs = numpy.concatenate((lngs_a, lngs_b))
+    codes = self.indexer.NlcdCodeBatch(lats, lngs)
+    self.assertEquals((300,), codes.shape)
+    self.AssertMatchesScalar(lats, lngs, codes)
+    # Both tiles were read.
+    self.assertEquals(['a.img', 'b.img'], sorted(set(self.gdal.opened)))
+
+  def test_rounding(self):
+    # Index coordinates are rounded to the nearest pixel.
+    data = self.data['a.img']
+    lats, lngs = self.LatLngs(-100.0, [10.49, 10.51, 0.4], [20.51, 20.49, 0.6])
+    codes = self.indexer.NlcdCodeBatch(lats, lngs)
+    self.assertEquals([data[10, 21], data[11, 20], data[0, 1]],
+                      codes.tolist())
+    self.AssertMatchesScalar(lats, lngs, codes)
+
+  def test_edge_clipping(self):
+    # Points on the far edges of a tile take the edge pixels.
+    data = self.data['b.img']
+    lats, lngs = self.LatLngs(WEST_B, [600, 600, 300, 599.7],
+                              [700, 300, 700, 699.6])
+    codes = self.indexer.NlcdCodeBatch(lats, lngs)
+    self.assertEquals([data[599, 699], data[599, 300], data[300, 699],
+                       data[599, 699]], codes.tolist())
+    self.AssertMatchesScalar(lats, lngs, codes)
+
+  def test_shape(self):
+    lats, lngs = self.LatLngs(-100.0, [[100, 200], [300, 400]],
+                              [[100, 900], [500, 1300]])
+    codes = self.indexer.NlcdCodeBatch(lats, lngs)
+    self.assertEquals((2, 2), codes.shape)
+    self.AssertMatchesScalar(lats.ravel(), lngs.ravel(), codes.ravel())
+    self.assertEquals(0, len(self.indexer.NlcdCodeBatch([], [])))
+
+  def test_missing(self):
+    # The second point is north of the tiles and the fourth east of them.
+    lats, lngs = self.LatLngs(-100.0, [100, -100, 200, 300],
+                              [100, 100, 900, 1500])
+    self.assertRaises(Exception, self.indexer.NlcdCodeBatch, lats, lngs)
+    codes = self.indexer.NlcdCodeBatch(lats, lngs, missing=0)
+    self.assertEquals(0, codes[1])
+    self.assertEquals(0, codes[3])
+    self.AssertMatchesScalar([lats[0], lats[2]], [lngs[0], lngs[2]],
+                             [codes[0], codes[2]])
+
+class TestNlcdTileIndex(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.gdal = FakeGdal({}, {})
+    self.real_gdal = nlcd_indexer.gdal
+    self.real_osr = nlcd_indexer.osr
+    nlcd_indexer.gdal = self.gdal
+    nlcd_indexer.osr = FakeOsr
+    self.index_filename = os.path.join(self.directory,
+                                       nlcd_indexer.INDEX_FILENAME)
+    self.WriteTile('a.img', 40.0, -100.0)
+    self.WriteTile('b.img', 40.0, WEST_B)
+
+  def tearDown(self):
+    nlcd_indexer.gdal = self.real_gdal
+    nlcd_indexer.osr = self.real_osr
+    shutil.rmtree(self.directory)
+
+  # Writes a tile file of the given size, with a 700x600 raster whose upper
+  # left corner is at lat, lng, and returns its path.
+  def WriteTile(self, name, lat, lng, size=100):
+    filename = os.path.join(self.directory, name)
+    with open(filename, 'wb') as f:
+      f.write('\0' * size)
+    self.gdal.rasters[filename] = numpy.zeros((600, 700), dtype=numpy.uint8)
+    self.gdal.txfs[filename] = GeoTransform(lat, lng)
+    return filename
+
+  def Indexer(self):
+    del self.gdal.opened[:]
+    return nlcd_indexer.NlcdIndexer(self.directory)
+
+  def Opened(self):
+    return sorted(os.path.basename(f) for f in self.gdal.opened)
+
+  def Bounds(self, indexer):
+    return dict((os.path.basename(f), (t.min_lat, t.max_lat, t.min_lng,
+                                       t.max_lng))
+                for f, t in indexer.nlcd_file.items())
+
+  def test_index_reused(self):
+    first = self.Indexer()
+    self.assertEquals(['a.img', 'b.img'], self.Opened())
+    with open(self.index_filename) as f:
+      saved = json.load(f)
+    self.assertEquals(['a.img', 'b.img'], sorted(saved.keys()))
+    self.assertEquals(100, saved['a.img']['size'])
+    self.assertEquals(700, saved['a.img']['width'])
+    mtime = os.path.getmtime(self.index_filename)
+    # Unchanged tiles are not opened, and the index is not rewritten.
+    second = self.Indexer()
+    self.assertEquals([], self.Opened())
+    self.assertEquals(self.Bounds(first), self.Bounds(second))
+    self.assertEquals(mtime, os.path.getmtime(self.index_filename))
+
+  def test_tile_added(self):
+    self.Indexer()
+    self.WriteTile('c.img', 35.0, -90.0)
+    indexer = self.Indexer()
+    self.assertEquals(['c.img'], self.Opened())
+    self.assertEquals(3, len(nlcd_indexer.LoadTileIndex(self.index_filename)))
+    self.assertEquals(35.0, self.Bounds(indexer)['c.img'][1])
+
+  def test_tile_changed(self):
+    self.Indexer()
+    # A tile replaced by one of a different size, at a new location.
+    self.WriteTile('a.img', 38.0, -100.0, size=200)
+    indexer = self.Indexer()
+    self.assertEquals(['a.img'], self.Opened())
+    self.assertEquals(38.0, self.Bounds(indexer)['a.img'][1])
+    saved = nlcd_indexer.LoadTileIndex(self.index_filename)
+    self.assertEquals(200, saved['a.img']['size'])
+    self.assertEquals(GeoTransform(38.0, -100.0), saved['a.img']['txf'])
+    # A tile rewritten in place with the same size.
+    b = os.path.join(self.directory, 'b.img')
+    os.utime(b, (os.path.getatime(b), os.path.getmtime(b) + 10))
+    self.Indexer()
+    self.assertEquals(['b.img'], self.Opened())
+    self.Indexer()
+    self.assertEquals([], self.Opened())
+
+  def test_corrupt_index(self):
+    with open(self.index_filename, 'w') as f:
+      f.write('{"a.img": {"txf": [')
+    self.Indexer()
+    self.assertEquals(['a.img', 'b.img'], self.Opened())
+    # The index is rewritten and used from then on.
+    self.assertEquals(2, len(nlcd_indexer.LoadTileIndex(self.index_filename)))
+    self.Indexer()
+    self.assertEquals([], self.Opened())
+
+  def test_unreadable_index(self):
+    # The index can be neither read nor replaced; tiles are read each time.
+    os.mkdir(self.index_filename)
+    self.assertEquals({}, nlcd_indexer.LoadTileIndex(self.index_filename))
+    indexer = self.Indexer()
+    self.assertEquals(['a.img', 'b.img'], self.Opened())
+    self.assertEquals(2, len(indexer.nlcd_file))
+    self.Indexer()
+    self.assertEquals(['a.img', 'b.img'], self.Opened())
+    self.assertTrue(os.path.isdir(self.index_filename))
+
+  def test_candidates(self):
+    self.WriteTile('c.img', 35.0, -90.0)
+    self.Indexer()
+    # Candidates are looked up the same for tiles read from the index.
+    indexer = self.Indexer()
+    self.assertEquals([], self.Opened())
+    names = lambda lat, lng: sorted(
+        os.path.basename(t.filename)
+        for t in indexer.tile_index.Candidates(lat, lng))
+    self.assertEquals(['a.img', 'b.img'], names(39.8, -99.9))
+    self.assertEquals(['b.img'], names(39.8, -98.9))
+    self.assertEquals(['c.img'], names(34.8, -89.5))
+    self.assertEquals([], names(34.8, -95.0))
+    t = indexer.FindTileForLatLng(39.8, -99.9)
+    self.assertEquals('a.img', os.path.basename(t.filename))
+    t = indexer.FindTileForLatLng(39.8, WEST_B + 0.1)
+    self.assertEquals('b.img', os.path.basename(t.filename))
+    self.assertRaises(Exception, indexer.FindTileForLatLng, 34.8, -95.0)
+
+if __name__ == '__main__':
+  unittest.main()
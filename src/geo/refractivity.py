@@ -22,11 +22,17 @@
 #   r = refr.Refractivity(19.66, -155.55)
 #   r = refr.Refractivity(39.2, -77.1)
 #   ...
+#
+# The data file is parsed once and cached as n050.npy (see text_grid.py).
+# GetRefractivityIndexer returns an indexer shared by the whole process.
 
 import math
 import numpy
 import os
 import sys
+import threading
+
+import text_grid
 
 class RefractivityIndexer:
   def __init__(self, directory):
@@ -36,7 +42,7 @@ class RefractivityIndexer:
     self.LATSTART = 90.0 # Latitude corresponding to first row of file (deg)
     self.LONSTART = 0.0 # Longitude corresponding to first column of file (deg)
     self.DLAT = self.DLON = 1.5 # Spacing between lat/lon rows/columns (deg)
-    self.DATA = numpy.loadtxt(datafile)
+    self.DATA = text_grid.LoadGrid(datafile)
     print 'Loaded refractivity data from %s' % datafile
 
   def Refractivity(self, lat, lon):
@@ -73,12 +79,47 @@ class RefractivityIndexer:
 
     return refractivity 
 
-if __name__ == '__main__':
-  dir = os.path.dirname(os.path.realpath(__file__))
-  rootDir = os.path.dirname(os.path.dirname(dir))
-  ituDir = os.path.join(os.path.join(rootDir, 'data'), 'itu')
+  # Returns an array of the ITU refractivity at each of the given arrays of
+  # lats and lons, interpolated as in Refractivity.
+  def RefractivityBatch(self, lats, lons):
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lons = numpy.asarray(lons, dtype=numpy.float64)
+    lons = numpy.where(lons < 0.0, lons + 360.0, lons)
+
+    irow = (self.LATSTART - lats)/self.DLAT
+    icol = (lons - self.LONSTART)/self.DLON
+    irowl = numpy.floor(irow).astype(int)
+    icoll = numpy.floor(icol).astype(int)
+    irowh = irowl + 1
+    icolh = icoll + 1
 
-  indx = RefractivityIndexer(ituDir)
+    r1 = self.DATA[irowl, icoll]
+    r2 = self.DATA[irowh, icolh]
+    r3 = self.DATA[irowl, icolh]
+    r4 = self.DATA[irowh, icoll]
+    return (((irow - irowl) * (icol - icoll)) * r2 +
+            ((irowh - irow) * (icolh - icol)) * r1 +
+            ((irowh - irow) * (icol - icoll)) * r3 +
+            ((irow - irowl) * (icolh - icol)) * r4)
+
+# Indexers shared by GetRefractivityIndexer, by data directory.
+_INDEXERS = {}
+_INDEXERS_LOCK = threading.Lock()
+
+# Returns the process-wide RefractivityIndexer for the directory (by default
+# data/itu), creating it on first use.
+def GetRefractivityIndexer(directory=None):
+  if directory is None:
+    directory = text_grid.DefaultItuDirectory()
+  with _INDEXERS_LOCK:
+    indexer = _INDEXERS.get(directory)
+    if indexer is None:
+      indexer = RefractivityIndexer(directory)
+      _INDEXERS[directory] = indexer
+    return indexer
+
+if __name__ == '__main__':
+  indx = GetRefractivityIndexer()
 
   r = indx.Refractivity(float(sys.argv[1]), float(sys.argv[2]))
   print 'Surface Refractivity (n-units) = %s' % r
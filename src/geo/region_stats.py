@@ -0,0 +1,222 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module computes land category statistics over areas, such as the
+# fraction of a CBSD service area which is urban, suburban or rural, as
+# needed to decide the region type by preponderance (R2-SGN-04). It works
+# from the land category raster of land_category.py: for each degree tile it
+# builds summed-area tables (integral images) of the number of cells of each
+# category, from which the counts in any lat/lng rectangle take four table
+# lookups per category.
+#
+# To keep the tables small, each summed-area value is split into four parts
+# about the BLOCK x BLOCK block holding it: the count over whole blocks
+# above and to the left (uint32, one per block corner), the counts of the
+# partial block rows and columns (uint16), and the count within the block
+# (uint8). A 3601 x 3601 tile takes about 65 MB for the four categories,
+# rather than 207 MB for plain uint32 tables.
+#
+# Circles and polygons are covered by a fixed number of horizontal strips,
+# each a rectangle, so a query costs the same however large the area is.
+# The strip approximation misplaces at most a thin sliver at the ends of
+# each strip; the default of 64 strips puts the error in the fractions well
+# below a percent for a circle.
+#
+# Example use:
+#   stats = RegionStatsIndexer(land_category.LandCategoryIndexer(catDir))
+#   print stats.CircleFractions(39.7, -104.9, 5.0)
+#   print stats.PredominantRegion(39.7, -104.9, 5.0)
+
+import math
+import numpy
+
+import land_category
+import tile_cache
+
+# The categories counted, in the order of the summed-area tables.
+CATEGORIES = (land_category.RURAL, land_category.SUBURBAN,
+              land_category.URBAN, land_category.WATER)
+
+# Approximate length (km) of a degree of latitude, and of a degree of
+# longitude at the equator, used to convert radii to degrees.
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320
+
+DEFAULT_STRIPS = 64
+
+# Size of the blocks the summed-area tables are split by, so that counts
+# within a block fit uint8.
+BLOCK = 16
+
+class RegionStatsIndexer:
+  def __init__(self, land_categories,
+               cache_bytes=tile_cache.DEFAULT_CACHE_BYTES, cache=None):
+    # The land_category.LandCategoryIndexer providing the raster tiles.
+    self.land_categories = land_categories
+    # tile_cache holds the summed-area tables, keyed by tile. A cache may be
+    # passed in to share one memory budget with other indexers.
+    if cache is None:
+      cache = tile_cache.TileCache(cache_bytes)
+    self.tile_cache = cache
+
+  # Returns the summed-area tables of the degree tile with northwest corner
+  # key = (lat, lng), as a (corners, rows, cols, within) tuple. With n x n
+  # cells, I = i / BLOCK and J = j / BLOCK, the number of cells of category k
+  # in rows < i and columns < j is
+  #   corners[k, I, J] + rows[k, i, J] + cols[k, I, j] + within[k, i, j]
+  # where corners counts rows < I*BLOCK and columns < J*BLOCK, rows counts
+  # rows I*BLOCK..i-1 and columns < J*BLOCK, cols counts rows < I*BLOCK and
+  # columns J*BLOCK..j-1, and within counts rows I*BLOCK..i-1 and columns
+  # J*BLOCK..j-1.
+  def _Tables(self, key):
+    return self.tile_cache.GetOrLoad(('region_stats', key),
+                                     lambda: self._BuildTables(key))
+
+  def _BuildTables(self, key):
+    raster = numpy.asarray(self.land_categories.Tile(key))
+    n = raster.shape[0]
+    # Start of the block holding each summed-area index 0..n.
+    starts = numpy.arange(n + 1) // BLOCK * BLOCK
+    m = n // BLOCK + 1
+    corners = numpy.zeros((len(CATEGORIES), m, m), dtype=numpy.uint32)
+    # Partial block rows and columns fit uint16 for tiles up to 4369 cells.
+    partial_dtype = numpy.uint16 if (BLOCK - 1) * n <= 65535 else numpy.uint32
+    rows = numpy.zeros((len(CATEGORIES), n + 1, m), dtype=partial_dtype)
+    cols = numpy.zeros((len(CATEGORIES), m, n + 1), dtype=partial_dtype)
+    within = numpy.zeros((len(CATEGORIES), n + 1, n + 1), dtype=numpy.uint8)
+    sums = numpy.zeros((n + 1, n + 1), dtype=numpy.uint32)
+    for k, category in enumerate(CATEGORIES):
+      sums[1:, 1:] = (raster == category).astype(numpy.uint32).cumsum(0).cumsum(1)
+      block_cols = sums[:, ::BLOCK]
+      block_rows = sums[::BLOCK, :]
+      corners[k] = block_rows[:, ::BLOCK]
+      rows[k] = block_cols - block_cols[starts, :]
+      cols[k] = block_rows - block_rows[:, starts]
+      within[k] = (sums - sums[starts, :] - sums[:, starts] +
+                   sums[starts, :][:, starts])
+    tables = (corners, rows, cols, within)
+    return tables, sum(t.nbytes for t in tables)
+
+  # Returns the counts of each of CATEGORIES in rows < i and columns < j of
+  # the tile with the given tables.
+  def _Count(self, tables, i, j):
+    corners, rows, cols, within = tables
+    return (corners[:, i // BLOCK, j // BLOCK].astype(numpy.int64) +
+            rows[:, i, j // BLOCK] + cols[:, i // BLOCK, j] + within[:, i, j])
+
+  # Returns an array of the number of cells of each of CATEGORIES whose
+  # centers lie in the lat/lng rectangle, excluding its southern and eastern
+  # edges so that adjacent rectangles count each cell once. Parts of the
+  # rectangle outside the land category tiles count nothing.
+  def RectangleCounts(self, lat_min, lat_max, lng_min, lng_max):
+    counts = numpy.zeros(len(CATEGORIES), dtype=numpy.int64)
+    if lat_max < lat_min or lng_max < lng_min:
+      return counts
+    for north in range(int(math.ceil(lat_min)), int(math.ceil(lat_max)) + 1):
+      for west in range(int(math.floor(lng_min)), int(math.floor(lng_max)) + 1):
+        key = (north, west)
+        if key not in self.land_categories.tiles:
+          continue
+        tables = self._Tables(key)
+        n = tables[3].shape[1] - 1
+        # Rows and columns whose cell centers are within the rectangle.
+        r0 = max(int(math.ceil((north - lat_max) * n - 0.5)), 0)
+        r1 = min(int(math.ceil((north - lat_min) * n - 0.5)) - 1, n - 1)
+        c0 = max(int(math.ceil((lng_min - west) * n - 0.5)), 0)
+        c1 = min(int(math.ceil((lng_max - west) * n - 0.5)) - 1, n - 1)
+        if r1 < r0 or c1 < c0:
+          continue
+        counts += (self._Count(tables, r1 + 1, c1 + 1) -
+                   self._Count(tables, r0, c1 + 1) -
+                   self._Count(tables, r1 + 1, c0) +
+                   self._Count(tables, r0, c0))
+    return counts
+
+  # Returns the counts of each of CATEGORIES inside the union of the strips,
+  # given as (lat_min, lat_max, [(lng_min, lng_max), ...]) tuples.
+  def _StripCounts(self, strips):
+    counts = numpy.zeros(len(CATEGORIES), dtype=numpy.int64)
+    for lat_min, lat_max, spans in strips:
+      for lng_min, lng_max in spans:
+        counts += self.RectangleCounts(lat_min, lat_max, lng_min, lng_max)
+    return counts
+
+  # Returns the counts of each of CATEGORIES within radius_km of lat/lng.
+  def CircleCounts(self, lat, lng, radius_km, strips=DEFAULT_STRIPS):
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    km_per_lng = KM_PER_DEGREE_LNG * math.cos(math.radians(lat))
+    bands = []
+    for i in range(strips):
+      y0 = -dlat + 2.0 * dlat * i / strips
+      y1 = -dlat + 2.0 * dlat * (i + 1) / strips
+      # Half-width of the circle at the middle of the strip.
+      y = 0.5 * (y0 + y1) * KM_PER_DEGREE_LAT
+      dlng = math.sqrt(max(radius_km**2 - y**2, 0.0)) / km_per_lng
+      bands.append((lat + y0, lat + y1, [(lng - dlng, lng + dlng)]))
+    return self._StripCounts(bands)
+
+  # Returns the counts of each of CATEGORIES inside the polygon given as a
+  # list of (lat, lng) vertices. Each strip takes the spans of the polygon
+  # along the middle of the strip (even-odd rule).
+  def PolygonCounts(self, vertices, strips=DEFAULT_STRIPS):
+    lats = [v[0] for v in vertices]
+    lat_lo = min(lats)
+    lat_hi = max(lats)
+    edges = zip(vertices, vertices[1:] + vertices[:1])
+    bands = []
+    for i in range(strips):
+      y0 = lat_lo + (lat_hi - lat_lo) * i / strips
+      y1 = lat_lo + (lat_hi - lat_lo) * (i + 1) / strips
+      y = 0.5 * (y0 + y1)
+      xs = []
+      for (lat_a, lng_a), (lat_b, lng_b) in edges:
+        if (lat_a <= y) != (lat_b <= y):
+          xs.append(lng_a + (y - lat_a) * (lng_b - lng_a) / (lat_b - lat_a))
+      xs.sort()
+      bands.append((y0, y1, zip(xs[0::2], xs[1::2])))
+    return self._StripCounts(bands)
+
+  # Returns a dict of the fractions of the area, described by the counts
+  # from one of the *Counts methods, which are 'URBAN', 'SUBURBAN' and
+  # 'RURAL' (which includes water), and which is 'WATER'. Returns None if the
+  # area has no land cover data.
+  def Fractions(self, counts):
+    total = float(counts.sum())
+    if total == 0:
+      return None
+    rural, suburban, urban, water = counts
+    return {
+      'URBAN': urban / total,
+      'SUBURBAN': suburban / total,
+      'RURAL': (rural + water) / total,
+      'WATER': water / total,
+    }
+
+  # Returns the fractions of the area within radius_km of lat/lng; see
+  # Fractions.
+  def CircleFractions(self, lat, lng, radius_km, strips=DEFAULT_STRIPS):
+    return self.Fractions(self.CircleCounts(lat, lng, radius_km, strips))
+
+  # Returns the fractions of the area inside the polygon; see Fractions.
+  def PolygonFractions(self, vertices, strips=DEFAULT_STRIPS):
+    return self.Fractions(self.PolygonCounts(vertices, strips))
+
+  # Returns the region type ('URBAN', 'SUBURBAN' or 'RURAL') covering the
+  # largest fraction of the area within radius_km of lat/lng, or None if the
+  # area has no land cover data.
+  def PredominantRegion(self, lat, lng, radius_km, strips=DEFAULT_STRIPS):
+    fractions = self.CircleFractions(lat, lng, radius_km, strips)
+    if fractions is None:
+      return None
+    return max(('URBAN', 'SUBURBAN', 'RURAL'), key=lambda r: fractions[r])
@@ -0,0 +1,122 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import shutil
+import tempfile
+import unittest
+
+import land_category
+import region_stats
+
+class TestRegionStats(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    # 30" cells over two degree tiles, with random categories.
+    rng = numpy.random.RandomState(5)
+    self.rasters = {}
+    for key in [(40, -105), (40, -104)]:
+      raster = rng.randint(0, 4, (120, 120)).astype(numpy.uint8)
+      raster[:10, :10] = land_category.NODATA
+      numpy.save(land_category.TileFilename(self.directory, *key), raster)
+      self.rasters[key] = raster
+    self.stats = region_stats.RegionStatsIndexer(
+        land_category.LandCategoryIndexer(self.directory))
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  # Counts the cells whose centers satisfy inside(lat, lng) by brute force.
+  def BruteForceCounts(self, inside):
+    counts = numpy.zeros(len(region_stats.CATEGORIES), dtype=numpy.int64)
+    for (north, west), raster in self.rasters.items():
+      n = raster.shape[0]
+      rows, cols = numpy.mgrid[0:n, 0:n]
+      lats = north - (rows + 0.5) / n
+      lngs = west + (cols + 0.5) / n
+      sel = inside(lats, lngs)
+      for k, category in enumerate(region_stats.CATEGORIES):
+        counts[k] += numpy.sum(raster[sel] == category)
+    return counts
+
+  def test_rectangle_counts(self):
+    for lat_min, lat_max, lng_min, lng_max in [
+        (39.2, 39.7, -104.8, -104.1),
+        (39.0, 40.0, -105.0, -103.0),
+        (39.5, 39.5, -104.5, -104.2),
+        (38.0, 38.5, -104.5, -104.2)]:
+      counts = self.stats.RectangleCounts(lat_min, lat_max, lng_min, lng_max)
+      expected = self.BruteForceCounts(
+          lambda lats, lngs: ((lats > lat_min) & (lats <= lat_max) &
+                              (lngs >= lng_min) & (lngs < lng_max)))
+      self.assertEquals(expected.tolist(), counts.tolist())
+
+  def test_tables_over_budget(self):
+    # A budget holding the tables of a single tile, for a rectangle over both
+    # tiles.
+    tables, nbytes = self.stats._BuildTables((40, -105))
+    self.assertTrue(nbytes < 4 * 121 * 121 * 4)
+    stats = region_stats.RegionStatsIndexer(
+        land_category.LandCategoryIndexer(self.directory),
+        cache_bytes=nbytes + 1)
+    for _ in range(2):
+      counts = stats.RectangleCounts(39.1, 39.9, -104.9, -103.2)
+      expected = self.BruteForceCounts(
+          lambda lats, lngs: ((lats > 39.1) & (lats <= 39.9) &
+                              (lngs >= -104.9) & (lngs < -103.2)))
+      self.assertEquals(expected.tolist(), counts.tolist())
+      self.assertEquals(1, len(stats.tile_cache))
+    self.assertEquals(4, stats.tile_cache.Stats()['misses'])
+
+  def test_large_tile(self):
+    # Counts over whole blocks exceed the range of uint16.
+    raster = numpy.full((1000, 1000), land_category.URBAN, dtype=numpy.uint8)
+    raster[500:, :] = land_category.WATER
+    numpy.save(land_category.TileFilename(self.directory, 40, -105), raster)
+    stats = region_stats.RegionStatsIndexer(
+        land_category.LandCategoryIndexer(self.directory))
+    self.assertEquals([0, 0, 499 * 999, 500 * 999],
+                      stats.RectangleCounts(39.0, 39.999, -105.0,
+                                            -104.001).tolist())
+
+  def test_circle_fractions(self):
+    lat, lng, radius = 39.5, -104.0, 30.0
+    fractions = self.stats.CircleFractions(lat, lng, radius)
+    km_per_lng = region_stats.KM_PER_DEGREE_LNG * numpy.cos(numpy.radians(lat))
+    expected = self.stats.Fractions(self.BruteForceCounts(
+        lambda lats, lngs: (((lats - lat) * region_stats.KM_PER_DEGREE_LAT)**2 +
+                            ((lngs - lng) * km_per_lng)**2 <= radius**2)))
+    for region in ('URBAN', 'SUBURBAN', 'RURAL', 'WATER'):
+      self.assertAlmostEqual(expected[region], fractions[region], places=2)
+    self.assertAlmostEqual(1.0, fractions['URBAN'] + fractions['SUBURBAN'] +
+                           fractions['RURAL'])
+
+  def test_polygon_fractions(self):
+    # An axis-aligned square polygon matches the rectangle.
+    square = [(39.2, -104.8), (39.7, -104.8), (39.7, -104.1), (39.2, -104.1)]
+    self.assertEquals(
+        self.stats.Fractions(
+            self.stats.RectangleCounts(39.2, 39.7, -104.8, -104.1)),
+        self.stats.PolygonFractions(square))
+
+  def test_predominant_region(self):
+    raster = numpy.full((120, 120), land_category.URBAN, dtype=numpy.uint8)
+    raster[:, 100:] = land_category.RURAL
+    numpy.save(land_category.TileFilename(self.directory, 40, -105), raster)
+    stats = region_stats.RegionStatsIndexer(
+        land_category.LandCategoryIndexer(self.directory))
+    self.assertEquals('URBAN', stats.PredominantRegion(39.5, -104.6, 10.0))
+    self.assertEquals(None, stats.PredominantRegion(30.0, -104.6, 10.0))
+
+if __name__ == '__main__':
+  unittest.main()
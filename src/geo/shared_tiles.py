@@ -0,0 +1,211 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module lets the worker processes of a multiprocessing pool share one
+# in-memory copy of each decoded tile. The first process to need a tile
+# decodes it and writes it as a .npy file under a shared-memory directory
+# (/dev/shm where available); every process, including the first, then maps
+# that file read-only. Each attachment is reference counted on disk, so the
+# file is removed, together with its lock and count files, once the last
+# process detaches from it. Mappings which are still open stay valid after
+# removal.
+#
+# Tiles that are already read through numpy.memmap (GridFloat tiles and the
+# terrain store) are shared through the page cache and do not need this; it
+# is for rasters which must be decoded through GDAL, such as NLCD tiles or
+# NED tiles without a GridFloat header.
+#
+# Example use (in each worker):
+#   shared = SharedTileStore()
+#   indx = NlcdIndexer(nlcdDir, shared=shared)
+#
+# Every attachment a process still holds is released when it exits, including
+# pool workers which exit after the pool is closed, or when its store is
+# garbage collected. Reference counts are kept
+# in files locked with fcntl, so this requires a POSIX system. Counts held by
+# a process which is killed (for instance by Pool.terminate) are not
+# released; remove the shared directory between runs if workers may have
+# crashed.
+
+import atexit
+import collections
+import fcntl
+import hashlib
+import multiprocessing.util
+import numpy
+import os
+import tempfile
+import threading
+import weakref
+
+def DefaultSharedDirectory():
+  if os.path.isdir('/dev/shm'):
+    return '/dev/shm/sas_tiles'
+  return os.path.join(tempfile.gettempdir(), 'sas_tiles')
+
+# The stores created in this process. Their attachments are released by a
+# single exit handler, registered once in each process.
+_STORES = weakref.WeakSet()
+_STORES_LOCK = threading.Lock()
+_STORES_PID = None
+
+def _DetachAllStores():
+  for store in list(_STORES):
+    store.DetachAll()
+
+def _RegisterStore(store):
+  global _STORES_PID
+  with _STORES_LOCK:
+    if _STORES_PID != os.getpid():
+      # Worker processes leave through os._exit, which skips atexit handlers
+      # but runs the multiprocessing finalizers. A forked child inherits
+      # neither registration, so each process makes its own.
+      _STORES_PID = os.getpid()
+      atexit.register(_DetachAllStores)
+      multiprocessing.util.Finalize(None, _DetachAllStores, exitpriority=10)
+    _STORES.add(store)
+
+class SharedTileStore:
+  def __init__(self, directory=None, keep_unused=False):
+    if directory is None:
+      directory = DefaultSharedDirectory()
+    self.directory = directory
+    # If set, tile files are left in place when their count drops to zero so
+    # that later runs can attach to them without decoding.
+    self.keep_unused = keep_unused
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        # Another worker may have created it first.
+        if not os.path.isdir(directory):
+          raise
+    # Number of attachments of each key held by this process.
+    self.attached = collections.Counter()
+    self.attached_lock = threading.Lock()
+    self.pid = os.getpid()
+    _RegisterStore(self)
+
+  def __del__(self):
+    if self.attached:
+      self.DetachAll()
+
+  def _Path(self, key, suffix):
+    digest = hashlib.md5(key).hexdigest()[:12]
+    name = '%s_%s' % (digest, os.path.basename(key))
+    return os.path.join(self.directory, name + suffix)
+
+  # Returns a read-only numpy array for the tile with the given key (usually
+  # the source filename), shared with every other attached process. loader()
+  # is called to produce the array only if no process has published it yet.
+  def Attach(self, key, loader):
+    path = self._Path(key, '.npy')
+    lock = self._Lock(key)
+    try:
+      if not os.path.exists(path):
+        data = loader()
+        tmp_path = path + '.%d.tmp' % os.getpid()
+        numpy.save(tmp_path, data)
+        os.rename(tmp_path + '.npy', path)
+      self._AddRef(key, 1)
+      with self.attached_lock:
+        self.attached[key] += 1
+    except:
+      # If no process is attached, as when the first loader fails, the lock
+      # file is removed while still held, as in _Release.
+      if not os.path.exists(self._Path(key, '.ref')):
+        os.remove(self._Path(key, '.lock'))
+      raise
+    finally:
+      fcntl.flock(lock, fcntl.LOCK_UN)
+      lock.close()
+    return numpy.load(path, mmap_mode='r')
+
+  # Releases one attachment of the tile with the given key. When no attached
+  # process remains, the shared copy is removed unless keep_unused is set.
+  def Detach(self, key):
+    with self.attached_lock:
+      if self.attached[key] <= 0:
+        return
+      self.attached[key] -= 1
+      if not self.attached[key]:
+        del self.attached[key]
+    self._Release(key, 1)
+
+  # Releases every attachment held by this process. Called when the process
+  # exits; may also be called once the tiles are no longer needed.
+  def DetachAll(self):
+    # A child forked from this process inherits the store but none of its
+    # attachments. Nothing is left to release if the directory was removed.
+    if os.getpid() != self.pid or not os.path.isdir(self.directory):
+      return
+    with self.attached_lock:
+      attached = self.attached.items()
+      self.attached.clear()
+    for key, count in attached:
+      self._Release(key, count)
+
+  Close = DetachAll
+
+  # Opens and exclusively locks the lock file of the tile with the given key.
+  # The lock file is removed along with the tile, so a process which was
+  # waiting on a removed file retries on the new one.
+  def _Lock(self, key):
+    lock_path = self._Path(key, '.lock')
+    while True:
+      lock = open(lock_path, 'a+')
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      try:
+        if os.fstat(lock.fileno()).st_ino == os.stat(lock_path).st_ino:
+          return lock
+      except OSError:
+        pass
+      fcntl.flock(lock, fcntl.LOCK_UN)
+      lock.close()
+
+  def _Release(self, key, count):
+    lock = self._Lock(key)
+    try:
+      if self._AddRef(key, -count) <= 0:
+        if not self.keep_unused:
+          path = self._Path(key, '.npy')
+          if os.path.exists(path):
+            os.remove(path)
+        # Nothing is attached, so the lock file may go too. Removing it while
+        # it is held makes any waiting process retry with a new one.
+        os.remove(self._Path(key, '.lock'))
+    finally:
+      fcntl.flock(lock, fcntl.LOCK_UN)
+      lock.close()
+
+  # Returns the number of attachments of the tile with the given key.
+  def RefCount(self, key):
+    ref_path = self._Path(key, '.ref')
+    if not os.path.exists(ref_path):
+      return 0
+    with open(ref_path, 'r') as f:
+      return int(f.read() or 0)
+
+  # Adds delta to the reference count of the tile and returns the new count.
+  # The count file is removed when the count drops to zero. Must be called
+  # while holding the tile lock.
+  def _AddRef(self, key, delta):
+    count = max(self.RefCount(key) + delta, 0)
+    ref_path = self._Path(key, '.ref')
+    if count:
+      with open(ref_path, 'w') as f:
+        f.write('%d' % count)
+    elif os.path.exists(ref_path):
+      os.remove(ref_path)
+    return count
@@ -0,0 +1,121 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import multiprocessing
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+import weakref
+
+import shared_tiles
+
+def _AttachAndSum(directory):
+  shared = shared_tiles.SharedTileStore(directory)
+  a = shared.Attach('tile', lambda: numpy.arange(100.0))
+  return float(a.sum())
+
+class TestSharedTileStore(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_loads_once_and_counts_references(self):
+    shared = shared_tiles.SharedTileStore(self.directory)
+    loads = []
+    def Loader():
+      loads.append(1)
+      return numpy.arange(10)
+    a = shared.Attach('/data/nlcd/tile.img', Loader)
+    b = shared.Attach('/data/nlcd/tile.img', Loader)
+    self.assertEquals(1, len(loads))
+    self.assertTrue(numpy.array_equal(a, b))
+    self.assertFalse(a.flags.writeable)
+    self.assertEquals(2, shared.RefCount('/data/nlcd/tile.img'))
+
+    shared.Detach('/data/nlcd/tile.img')
+    shared.Detach('/data/nlcd/tile.img')
+    self.assertEquals(0, shared.RefCount('/data/nlcd/tile.img'))
+    # The shared copy is gone but the existing mapping is still readable.
+    self.assertFalse(os.path.exists(shared._Path('/data/nlcd/tile.img', '.npy')))
+    self.assertEquals(45, a.sum())
+    # Nothing else is left behind for the tile.
+    self.assertEquals([], os.listdir(self.directory))
+
+  def test_failed_load(self):
+    shared = shared_tiles.SharedTileStore(self.directory)
+    def Loader():
+      raise IOError('unreadable tile')
+    self.assertRaises(IOError, shared.Attach, 'a', Loader)
+    self.assertEquals(0, shared.RefCount('a'))
+    self.assertEquals([], os.listdir(self.directory))
+    # A later attachment loads the tile normally.
+    a = shared.Attach('a', lambda: numpy.arange(3))
+    self.assertEquals(3, len(a))
+    self.assertEquals(1, shared.RefCount('a'))
+
+  def test_keep_unused(self):
+    shared = shared_tiles.SharedTileStore(self.directory, keep_unused=True)
+    shared.Attach('a', lambda: numpy.arange(3))
+    shared.Detach('a')
+    self.assertEquals([os.path.basename(shared._Path('a', '.npy'))],
+                      os.listdir(self.directory))
+    # A later attachment uses the kept copy.
+    a = shared.Attach('a', lambda: numpy.arange(4))
+    self.assertEquals(3, len(a))
+    self.assertEquals(1, shared.RefCount('a'))
+
+  def test_collected_store_releases_attachments(self):
+    shared = shared_tiles.SharedTileStore(self.directory)
+    shared.Attach('a', lambda: numpy.arange(3))
+    ref = weakref.ref(shared)
+    del shared
+    # The exit handlers do not keep the store alive.
+    self.assertTrue(ref() is None)
+    self.assertEquals([], os.listdir(self.directory))
+
+  def test_worker_processes(self):
+    pool = multiprocessing.Pool(4)
+    sums = pool.map(_AttachAndSum, [self.directory] * 8)
+    pool.close()
+    pool.join()
+    self.assertEquals([4950.0] * 8, sums)
+    # The workers released their attachments as they exited.
+    shared = shared_tiles.SharedTileStore(self.directory)
+    self.assertEquals(0, shared.RefCount('tile'))
+    self.assertFalse(os.path.exists(shared._Path('tile', '.npy')))
+
+  def test_detach_all(self):
+    shared = shared_tiles.SharedTileStore(self.directory)
+    shared.Attach('a', lambda: numpy.arange(3))
+    shared.Attach('a', lambda: numpy.arange(3))
+    shared.Attach('b', lambda: numpy.arange(3))
+    other = shared_tiles.SharedTileStore(self.directory)
+    other.Attach('b', lambda: numpy.arange(3))
+    shared.Close()
+    self.assertEquals(0, shared.RefCount('a'))
+    self.assertEquals(1, shared.RefCount('b'))
+    self.assertFalse(os.path.exists(shared._Path('a', '.npy')))
+    self.assertTrue(os.path.exists(shared._Path('b', '.npy')))
+    # Detaching a key this process no longer holds does nothing.
+    shared.Detach('b')
+    self.assertEquals(1, other.RefCount('b'))
+    other.Detach('b')
+    self.assertEquals(0, other.RefCount('b'))
+
+if __name__ == '__main__':
+  unittest.main()
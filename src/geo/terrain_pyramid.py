@@ -0,0 +1,234 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module builds reduced resolution levels of the NED degree tiles for
+# coarse pre-screening of propagation paths. Each level aggregates square
+# blocks of 1 arc-second samples into cells holding the mean, minimum and
+# maximum elevation of the block. A 30" level is 900 times smaller than the
+# full resolution tile, so a screening pass over many paths keeps all of the
+# tiles it touches in memory.
+#
+# Lookups come in two modes:
+#   - interpolated: bilinear interpolation of the cell means, an approximation
+#     of the full resolution elevation.
+#   - bound: the maximum (or minimum) over the cells containing the samples
+#     which full resolution interpolation at that point would use. This is
+#     never below (or above) the full resolution elevation, so a profile built
+#     from it bounds the terrain. It does not bound propagation loss computed
+#     over that terrain, which is not monotone in the terrain elevations.
+#
+# Levels are normally built on demand by NedIndexer. To build and save the
+# levels for all tiles ahead of time:
+#   python terrain_pyramid.py ../../data/ned ../../data/ned/pyramid
+#   indx = ned_indexer.NedIndexer('../../data/ned',
+#                                 pyramid_dir='../../data/ned/pyramid')
+
+import numpy
+import os
+import sys
+import warnings
+
+# Resolutions (arc seconds) of the pyramid levels. The 1" level is the NED
+# data itself.
+LEVELS = (1, 3, 30)
+
+# Number of 1" rows decoded at a time when building a level.
+BAND_ROWS = 300
+
+# Bound modes accepted by PyramidTile.Bound.
+BOUND_MAX = 'max'
+BOUND_MIN = 'min'
+
+# Returns the number of 1" samples along each side of a cell at the given
+# resolution in arc seconds. Raises an Exception for unknown resolutions.
+def LevelFactor(resolution):
+  if resolution not in LEVELS:
+    raise Exception('Unsupported terrain resolution %s; must be one of %s' %
+                    (resolution, LEVELS))
+  return int(resolution)
+
+# Returns (mean, lo, hi) float32 arrays aggregating factor x factor blocks of
+# the data array. The data is padded by repeating its last row and column up
+# to a whole number of blocks. Samples equal to nodata are left out of the
+# aggregates; cells with no other samples are set to nodata.
+def Aggregate(data, factor, nodata=None):
+  data = numpy.asarray(data, dtype=numpy.float32)
+  nrows = -(-data.shape[0] // factor)
+  ncols = -(-data.shape[1] // factor)
+  pad = ((0, nrows * factor - data.shape[0]), (0, ncols * factor - data.shape[1]))
+  if pad[0][1] or pad[1][1]:
+    data = numpy.pad(data, pad, 'edge')
+  blocks = data.reshape(nrows, factor, ncols, factor)
+  missing = None
+  if nodata is not None:
+    missing = (blocks == nodata)
+  if missing is None or not missing.any():
+    return (blocks.mean(axis=(1, 3)).astype(numpy.float32),
+            blocks.min(axis=(1, 3)),
+            blocks.max(axis=(1, 3)))
+
+  blocks = numpy.where(missing, numpy.float32(numpy.nan), blocks)
+  with warnings.catch_warnings():
+    # Cells with no valid samples are filled in below.
+    warnings.simplefilter('ignore', RuntimeWarning)
+    aggregates = [numpy.nanmean(blocks, axis=(1, 3)),
+                  numpy.nanmin(blocks, axis=(1, 3)),
+                  numpy.nanmax(blocks, axis=(1, 3))]
+  empty = missing.all(axis=(1, 3))
+  for a in aggregates:
+    a[empty] = nodata
+  return tuple(a.astype(numpy.float32) for a in aggregates)
+
+# A single degree tile at one pyramid level. inv_txf is the inverse geo
+# transform of the full resolution tile, mapping (lng, lat) to 1" (pixel,
+# line) coordinates; mean, lo and hi are the cell aggregates, each cell
+# covering factor x factor full resolution samples.
+class PyramidTile:
+  def __init__(self, inv_txf, factor, mean, lo, hi):
+    self.inv_txf = inv_txf
+    self.factor = factor
+    self.mean = mean
+    self.lo = lo
+    self.hi = hi
+
+  # The number of bytes held by the aggregate arrays.
+  def Bytes(self):
+    return self.mean.nbytes + self.lo.nbytes + self.hi.nbytes
+
+  def _Pixels(self, lats, lngs):
+    tx = self.inv_txf
+    ipx = tx[0] + tx[1] * lngs + tx[2] * lats
+    iln = tx[3] + tx[4] * lngs + tx[5] * lats
+    return iln, ipx
+
+  # Returns the bilinear interpolation of the cell means at the given arrays
+  # of lats and lngs. As in NedIndexer.ElevationBatch, each value is taken to
+  # lie at the position of its first sample, so a cell mean lies at the
+  # middle of its block.
+  def Elevations(self, lats, lngs):
+    iln, ipx = self._Pixels(lats, lngs)
+    offset = 0.5 * (self.factor - 1)
+    iln = (iln - offset) / self.factor
+    ipx = (ipx - offset) / self.factor
+    nrows, ncols = self.mean.shape
+    ilnf = numpy.floor(iln).astype(int)
+    ipxf = numpy.floor(ipx).astype(int)
+    wln = iln - ilnf
+    wpx = ipx - ipxf
+    # Near the edges of the tile the neighboring cell may lie outside it; the
+    # edge cell is used instead.
+    r0 = numpy.clip(ilnf, 0, nrows - 1)
+    r1 = numpy.clip(ilnf + 1, 0, nrows - 1)
+    c0 = numpy.clip(ipxf, 0, ncols - 1)
+    c1 = numpy.clip(ipxf + 1, 0, ncols - 1)
+    m = self.mean
+    return (wln * wpx * m[r1, c1] + wln * (1 - wpx) * m[r1, c0] +
+            (1 - wln) * wpx * m[r0, c1] + (1 - wln) * (1 - wpx) * m[r0, c0])
+
+  # Returns, for the given arrays of lats and lngs, the maximum (bound is
+  # BOUND_MAX) or minimum (BOUND_MIN) of the cells containing the four
+  # samples which full resolution bilinear interpolation would use.
+  def Bound(self, lats, lngs, bound):
+    if bound == BOUND_MAX:
+      agg, pick = self.hi, numpy.maximum
+    elif bound == BOUND_MIN:
+      agg, pick = self.lo, numpy.minimum
+    else:
+      raise Exception('Unknown terrain bound %s' % bound)
+    iln, ipx = self._Pixels(lats, lngs)
+    nrows, ncols = agg.shape
+    ilnf = numpy.floor(iln).astype(int)
+    ipxf = numpy.floor(ipx).astype(int)
+    r0 = numpy.clip(ilnf // self.factor, 0, nrows - 1)
+    r1 = numpy.clip((ilnf + 1) // self.factor, 0, nrows - 1)
+    c0 = numpy.clip(ipxf // self.factor, 0, ncols - 1)
+    c1 = numpy.clip((ipxf + 1) // self.factor, 0, ncols - 1)
+    return pick(pick(agg[r0, c0], agg[r0, c1]),
+                pick(agg[r1, c0], agg[r1, c1]))
+
+# Builds the pyramid level of the given resolution (arc seconds) from a full
+# resolution tile, such as a gridfloat.GridFloatTile or a
+# terrain_store.StoreTile. The tile provides inv_txf, a data array giving the
+# shape of the raster, Values returning elevations in meters (decoding
+# compact encodings), and the nodata elevation or None.
+def BuildLevel(tile, resolution):
+  factor = LevelFactor(resolution)
+  nrows, ncols = tile.data.shape
+  # Decode the tile in bands of whole cells to bound the memory used.
+  band = factor * max(1, BAND_ROWS // factor)
+  parts = []
+  for r0 in range(0, nrows, band):
+    data = tile.Values(slice(r0, r0 + band), slice(0, ncols))
+    parts.append(Aggregate(data, factor, tile.nodata))
+  mean, lo, hi = [numpy.concatenate(p) for p in zip(*parts)]
+  return PyramidTile(tile.inv_txf, factor, mean, lo, hi)
+
+# Returns the filename prefix under which the level of the given degree tile
+# key is saved in a pyramid directory.
+def LevelPrefix(directory, key, resolution):
+  return os.path.join(directory, 'ned_%s_%ds' % (key, resolution))
+
+# Saves a level as .npy files: the three aggregates and the inverse geo
+# transform.
+def SaveLevel(level, directory, key, resolution):
+  prefix = LevelPrefix(directory, key, resolution)
+  arrays = (('txf', numpy.array(level.inv_txf, dtype=numpy.float64)),
+            ('mean', level.mean), ('min', level.lo), ('max', level.hi))
+  for name, data in arrays:
+    tmp = '%s_%s.%d.tmp.npy' % (prefix, name, os.getpid())
+    numpy.save(tmp, data)
+    os.rename(tmp, '%s_%s.npy' % (prefix, name))
+
+# Loads a level saved by SaveLevel, memory-mapping its aggregates. Returns
+# None if the level has not been saved.
+def LoadLevel(directory, key, resolution):
+  prefix = LevelPrefix(directory, key, resolution)
+  arrays = []
+  for name in ('txf', 'mean', 'min', 'max'):
+    filename = '%s_%s.npy' % (prefix, name)
+    if not os.path.exists(filename):
+      return None
+    arrays.append(numpy.load(filename, mmap_mode='r'))
+  inv_txf = tuple(float(v) for v in arrays[0])
+  return PyramidTile(inv_txf, LevelFactor(resolution), *arrays[1:])
+
+# Builds and saves the reduced resolution levels of every tile known to the
+# indexer in the output directory.
+def BuildPyramid(indexer, output_directory):
+  if not os.path.isdir(output_directory):
+    os.makedirs(output_directory)
+  for k in sorted(indexer.TileKeys()):
+    print 'Building pyramid levels for tile %s' % k
+    for resolution in LEVELS:
+      if resolution > 1:
+        SaveLevel(indexer.LevelTile(k, resolution), output_directory, k,
+                  resolution)
+
+# If run directly, builds the pyramid. Arguments are the NED directory and
+# the output directory (by default the 'pyramid' subdirectory of the NED
+# directory).
+if __name__ == '__main__':
+  import ned_indexer
+  if len(sys.argv) > 1:
+    nedDir = sys.argv[1]
+  else:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    rootDir = os.path.dirname(os.path.dirname(dir))
+    nedDir = os.path.join(os.path.join(rootDir, 'data'), 'ned')
+  if len(sys.argv) > 2:
+    output = sys.argv[2]
+  else:
+    output = os.path.join(nedDir, 'pyramid')
+
+  BuildPyramid(ned_indexer.NedIndexer(nedDir), output)
@@ -0,0 +1,157 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+import gridfloat
+import terrain_pyramid
+import terrain_store
+
+# A synthetic 1" tile with the NED layout: 3612 x 3612 samples with a 6
+# sample overlap around the degree.
+class FakeTile:
+  def __init__(self, data):
+    self.data = data
+    self.nodata = None
+    self.inv_txf = gridfloat.InvGeoTransform(
+        (-106.0 - 6.0 / 3600, 1.0 / 3600, 0.0, 40.0 + 6.0 / 3600, 0.0, -1.0 / 3600))
+
+  def Values(self, rows, cols):
+    return self.data[rows, cols]
+
+  # Bilinear interpolation as in NedIndexer.ElevationBatch.
+  def Elevations(self, lats, lngs):
+    tx = self.inv_txf
+    ipx = tx[0] + tx[1] * lngs
+    iln = tx[3] + tx[5] * lats
+    ilnf = numpy.floor(iln).astype(int)
+    ipxf = numpy.floor(ipx).astype(int)
+    d = self.data
+    return ((iln - ilnf) * (ipx - ipxf) * d[ilnf + 1, ipxf + 1] +
+            (iln - ilnf) * (ipxf + 1 - ipx) * d[ilnf + 1, ipxf] +
+            (ilnf + 1 - iln) * (ipx - ipxf) * d[ilnf, ipxf + 1] +
+            (ilnf + 1 - iln) * (ipxf + 1 - ipx) * d[ilnf, ipxf])
+
+class TestTerrainPyramid(unittest.TestCase):
+  def setUp(self):
+    rng = numpy.random.RandomState(3)
+    self.tile = FakeTile((rng.rand(3612, 3612) * 500).astype(numpy.float32))
+    self.lats = rng.uniform(39.0, 40.0, 2000)
+    self.lngs = rng.uniform(-106.0, -105.0, 2000)
+
+  def test_aggregate(self):
+    data = numpy.arange(16, dtype=numpy.float32).reshape(4, 4)
+    mean, lo, hi = terrain_pyramid.Aggregate(data, 3)
+    self.assertEquals((2, 2), mean.shape)
+    self.assertEquals(5.0, mean[0, 0])
+    self.assertEquals(0.0, lo[0, 0])
+    self.assertEquals(10.0, hi[0, 0])
+    # The padded cells repeat the last row and column.
+    self.assertEquals(15.0, mean[1, 1])
+
+  def test_aggregate_nodata(self):
+    data = numpy.arange(16, dtype=numpy.float32).reshape(4, 4)
+    data[0, 0] = -9999
+    data[2:, 2:] = -9999
+    mean, lo, hi = terrain_pyramid.Aggregate(data, 2, -9999)
+    self.assertAlmostEqual(10 / 3.0, mean[0, 0], places=5)
+    self.assertEquals(1.0, lo[0, 0])
+    self.assertEquals(5.0, hi[0, 0])
+    self.assertEquals([-9999.0] * 3, [mean[1, 1], lo[1, 1], hi[1, 1]])
+    self.assertEquals(numpy.float32, mean.dtype)
+
+  def test_level_from_int16_store(self):
+    directory = tempfile.mkdtemp()
+    try:
+      rng = numpy.random.RandomState(4)
+      data = (1500 + rng.rand(100, 100) * 500).astype(numpy.float32)
+      data[10:20, 40:50] = -9999
+      data[60:70, 60:65] = -9999
+      flt = os.path.join(directory, 'usgs_ned_1_n40w106_gridfloat.flt')
+      with open(gridfloat.HeaderFilename(flt), 'w') as f:
+        f.write('ncols 100\nnrows 100\nxllcorner -106\nyllcorner 39\n'
+                'cellsize 0.01\nNODATA_value -9999\nbyteorder LSBFIRST\n')
+      data.tofile(flt)
+      filename = os.path.join(directory, 'test.store')
+      terrain_store.BuildTerrainStore(directory, filename, use_int16=True)
+      tile = terrain_store.TerrainStore(filename).Tile('40.-106')
+      self.assertEquals(numpy.int16, tile.data.dtype)
+      # Use bands smaller than the tile.
+      band_rows = terrain_pyramid.BAND_ROWS
+      terrain_pyramid.BAND_ROWS = 20
+      try:
+        level = terrain_pyramid.BuildLevel(tile, 3)
+      finally:
+        terrain_pyramid.BAND_ROWS = band_rows
+      expected = terrain_pyramid.Aggregate(data, 3, -9999)
+      for a, b in zip(expected, (level.mean, level.lo, level.hi)):
+        self.assertEquals((34, 34), b.shape)
+        numpy.testing.assert_allclose(a, b, atol=0.051)
+      # The block of nodata covers whole cells only where it is aligned.
+      self.assertEquals(-9999, level.hi[4, 14])
+      self.assertTrue(level.lo[3, 13] >= 1500 - 0.05)
+    finally:
+      shutil.rmtree(directory)
+
+  def test_unknown_resolution(self):
+    self.assertRaises(Exception, terrain_pyramid.LevelFactor, 10)
+
+  def test_bounds_are_conservative(self):
+    full = self.tile.Elevations(self.lats, self.lngs)
+    for resolution in terrain_pyramid.LEVELS:
+      level = terrain_pyramid.BuildLevel(self.tile, resolution)
+      hi = level.Bound(self.lats, self.lngs, terrain_pyramid.BOUND_MAX)
+      lo = level.Bound(self.lats, self.lngs, terrain_pyramid.BOUND_MIN)
+      self.assertTrue(numpy.all(hi >= full - 1e-3))
+      self.assertTrue(numpy.all(lo <= full + 1e-3))
+
+  def test_full_resolution_level_matches_tile(self):
+    level = terrain_pyramid.BuildLevel(self.tile, 1)
+    numpy.testing.assert_allclose(self.tile.Elevations(self.lats, self.lngs),
+                                  level.Elevations(self.lats, self.lngs),
+                                  atol=1e-3)
+
+  def test_coarse_level_of_smooth_terrain(self):
+    y, x = numpy.mgrid[0:3612, 0:3612]
+    tile = FakeTile((100.0 + 0.1 * x + 0.05 * y).astype(numpy.float32))
+    level = terrain_pyramid.BuildLevel(tile, 30)
+    # Within half a cell of the edge the padded edge cells are used.
+    interior = ((self.lats > 39.01) & (self.lats < 39.99) &
+                (self.lngs > -105.99) & (self.lngs < -105.01))
+    lats = self.lats[interior]
+    lngs = self.lngs[interior]
+    numpy.testing.assert_allclose(tile.Elevations(lats, lngs),
+                                  level.Elevations(lats, lngs), atol=1e-3)
+
+  def test_save_and_load(self):
+    directory = tempfile.mkdtemp()
+    try:
+      level = terrain_pyramid.BuildLevel(self.tile, 3)
+      terrain_pyramid.SaveLevel(level, directory, '40.-106', 3)
+      self.assertEquals(None,
+                        terrain_pyramid.LoadLevel(directory, '40.-106', 30))
+      loaded = terrain_pyramid.LoadLevel(directory, '40.-106', 3)
+      numpy.testing.assert_array_equal(
+          level.Bound(self.lats, self.lngs, terrain_pyramid.BOUND_MAX),
+          loaded.Bound(self.lats, self.lngs, terrain_pyramid.BOUND_MAX))
+      numpy.testing.assert_allclose(level.Elevations(self.lats, self.lngs),
+                                    loaded.Elevations(self.lats, self.lngs))
+    finally:
+      shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,272 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module builds and reads a compact, indexed terrain store which holds
+# all of the NED degree tiles in a single file. The store is built once from
+# the USGS_NED_1_*_GridFloat.zip files (or from the extracted .flt/.hdr
+# files), and afterwards opens in milliseconds: only the header and the tile
+# directory are read, and tiles are served by memory-mapping their blocks, so
+# neither a directory scan nor GDAL is needed to look up elevations.
+#
+# File layout (all values little-endian):
+#   header     HEADER_DTYPE: magic, format version, number of tiles
+#   directory  num_tiles entries of DIRECTORY_DTYPE, one per degree tile
+#   blocks     the raster of each tile, row-major, starting on a page boundary
+#
+# A tile block is either float32 elevations in meters or, for the compact
+# encoding, int16 decimeters relative to a per-tile base elevation.
+#
+# Example use:
+#   python terrain_store.py ../../data/ned                # build the store
+#   indx = ned_indexer.NedIndexer('../../data/ned')       # uses it if present
+
+import numpy
+import os
+import sys
+import zipfile
+
+import gridfloat
+
+# Default filename of the store within the NED data directory.
+STORE_FILENAME = 'ned_terrain.store'
+
+MAGIC = 'SASTERR1'
+VERSION = 1
+
+ENCODING_FLOAT32 = 0
+ENCODING_INT16_DM = 1
+# Encoded value used for nodata samples in int16 blocks.
+INT16_NODATA = -32768
+
+# Tile blocks are aligned to this many bytes so they can be mapped directly.
+BLOCK_ALIGNMENT = 4096
+
+HEADER_DTYPE = numpy.dtype([
+  ('magic', 'S8'),
+  ('version', '<u4'),
+  ('num_tiles', '<u4'),
+])
+
+DIRECTORY_DTYPE = numpy.dtype([
+  ('lat', '<i4'),          # northern edge of the degree tile
+  ('lng', '<i4'),          # western edge of the degree tile
+  ('nrows', '<u4'),
+  ('ncols', '<u4'),
+  ('encoding', '<u4'),     # ENCODING_FLOAT32 or ENCODING_INT16_DM
+  ('reserved', '<u4'),
+  ('ulx', '<f8'),          # geo transform: upper-left corner and cell size
+  ('uly', '<f8'),
+  ('cellsize', '<f8'),
+  ('nodata', '<f8'),       # elevation returned for nodata samples
+  ('base', '<f8'),         # base elevation (m) of int16 encoded blocks
+  ('data_offset', '<u8'),  # byte offset of the block in the file
+])
+
+# A single tile served from the store. Provides the same inv_txf and Values
+# interface as gridfloat.GridFloatTile.
+class StoreTile:
+  def __init__(self, filename, entry):
+    self.filename = filename
+    self.encoding = int(entry['encoding'])
+    self.base = float(entry['base'])
+    self.nodata = float(entry['nodata'])
+    cellsize = float(entry['cellsize'])
+    self.txf = (float(entry['ulx']), cellsize, 0.0,
+                float(entry['uly']), 0.0, -cellsize)
+    self.inv_txf = gridfloat.InvGeoTransform(self.txf)
+    if self.encoding == ENCODING_INT16_DM:
+      dtype = numpy.dtype('<i2')
+    else:
+      dtype = numpy.dtype('<f4')
+    self.data = numpy.memmap(filename, dtype=dtype, mode='r',
+                             offset=int(entry['data_offset']),
+                             shape=(int(entry['nrows']), int(entry['ncols'])))
+
+  # Returns the elevations at the given arrays of row and column indices.
+  def Values(self, rows, cols):
+    v = self.data[rows, cols]
+    if self.encoding == ENCODING_FLOAT32:
+      return v
+    elev = v * 0.1 + self.base
+    elev[v == INT16_NODATA] = self.nodata
+    return elev
+
+class TerrainStore:
+  def __init__(self, filename):
+    self.filename = filename
+    with open(filename, 'rb') as f:
+      header = numpy.fromfile(f, dtype=HEADER_DTYPE, count=1)
+      if len(header) != 1 or header[0]['magic'] != MAGIC:
+        raise Exception('%s is not a terrain store' % filename)
+      if header[0]['version'] != VERSION:
+        raise Exception('Terrain store %s has version %d, expected %d' %
+                        (filename, header[0]['version'], VERSION))
+      self.directory = numpy.fromfile(f, dtype=DIRECTORY_DTYPE,
+                                      count=int(header[0]['num_tiles']))
+
+    # Maps degree tile key to directory entry index.
+    self.index = {}
+    for i in range(len(self.directory)):
+      k = '%s.%s' % (self.directory[i]['lat'], self.directory[i]['lng'])
+      self.index[k] = i
+
+  def __contains__(self, key):
+    return key in self.index
+
+  def Keys(self):
+    return self.index.keys()
+
+  # Returns the StoreTile for the degree tile key. Raises KeyError if the
+  # store has no such tile.
+  def Tile(self, key):
+    return StoreTile(self.filename, self.directory[self.index[key]])
+
+# Returns a dict of degree tile key to a function which reads the tile,
+# returning its parsed header and float32 raster. Sources are the GridFloat
+# zip files and extracted .flt/.hdr files in the directory. As in NedIndexer,
+# the newer usgs_ned_* data is preferred over the older float* data when both
+# cover a tile.
+def FindSources(directory):
+  candidates = []
+  for f in sorted(os.listdir(directory)):
+    path = os.path.join(directory, f)
+    if f.endswith('.flt') and os.path.exists(gridfloat.HeaderFilename(path)):
+      candidates.append((f.lower(), _FltReader(path)))
+    elif f.endswith('.zip'):
+      zf = zipfile.ZipFile(path, 'r')
+      names = zf.namelist()
+      for name in names:
+        # Skip the same metadata and subdirectory entries as extract_ned.py.
+        if (not name.endswith('.flt') or '/' in name or
+            'meta' in name or 'arcsec' in name):
+          continue
+        hdr_name = gridfloat.HeaderFilename(name)
+        if hdr_name in names:
+          candidates.append((name.lower(), _ZipReader(path, name, hdr_name)))
+      zf.close()
+
+  candidates.sort(key=lambda c: c[0])
+  sources = {}
+  for name, reader in candidates:
+    k, is_float = gridfloat.NedTileKey(name)
+    if not k:
+      continue
+    if k in sources and is_float:
+      continue
+    sources[k] = reader
+  return sources
+
+def _FltReader(flt_filename):
+  def Read():
+    tile = gridfloat.GridFloatTile(flt_filename)
+    return tile.header, numpy.asarray(tile.data)
+  return Read
+
+def _ZipReader(zip_filename, flt_name, hdr_name):
+  def Read():
+    zf = zipfile.ZipFile(zip_filename, 'r')
+    hdr = gridfloat.ParseHeader(zf.read(hdr_name), hdr_name)
+    data = numpy.frombuffer(zf.read(flt_name), dtype=gridfloat.DataType(hdr))
+    zf.close()
+    return hdr, data.reshape(hdr['nrows'], hdr['ncols'])
+  return Read
+
+# Returns (encoding, base, block) for a float raster. The int16 decimeter
+# encoding is used when requested and the elevation span of the tile fits;
+# otherwise the tile is stored as float32.
+def _EncodeTile(data, nodata, use_int16):
+  if use_int16:
+    valid = numpy.ones(data.shape, dtype=bool)
+    if nodata is not None:
+      valid = (data != nodata)
+    if not valid.any():
+      return ENCODING_INT16_DM, 0.0, numpy.full(data.shape, INT16_NODATA, '<i2')
+    lo = float(data[valid].min())
+    hi = float(data[valid].max())
+    base = round(0.5 * (lo + hi), 1)
+    if (hi - base) * 10.0 < 32767 and (base - lo) * 10.0 < 32767:
+      block = numpy.round((data - base) * 10.0).astype('<i2')
+      block[~valid] = INT16_NODATA
+      return ENCODING_INT16_DM, base, block
+  return ENCODING_FLOAT32, 0.0, data.astype('<f4')
+
+# Builds a terrain store at output_filename from the NED tiles found in
+# source_directory. If use_int16 is set, tiles are stored as int16 decimeters,
+# halving the size of the store at a quantization error of at most 5 cm.
+def BuildTerrainStore(source_directory, output_filename, use_int16=False):
+  sources = FindSources(source_directory)
+  keys = sorted(sources.keys())
+  print 'Building terrain store %s from %d tiles' % (output_filename, len(keys))
+
+  directory = numpy.zeros(len(keys), dtype=DIRECTORY_DTYPE)
+  header = numpy.zeros(1, dtype=HEADER_DTYPE)
+  header[0]['magic'] = MAGIC
+  header[0]['version'] = VERSION
+  header[0]['num_tiles'] = len(keys)
+
+  tmp_filename = output_filename + '.tmp'
+  with open(tmp_filename, 'wb') as f:
+    header.tofile(f)
+    directory.tofile(f)  # placeholder, rewritten once offsets are known
+
+    for i, k in enumerate(keys):
+      print '  adding tile %s' % k
+      hdr, data = sources[k]()
+      nodata = hdr.get('nodata_value', None)
+      encoding, base, block = _EncodeTile(data, nodata, use_int16)
+      txf = gridfloat.GeoTransform(hdr)
+      lat, lng = k.split('.')
+
+      offset = f.tell()
+      if offset % BLOCK_ALIGNMENT:
+        offset += BLOCK_ALIGNMENT - offset % BLOCK_ALIGNMENT
+        f.seek(offset)
+
+      entry = directory[i]
+      entry['lat'] = int(lat)
+      entry['lng'] = int(lng)
+      entry['nrows'] = hdr['nrows']
+      entry['ncols'] = hdr['ncols']
+      entry['encoding'] = encoding
+      entry['ulx'] = txf[0]
+      entry['uly'] = txf[3]
+      entry['cellsize'] = txf[1]
+      entry['nodata'] = nodata if nodata is not None else -9999.0
+      entry['base'] = base
+      entry['data_offset'] = offset
+      block.tofile(f)
+
+    f.seek(HEADER_DTYPE.itemsize)
+    directory.tofile(f)
+
+  os.rename(tmp_filename, output_filename)
+  print 'Wrote terrain store %s' % output_filename
+
+# If run directly, builds the store. Arguments are the directory containing
+# the NED zip (or extracted) files, optionally followed by the output filename
+# and --int16 to select the compact encoding.
+if __name__ == '__main__':
+  args = [a for a in sys.argv[1:] if not a.startswith('--')]
+  if args:
+    nedDir = args[0]
+  else:
+    dir = os.path.dirname(os.path.realpath(__file__))
+    rootDir = os.path.dirname(os.path.dirname(dir))
+    nedDir = os.path.join(os.path.join(rootDir, 'data'), 'ned')
+  if len(args) > 1:
+    output = args[1]
+  else:
+    output = os.path.join(nedDir, STORE_FILENAME)
+
+  BuildTerrainStore(nedDir, output, use_int16=('--int16' in sys.argv))
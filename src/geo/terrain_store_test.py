@@ -0,0 +1,144 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import gridfloat
+import terrain_store
+
+HEADER = """ncols         %d
+nrows         %d
+xllcorner     %.10f
+yllcorner     %.10f
+cellsize      %.10f
+NODATA_value  -9999
+byteorder     LSBFIRST
+"""
+
+# Returns the header text of a tile of n x n samples covering the degree
+# tile whose north-west corner is (lat, lng).
+def TileHeader(lat, lng, n):
+  cellsize = 1.0 / n
+  return HEADER % (n, n, lng, lat - 1, cellsize)
+
+class TestTerrainStore(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.store_filename = os.path.join(self.dir, 'test.store')
+    rand = numpy.random.RandomState(7)
+    self.tiles = {}
+    # An extracted tile with a nodata sample, and a zipped tile.
+    data = rand.uniform(-50, 3000, (10, 10)).astype(numpy.float32)
+    data[3, 4] = -9999
+    self.WriteFlt('usgs_ned_1_n40w106_gridfloat.flt', 40, -106, data)
+    self.tiles['40.-106'] = data
+    data = rand.uniform(0, 100, (10, 10)).astype(numpy.float32)
+    self.WriteZip('n41w106.zip', 'usgs_ned_1_n41w106_gridfloat.flt',
+                  41, -106, data)
+    self.tiles['41.-106'] = data
+    # The older float* data is superseded by the usgs_ned tile.
+    self.WriteFlt('floatn40w106_1.flt', 40, -106,
+                  numpy.zeros((10, 10), numpy.float32))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def WriteFlt(self, name, lat, lng, data):
+    flt = os.path.join(self.dir, name)
+    with open(gridfloat.HeaderFilename(flt), 'w') as f:
+      f.write(TileHeader(lat, lng, data.shape[0]))
+    data.astype('<f4').tofile(flt)
+
+  def WriteZip(self, zip_name, name, lat, lng, data):
+    zf = zipfile.ZipFile(os.path.join(self.dir, zip_name), 'w')
+    zf.writestr(gridfloat.HeaderFilename(name),
+                TileHeader(lat, lng, data.shape[0]))
+    zf.writestr(name, data.astype('<f4').tostring())
+    zf.close()
+
+  def AllValues(self, tile):
+    rows, cols = numpy.indices(tile.data.shape)
+    return tile.Values(rows.ravel(), cols.ravel()).reshape(tile.data.shape)
+
+  def test_layout(self):
+    terrain_store.BuildTerrainStore(self.dir, self.store_filename)
+    store = terrain_store.TerrainStore(self.store_filename)
+    self.assertEquals(['40.-106', '41.-106'], sorted(store.Keys()))
+    self.assertTrue('40.-106' in store)
+    self.assertFalse('42.-106' in store)
+    self.assertEquals(2, len(store.directory))
+    for entry in store.directory:
+      self.assertEquals(0, entry['data_offset'] % terrain_store.BLOCK_ALIGNMENT)
+      self.assertEquals(10, entry['nrows'])
+      self.assertEquals(10, entry['ncols'])
+      self.assertEquals(-106, entry['lng'])
+      self.assertEquals(terrain_store.ENCODING_FLOAT32, entry['encoding'])
+    self.assertEquals(os.path.getsize(self.store_filename),
+                      store.directory[-1]['data_offset'] + 400)
+    self.assertFalse(os.path.exists(self.store_filename + '.tmp'))
+    self.assertRaises(KeyError, store.Tile, '42.-106')
+
+  def test_float32_values(self):
+    terrain_store.BuildTerrainStore(self.dir, self.store_filename)
+    store = terrain_store.TerrainStore(self.store_filename)
+    for k, data in self.tiles.items():
+      tile = store.Tile(k)
+      self.assertEquals(data.tolist(), self.AllValues(tile).tolist())
+      src = gridfloat.GridFloatTile(os.path.join(
+          self.dir, 'usgs_ned_1_n40w106_gridfloat.flt'))
+      if k == '40.-106':
+        for a, b in zip(src.inv_txf, tile.inv_txf):
+          self.assertAlmostEqual(a, b, 9)
+
+  def test_int16_values(self):
+    terrain_store.BuildTerrainStore(self.dir, self.store_filename,
+                                    use_int16=True)
+    store = terrain_store.TerrainStore(self.store_filename)
+    for k, data in self.tiles.items():
+      tile = store.Tile(k)
+      self.assertEquals(terrain_store.ENCODING_INT16_DM, tile.encoding)
+      self.assertEquals(numpy.int16, tile.data.dtype)
+      values = self.AllValues(tile)
+      valid = data != -9999
+      error = numpy.abs(values[valid] - data[valid])
+      self.assertTrue(numpy.all(error < 0.05 + 1e-6))
+      self.assertTrue(numpy.all(values[~valid] == -9999))
+    values = store.Tile('40.-106').Values(numpy.array([3, 3]),
+                                          numpy.array([4, 5]))
+    self.assertEquals(-9999, values[0])
+    self.assertAlmostEqual(self.tiles['40.-106'][3, 5], values[1], delta=0.051)
+
+  def test_int16_wide_span(self):
+    # Tiles whose span does not fit int16 decimeters fall back to float32.
+    data = numpy.zeros((10, 10), numpy.float32)
+    data[0, 0] = 7000
+    self.WriteFlt('usgs_ned_1_n40w106_gridfloat.flt', 40, -106, data)
+    terrain_store.BuildTerrainStore(self.dir, self.store_filename,
+                                    use_int16=True)
+    tile = terrain_store.TerrainStore(self.store_filename).Tile('40.-106')
+    self.assertEquals(terrain_store.ENCODING_FLOAT32, tile.encoding)
+    self.assertEquals(data.tolist(), self.AllValues(tile).tolist())
+
+  def test_bad_magic(self):
+    with open(self.store_filename, 'wb') as f:
+      f.write('x' * 64)
+    self.assertRaises(Exception, terrain_store.TerrainStore,
+                      self.store_filename)
+
+if __name__ == '__main__':
+  unittest.main()
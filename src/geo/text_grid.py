@@ -0,0 +1,55 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# Loads the whitespace separated text grids of the ITU data files, such as
+# n050.txt and TropoClim.txt. Parsing the text takes far longer than using
+# the data, so on first load each grid is converted to a .npy file next to
+# the text file, and later loads memory-map the .npy file. The .npy file is
+# rebuilt whenever the text file is newer. If the directory is not writable
+# the parsed grid is used directly.
+
+import numpy
+import os
+
+# Returns the default directory of the ITU data files, data/itu in the
+# repository.
+def DefaultItuDirectory():
+  dir = os.path.dirname(os.path.realpath(__file__))
+  rootDir = os.path.dirname(os.path.dirname(dir))
+  return os.path.join(os.path.join(rootDir, 'data'), 'itu')
+
+# Returns the filename of the binary copy of a text grid.
+def BinaryFilename(txt_filename):
+  return os.path.splitext(txt_filename)[0] + '.npy'
+
+# Returns the grid in txt_filename as a read-only array of the given dtype,
+# converting it to a .npy file first if needed.
+def LoadGrid(txt_filename, dtype=numpy.float64):
+  npy_filename = BinaryFilename(txt_filename)
+  if (os.path.exists(npy_filename) and
+      os.path.getmtime(npy_filename) >= os.path.getmtime(txt_filename)):
+    data = numpy.load(npy_filename, mmap_mode='r')
+    if data.dtype == dtype:
+      return data
+
+  data = numpy.loadtxt(txt_filename, dtype=dtype)
+  tmp_filename = '%s.%d.tmp.npy' % (os.path.splitext(npy_filename)[0],
+                                    os.getpid())
+  try:
+    numpy.save(tmp_filename, data)
+    os.rename(tmp_filename, npy_filename)
+  except (IOError, OSError), err:
+    print 'Could not save binary grid %s: %s' % (npy_filename, err)
+    return data
+  return numpy.load(npy_filename, mmap_mode='r')
@@ -0,0 +1,81 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import numpy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import refractivity
+import text_grid
+import tropoClim
+
+class TestLoadGrid(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.txt = os.path.join(self.dir, 'grid.txt')
+    with open(self.txt, 'w') as f:
+      f.write('1.5 2.5 3.5\n4.5 5.5 6.5\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_converts_once(self):
+    data = text_grid.LoadGrid(self.txt)
+    self.assertEquals([[1.5, 2.5, 3.5], [4.5, 5.5, 6.5]], data.tolist())
+    npy = text_grid.BinaryFilename(self.txt)
+    self.assertTrue(os.path.exists(npy))
+    # The binary copy is used while it is newer than the text.
+    numpy.save(npy, numpy.zeros((2, 3)))
+    self.assertEquals(0, text_grid.LoadGrid(self.txt).sum())
+
+  def test_rebuilds_stale_copy(self):
+    npy = text_grid.BinaryFilename(self.txt)
+    numpy.save(npy, numpy.zeros((2, 3)))
+    t = time.time()
+    os.utime(npy, (t - 10, t - 10))
+    os.utime(self.txt, (t, t))
+    self.assertEquals(24.0, text_grid.LoadGrid(self.txt).sum())
+
+  def test_dtype(self):
+    with open(self.txt, 'w') as f:
+      f.write('1 2\n3 4\n')
+    data = text_grid.LoadGrid(self.txt, dtype=numpy.int)
+    self.assertEquals(numpy.int, data.dtype)
+    self.assertEquals(10, data.sum())
+
+class TestItuBatches(unittest.TestCase):
+  def setUp(self):
+    rng = numpy.random.RandomState(5)
+    self.lats = rng.uniform(-88, 88, 500)
+    self.lons = rng.uniform(-179, 179, 500)
+
+  def test_refractivity_batch(self):
+    indx = refractivity.GetRefractivityIndexer()
+    self.assertTrue(indx is refractivity.GetRefractivityIndexer())
+    r = indx.RefractivityBatch(self.lats, self.lons)
+    for i in range(len(self.lats)):
+      self.assertAlmostEqual(indx.Refractivity(self.lats[i], self.lons[i]),
+                             r[i], 9)
+
+  def test_climate_batch(self):
+    indx = tropoClim.GetClimateIndexer()
+    self.assertTrue(indx is tropoClim.GetClimateIndexer())
+    c = indx.TropoClimBatch(self.lats, self.lons)
+    for i in range(len(self.lats)):
+      self.assertEquals(indx.TropoClim(self.lats[i], self.lons[i]), c[i])
+
+if __name__ == '__main__':
+  unittest.main()
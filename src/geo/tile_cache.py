@@ -0,0 +1,179 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module contains the tile cache shared by the terrain and land cover
+# indexers. Tiles are kept in least-recently-used order and evicted from the
+# cold end whenever the total size of the cached tiles exceeds a memory
+# budget given in bytes. Lookups, insertions and evictions are O(1). The
+# cache may be used from several threads; concurrent requests for a tile
+# which is being loaded wait for that load instead of repeating it.
+#
+# Example use:
+#   cache = TileCache(max_bytes=512 * 1024 * 1024)
+#   tile = cache.GetOrLoad(key, lambda: (LoadTile(key), tile_size_bytes))
+#   cache.Pin(key)      # never evict this tile
+#   print cache.Stats()
+
+import collections
+import threading
+import time
+
+# Default memory budget for a tile cache: room for about ten NED degree
+# tiles.
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+class TileCache:
+  def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+    self.max_bytes = max_bytes
+    self.current_bytes = 0
+    # Maps key -> (tile, nbytes, on_evict). The first entry is the least
+    # recently used.
+    self.tiles = collections.OrderedDict()
+    self.pinned = set()
+    # Maps key -> threading.Event for tiles currently being loaded.
+    self.loading = {}
+    self.lock = threading.RLock()
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.load_seconds = 0.0
+
+  def __contains__(self, key):
+    return key in self.tiles
+
+  def __len__(self):
+    return len(self.tiles)
+
+  # Returns the cached keys, least recently used first.
+  def Keys(self):
+    with self.lock:
+      return self.tiles.keys()
+
+  # Returns the tile for key, or None if it is not cached. A found tile
+  # becomes the most recently used.
+  def Get(self, key):
+    with self.lock:
+      entry = self.tiles.pop(key, None)
+      if entry is None:
+        self.misses += 1
+        return None
+      self.tiles[key] = entry
+      self.hits += 1
+      return entry[0]
+
+  # Returns the tile for key, calling loader() on a miss. The loader must
+  # return a (tile, nbytes) tuple; the loaded tile is added to the cache. If
+  # given, on_evict is passed to Put. The loader runs without holding the
+  # cache lock; other threads asking for the same tile wait for it.
+  def GetOrLoad(self, key, loader, on_evict=None):
+    while True:
+      with self.lock:
+        entry = self.tiles.pop(key, None)
+        if entry is not None:
+          self.tiles[key] = entry
+          self.hits += 1
+          return entry[0]
+        event = self.loading.get(key)
+        if event is None:
+          event = threading.Event()
+          self.loading[key] = event
+          self.misses += 1
+          break
+      # Another thread is loading the tile. If its load fails, retry here.
+      event.wait()
+
+    try:
+      start = time.time()
+      tile, nbytes = loader()
+      with self.lock:
+        self.load_seconds += time.time() - start
+        self.Put(key, tile, nbytes, on_evict)
+    finally:
+      with self.lock:
+        del self.loading[key]
+      event.set()
+    return tile
+
+  # Adds a tile taking nbytes of memory to the cache as the most recently
+  # used entry, evicting least recently used unpinned tiles as needed to
+  # stay within the budget. The tile just added is never evicted by its own
+  # insertion, even if it is larger than the whole budget. If given,
+  # on_evict(key, tile) is called when the tile leaves the cache.
+  def Put(self, key, tile, nbytes, on_evict=None):
+    with self.lock:
+      self._Drop(key)
+      self.tiles[key] = (tile, nbytes, on_evict)
+      self.current_bytes += nbytes
+      self._Evict(key)
+
+  # Removes the tile for key from the cache, if present.
+  def Remove(self, key):
+    with self.lock:
+      self._Drop(key)
+      self.pinned.discard(key)
+
+  def _Drop(self, key):
+    entry = self.tiles.pop(key, None)
+    if entry is None:
+      return
+    tile, nbytes, on_evict = entry
+    self.current_bytes -= nbytes
+    if on_evict is not None:
+      on_evict(key, tile)
+
+  # Pins a cached tile so that it is never evicted. Raises KeyError if the
+  # tile is not in the cache.
+  def Pin(self, key):
+    with self.lock:
+      if key not in self.tiles:
+        raise KeyError('Cannot pin tile %s which is not cached' % str(key))
+      self.pinned.add(key)
+
+  # Makes a pinned tile evictable again.
+  def Unpin(self, key):
+    with self.lock:
+      self.pinned.discard(key)
+      self._Evict(None)
+
+  # Evicts least recently used unpinned tiles (other than keep_key) until
+  # the cache is within its budget. Only pinned tiles are skipped over, so
+  # the common case touches just the head of the LRU order.
+  def _Evict(self, keep_key):
+    while self.current_bytes > self.max_bytes:
+      victim = None
+      for key in self.tiles:
+        if key != keep_key and key not in self.pinned:
+          victim = key
+          break
+      if victim is None:
+        return
+      print 'Evicting tile %s' % str(victim)
+      self._Drop(victim)
+      self.evictions += 1
+
+  # Returns a dict of counters describing the cache, suitable for logging or
+  # scraping by a monitoring system.
+  def Stats(self):
+    with self.lock:
+      return {
+        'tiles': len(self.tiles),
+        'pinned': len(self.pinned),
+        'bytes': self.current_bytes,
+        'max_bytes': self.max_bytes,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'load_seconds': self.load_seconds,
+      }
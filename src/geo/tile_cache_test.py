@@ -0,0 +1,72 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import tile_cache
+import unittest
+
+class TestTileCache(unittest.TestCase):
+  def test_evicts_least_recently_used(self):
+    cache = tile_cache.TileCache(max_bytes=30)
+    cache.Put('a', 'A', 10)
+    cache.Put('b', 'B', 10)
+    cache.Put('c', 'C', 10)
+    self.assertEquals('A', cache.Get('a'))
+    cache.Put('d', 'D', 10)
+    self.assertFalse('b' in cache)
+    self.assertEquals(['c', 'a', 'd'], cache.Keys())
+    self.assertEquals(30, cache.current_bytes)
+    self.assertEquals(1, cache.evictions)
+
+  def test_get_or_load(self):
+    cache = tile_cache.TileCache(max_bytes=100)
+    loads = []
+    def Loader():
+      loads.append(1)
+      return 'tile', 10
+    self.assertEquals('tile', cache.GetOrLoad('k', Loader))
+    self.assertEquals('tile', cache.GetOrLoad('k', Loader))
+    self.assertEquals(1, len(loads))
+    stats = cache.Stats()
+    self.assertEquals(1, stats['hits'])
+    self.assertEquals(1, stats['misses'])
+    self.assertEquals(10, stats['bytes'])
+
+  def test_pinned_tiles_are_kept(self):
+    cache = tile_cache.TileCache(max_bytes=20)
+    cache.Put('a', 'A', 10)
+    cache.Pin('a')
+    cache.Put('b', 'B', 10)
+    cache.Put('c', 'C', 10)
+    self.assertTrue('a' in cache)
+    self.assertFalse('b' in cache)
+    cache.Unpin('a')
+    cache.Put('d', 'D', 10)
+    self.assertFalse('a' in cache)
+    self.assertRaises(KeyError, cache.Pin, 'a')
+
+  def test_on_evict_callback(self):
+    cache = tile_cache.TileCache(max_bytes=10)
+    evicted = []
+    cache.Put('a', 'A', 10, lambda k, t: evicted.append((k, t)))
+    cache.Put('b', 'B', 10)
+    self.assertEquals([('a', 'A')], evicted)
+
+  def test_oversized_tile_is_kept(self):
+    cache = tile_cache.TileCache(max_bytes=10)
+    cache.Put('a', 'A', 5)
+    cache.Put('b', 'B', 50)
+    self.assertEquals(['b'], cache.Keys())
+
+if __name__ == '__main__':
+  unittest.main()
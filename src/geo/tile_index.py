@@ -0,0 +1,51 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# This module contains a uniform lat/lng grid index over the bounding boxes
+# of raster tiles. Each tile is registered in every grid cell its bounding
+# box overlaps, so finding the tiles which may contain a point is a single
+# dict lookup, after which only those one or two candidates need an exact
+# containment test.
+#
+# Example use:
+#   index = TileGridIndex()
+#   index.Add(tile, min_lat, max_lat, min_lng, max_lng)
+#   for tile in index.Candidates(lat, lng):
+#     if tile.WithinTile(lat, lng): ...
+
+import math
+
+class TileGridIndex:
+  def __init__(self, cell_degrees=1.0):
+    self.cell_degrees = cell_degrees
+    # Maps (row, col) grid cell to the list of keys of tiles overlapping it,
+    # in the order they were added.
+    self.cells = {}
+
+  def _Cell(self, lat, lng):
+    return (int(math.floor(lat / self.cell_degrees)),
+            int(math.floor(lng / self.cell_degrees)))
+
+  # Registers key for the tile with the given lat/lng bounding box.
+  def Add(self, key, min_lat, max_lat, min_lng, max_lng):
+    row0, col0 = self._Cell(min_lat, min_lng)
+    row1, col1 = self._Cell(max_lat, max_lng)
+    for row in range(row0, row1 + 1):
+      for col in range(col0, col1 + 1):
+        self.cells.setdefault((row, col), []).append(key)
+
+  # Returns the keys of the tiles whose bounding boxes overlap the grid cell
+  # containing lat/lng. Tiles which contain the point are among them.
+  def Candidates(self, lat, lng):
+    return self.cells.get(self._Cell(lat, lng), [])
@@ -0,0 +1,46 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import unittest
+
+import tile_index
+
+class TestTileGridIndex(unittest.TestCase):
+  def test_candidates(self):
+    index = tile_index.TileGridIndex()
+    index.Add('a', 30.5, 32.5, -100.5, -98.2)
+    index.Add('b', 32.1, 34.0, -99.0, -97.0)
+    self.assertEquals(['a'], index.Candidates(31.0, -100.0))
+    self.assertEquals(['a', 'b'], index.Candidates(32.9, -98.5))
+    self.assertEquals(['b'], index.Candidates(33.5, -97.5))
+    self.assertEquals([], index.Candidates(40.0, -100.0))
+
+  def test_negative_and_fractional_cells(self):
+    index = tile_index.TileGridIndex(cell_degrees=0.5)
+    index.Add('c', -10.2, -10.1, 170.1, 170.3)
+    self.assertEquals(['c'], index.Candidates(-10.15, 170.2))
+    self.assertEquals([], index.Candidates(-9.9, 170.2))
+
+  def test_cell_edges(self):
+    # A tile whose bounds end on a cell edge is also a candidate in the next
+    # cell, where points on that edge fall.
+    index = tile_index.TileGridIndex()
+    index.Add('d', 39.0, 40.0, -101.0, -100.0)
+    self.assertEquals(['d'], index.Candidates(40.0, -100.5))
+    self.assertEquals(['d'], index.Candidates(39.5, -100.0))
+    self.assertEquals(['d'], index.Candidates(39.0, -101.0))
+    self.assertEquals([], index.Candidates(38.99, -100.5))
+    self.assertEquals([], index.Candidates(39.5, -101.01))
+
+if __name__ == '__main__':
+  unittest.main()
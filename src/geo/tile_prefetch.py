@@ -0,0 +1,150 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+# Helpers for prefetching the degree tiles needed by a batch of paths. For
+# each (lat1, lng1, lat2, lng2) path the set of degree tiles its terrain
+# profile will touch is computed up front from the great circle route, the
+# paths are ordered so that paths sharing tiles run next to each other, and
+# a pool of background threads loads the tiles ahead of use.
+
+import collections
+import math
+import Queue
+import threading
+
+import vincenty
+
+# Spacing (km) of the points used to trace a path across degree tiles.
+PATH_TRACE_STEP_KM = 10.0
+
+# Returns the sorted list of (lat, lng) degree tiles, identified by the
+# northwest corner as in the NED tile keys, which the vincenty route between
+# the two points passes through. The route is traced with points every
+# PATH_TRACE_STEP_KM, and every tile within the lat/lng bounding box of each
+# pair of consecutive points is included, so tiles clipped by the route
+# between trace points are not missed.
+def PathTiles(lat1, lng1, lat2, lng2):
+  d, az, raz = vincenty.dist_bear_vincenty(lat1, lng1, lat2, lng2)
+  n = max(int(math.ceil(d / PATH_TRACE_STEP_KM)), 1)
+  pts = [(lat1, lng1)]
+  for i in range(1, n):
+    lat, lng, az_n = vincenty.to_dist_bear_vincenty(lat1, lng1, d * i / n, az)
+    pts.append((lat, lng))
+  pts.append((lat2, lng2))
+
+  tiles = set()
+  for i in range(len(pts) - 1):
+    lat_a, lng_a = pts[i]
+    lat_b, lng_b = pts[i + 1]
+    for lat in range(int(math.ceil(min(lat_a, lat_b))),
+                     int(math.ceil(max(lat_a, lat_b))) + 1):
+      for lng in range(int(math.floor(min(lng_a, lng_b))),
+                       int(math.floor(max(lng_a, lng_b))) + 1):
+        tiles.add((lat, lng))
+  return sorted(tiles)
+
+# Returns the indices of the paths, given the tile list of each path, in an
+# order which keeps paths touching the same tiles together: paths are sorted
+# by their tile lists, so a run of paths reuses the same resident tiles
+# rather than cycling through the cache.
+def LocalityOrder(path_tiles):
+  return sorted(range(len(path_tiles)), key=lambda i: path_tiles[i])
+
+# A pool of daemon threads which call load(key) for each key added with Add.
+# Keys are loaded in the order they are added. A key is not queued again
+# while it is waiting to be loaded, but may be added again once loaded (for
+# instance after its tile has been evicted).
+class TilePrefetcher:
+  def __init__(self, load, num_threads=2):
+    self.load = load
+    self.queue = Queue.Queue()
+    # Keys queued and not yet picked up by a thread.
+    self.pending = set()
+    self.lock = threading.Lock()
+    self.errors = []
+    self.threads = []
+    for i in range(num_threads):
+      t = threading.Thread(target=self._Run)
+      t.daemon = True
+      t.start()
+      self.threads.append(t)
+
+  # Queues the key for loading, unless it is already waiting.
+  def Add(self, key):
+    with self.lock:
+      if key in self.pending:
+        return
+      self.pending.add(key)
+    self.queue.put(key)
+
+  # Blocks until all queued keys have been loaded.
+  def Wait(self):
+    self.queue.join()
+
+  # Stops the threads. Keys which no thread has started loading are dropped,
+  # so this only waits for the loads in progress; call Wait first to load
+  # every queued key.
+  def Close(self):
+    with self.lock:
+      self.pending.clear()
+    for t in self.threads:
+      self.queue.put(None)
+    for t in self.threads:
+      t.join()
+
+  def _Run(self):
+    while True:
+      key = self.queue.get()
+      try:
+        if key is None:
+          return
+        with self.lock:
+          if key not in self.pending:
+            continue  # dropped by Close
+          self.pending.discard(key)
+        self.load(key)
+      except Exception, err:
+        # The caller will hit the same error, synchronously, on first use.
+        self.errors.append((key, err))
+      finally:
+        self.queue.task_done()
+
+# Yields the given paths reordered by LocalityOrder, while a TilePrefetcher
+# calls load(key) in background threads for the tiles of the next lookahead
+# paths. path_tiles gives the list of tile keys of each path. A tile is
+# queued when it enters the lookahead window, so a tile which leaves the
+# window and is needed again later is loaded again if it was evicted. When
+# the caller stops early (or closes the generator), tiles not yet being
+# loaded are dropped rather than read.
+def PrefetchPaths(paths, path_tiles, load, lookahead, num_threads):
+  order = LocalityOrder(path_tiles)
+  prefetcher = TilePrefetcher(load, num_threads)
+  # Number of paths in the window [n, queued) which touch each tile.
+  window = collections.Counter()
+  try:
+    queued = 0
+    for n in range(len(order)):
+      while queued < len(order) and queued <= n + lookahead:
+        for key in path_tiles[order[queued]]:
+          if not window[key]:
+            prefetcher.Add(key)
+          window[key] += 1
+        queued += 1
+      yield paths[order[n]]
+      for key in path_tiles[order[n]]:
+        window[key] -= 1
+        if not window[key]:
+          del window[key]
+  finally:
+    prefetcher.Close()
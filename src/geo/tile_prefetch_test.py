@@ -0,0 +1,123 @@
+#    Copyright 2017 SAS Project Authors. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import threading
+import time
+import unittest
+
+import tile_prefetch
+
+class TestTilePrefetch(unittest.TestCase):
+  def test_path_within_tile(self):
+    self.assertEquals([(40, -106)],
+                      tile_prefetch.PathTiles(39.2, -105.8, 39.7, -105.1))
+
+  def test_path_across_tiles(self):
+    tiles = tile_prefetch.PathTiles(39.5, -105.5, 40.5, -104.5)
+    self.assertTrue((40, -106) in tiles)
+    self.assertTrue((41, -105) in tiles)
+    for lat, lng in tiles:
+      self.assertTrue(lat in (40, 41))
+      self.assertTrue(lng in (-106, -105))
+
+  def test_locality_order(self):
+    path_tiles = [[(41, -105)], [(40, -106)], [(41, -105)], [(40, -106)]]
+    self.assertEquals([1, 3, 0, 2], tile_prefetch.LocalityOrder(path_tiles))
+
+  def test_prefetcher_loads_each_waiting_key_once(self):
+    started = threading.Event()
+    release = threading.Event()
+    loaded = []
+    def Load(key):
+      started.set()
+      release.wait()
+      loaded.append(key)
+    prefetcher = tile_prefetch.TilePrefetcher(Load, num_threads=1)
+    prefetcher.Add('x')
+    started.wait()
+    for key in ['a', 'b', 'a', 'c', 'b']:
+      prefetcher.Add(key)
+    release.set()
+    prefetcher.Wait()
+    prefetcher.Close()
+    self.assertEquals(['x', 'a', 'b', 'c'], loaded)
+
+  def test_prefetcher_loads_again_after_load(self):
+    loaded = []
+    prefetcher = tile_prefetch.TilePrefetcher(loaded.append, num_threads=1)
+    prefetcher.Add('a')
+    prefetcher.Wait()
+    prefetcher.Add('a')
+    prefetcher.Wait()
+    prefetcher.Close()
+    self.assertEquals(['a', 'a'], loaded)
+
+  def test_close_drops_pending_keys(self):
+    started = threading.Event()
+    release = threading.Event()
+    loaded = []
+    def Load(key):
+      started.set()
+      release.wait()
+      loaded.append(key)
+    prefetcher = tile_prefetch.TilePrefetcher(Load, num_threads=1)
+    for key in range(100):
+      prefetcher.Add(key)
+    started.wait()
+    threading.Timer(0.05, release.set).start()
+    prefetcher.Close()
+    self.assertEquals([0], loaded)
+
+  def test_prefetch_paths(self):
+    paths = [(0, 'b'), (1, 'a'), (2, 'b'), (3, 'c'), (4, 'a')]
+    path_tiles = [[p[1]] for p in paths]
+    loaded = []
+    lock = threading.Lock()
+    def Load(key):
+      with lock:
+        loaded.append(key)
+    result = []
+    for path in tile_prefetch.PrefetchPaths(paths, path_tiles, Load,
+                                            lookahead=1, num_threads=1):
+      time.sleep(0.01)
+      result.append(path)
+    self.assertEquals([1, 4, 0, 2, 3], [p[0] for p in result])
+    self.assertEquals(['a', 'b', 'c'], sorted(loaded))
+
+    # A tile which leaves the window and comes back is queued again.
+    del loaded[:]
+    path_tiles = [['a', 'c'], ['b'], ['c']]
+    for path in tile_prefetch.PrefetchPaths(range(3), path_tiles, Load,
+                                            lookahead=0, num_threads=1):
+      time.sleep(0.01)
+    self.assertEquals(['a', 'b', 'c', 'c'], sorted(loaded))
+
+  def test_prefetch_paths_closed_early(self):
+    release = threading.Event()
+    loaded = []
+    def Load(key):
+      release.wait()
+      loaded.append(key)
+    paths = range(50)
+    path_tiles = [[i] for i in paths]
+    prefetch = tile_prefetch.PrefetchPaths(paths, path_tiles, Load,
+                                           lookahead=40, num_threads=1)
+    self.assertEquals(0, prefetch.next())
+    threading.Timer(0.05, release.set).start()
+    prefetch.close()
+    # Only the tile being loaded when the generator closed was read.
+    self.assertEquals([0], loaded)
+
+if __name__ == '__main__':
+  unittest.main()
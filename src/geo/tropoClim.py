@@ -21,10 +21,17 @@
 #   result = climate.TropoClim(19.66, -155.55)
 #   result = climate.TropoClim(39.2, -77.1)
 #   ...
+#
+# The data file is parsed once and cached as TropoClim.npy (see
+# text_grid.py). GetClimateIndexer returns an indexer shared by the whole
+# process.
 
 import numpy
 import os
 import sys
+import threading
+
+import text_grid
 
 class ClimateIndexer:
   def __init__(self, directory):
@@ -34,7 +41,7 @@ class ClimateIndexer:
     self.LATSTART = 89.75 # Latitude corresponding to first row of file (deg)
     self.LONSTART = -179.75 # Longitude corresponding to first column of file (deg)
     self.DLAT = self.DLON = 0.5 # Spacing between lat/lon rows/columns (deg)
-    self.CLIMATEDATA = numpy.loadtxt(datafile, dtype=numpy.int)
+    self.CLIMATEDATA = text_grid.LoadGrid(datafile, dtype=numpy.int)
     print 'Loaded climate data from %s' % datafile
 
   def TropoClim(self, lat, lon):
@@ -54,6 +61,17 @@ class ClimateIndexer:
 
     return climate
 
+  # Returns an array of the ITU climate zone at each of the given arrays of
+  # lats and lons, as in TropoClim.
+  def TropoClimBatch(self, lats, lons):
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lons = numpy.asarray(lons, dtype=numpy.float64)
+    irow = numpy.trunc((self.LATSTART - lats)/self.DLAT + 0.5).astype(int)
+    icol = numpy.trunc((lons - self.LONSTART)/self.DLON + 0.5).astype(int)
+
+    climate = self.CLIMATEDATA[irow, icol]
+    return numpy.where(climate == 0, 7, climate)
+
   def ClimateZoneName(self, zone):
     if zone == 1:
       return 'Equatorial'
@@ -71,12 +89,24 @@ class ClimateIndexer:
       return 'Maritime Temperate, Over Sea'
     return 'Unknown'
 
-if __name__ == '__main__':
-  dir = os.path.dirname(os.path.realpath(__file__))
-  rootDir = os.path.dirname(os.path.dirname(dir))
-  ituDir = os.path.join(os.path.join(rootDir, 'data'), 'itu')
+# Indexers shared by GetClimateIndexer, by data directory.
+_INDEXERS = {}
+_INDEXERS_LOCK = threading.Lock()
 
-  indx = ClimateIndexer(ituDir)
+# Returns the process-wide ClimateIndexer for the directory (by default
+# data/itu), creating it on first use.
+def GetClimateIndexer(directory=None):
+  if directory is None:
+    directory = text_grid.DefaultItuDirectory()
+  with _INDEXERS_LOCK:
+    indexer = _INDEXERS.get(directory)
+    if indexer is None:
+      indexer = ClimateIndexer(directory)
+      _INDEXERS[directory] = indexer
+    return indexer
+
+if __name__ == '__main__':
+  indx = GetClimateIndexer()
 
   clim = indx.TropoClim(float(sys.argv[1]), float(sys.argv[2]))
   print 'Climate zone = %d' % clim
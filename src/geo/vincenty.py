@@ -18,6 +18,7 @@
 # December 2016
 
 from math import *
+import numpy
 
 def dist_bear_vincenty(lat1, lon1, lat2, lon2, accuracy=1.0E-12):
     """
@@ -102,6 +103,123 @@ def dist_bear_vincenty(lat1, lon1, lat2, lon2, accuracy=1.0E-12):
 
     return s, alpha1, alpha2
 
+def dist_bear_vincenty_array(lat1, lon1, lat2, lon2, accuracy=1.0E-12,
+                             max_iterations=100):
+    """
+    Array version of dist_bear_vincenty. The inputs may be scalars or NumPy
+    arrays of any shapes which broadcast together, for example a column of
+    device locations against a row of protection points. All elements are
+    iterated at once; an element stops iterating once its lambda has
+    converged to the given accuracy, and no element iterates more than
+    max_iterations times (nearly antipodal points may not converge).
+    Coincident points have zero distance and bearings.
+
+    Input lat/lons are in deg.
+
+    Returns arrays of distance (km), initial bearing (deg), and back azimuth
+    (deg).
+    """
+
+    a = 6378.1370        # semi-major axis (km), WGS84
+    f = 1./298.257223563 # flattening of the ellipsoid, WGS84
+    b = (1-f)*a          # semi-minor axis
+
+    lat1, lon1, lat2, lon2 = numpy.broadcast_arrays(
+        numpy.asarray(lat1, dtype=numpy.float64),
+        numpy.asarray(lon1, dtype=numpy.float64),
+        numpy.asarray(lat2, dtype=numpy.float64),
+        numpy.asarray(lon2, dtype=numpy.float64))
+    shape = lat1.shape
+
+    U1 = numpy.arctan((1-f)*numpy.tan(numpy.radians(lat1.ravel())))
+    U2 = numpy.arctan((1-f)*numpy.tan(numpy.radians(lat2.ravel())))
+    L = numpy.radians(lon2.ravel()) - numpy.radians(lon1.ravel())
+    sin_U1 = numpy.sin(U1)
+    cos_U1 = numpy.cos(U1)
+    sin_U2 = numpy.sin(U2)
+    cos_U2 = numpy.cos(U2)
+
+    lmbda = L.copy()
+    sin_sigma = numpy.zeros(L.shape)
+    cos_sigma = numpy.ones(L.shape)
+    sigma = numpy.zeros(L.shape)
+    sin_alpha = numpy.zeros(L.shape)
+    cossq_alpha = numpy.ones(L.shape)
+    cos2sigma_m = numpy.zeros(L.shape)
+
+    # Indices of the elements which have not converged yet.
+    active = numpy.arange(L.size)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        for iteration in range(max_iterations):
+            if active.size == 0:
+                break
+
+            lm = lmbda[active]
+            cu1 = cos_U1[active]
+            su1 = sin_U1[active]
+            cu2 = cos_U2[active]
+            su2 = sin_U2[active]
+
+            ss = numpy.sqrt((cu2*numpy.sin(lm))**2.0 +
+                            (cu1*su2 - su1*cu2*numpy.cos(lm))**2.0)
+            cs = su1*su2 + cu1*cu2*numpy.cos(lm)
+            sg = numpy.arctan2(ss, cs)
+
+            sa = (cu1*cu2*numpy.sin(lm))/ss
+            sa[ss == 0] = 0.
+            csqa = 1 - sa**2.0
+
+            c2sm = cs - (2.*su1*su2/csqa)
+            # Equatorial lines have cossq_alpha = 0 and cos2sigma_m = 0.
+            c2sm[csqa == 0] = 0.
+
+            C = (f/16.)*csqa*(4. + f*(4. - 3.*csqa))
+
+            new_lmbda = L[active] + (1. - C)*f*sa \
+                        *(sg + C*ss \
+                          * (c2sm + C*cs \
+                             * (-1. + 2.*c2sm**2.0)))
+
+            sin_sigma[active] = ss
+            cos_sigma[active] = cs
+            sigma[active] = sg
+            sin_alpha[active] = sa
+            cossq_alpha[active] = csqa
+            cos2sigma_m[active] = c2sm
+            lmbda[active] = new_lmbda
+            active = active[numpy.abs(new_lmbda - lm) > accuracy]
+
+    usq = cossq_alpha*(a**2.0 - b**2.0)/b**2.0
+    A = 1 + (usq/16384.)*(4096. + usq*(-768. + usq*(320. - 175.*usq)))
+    B = (usq/1024.)*(256. + usq*(-128. + usq*(74. - 47.*usq)))
+    dsigma = B*sin_sigma \
+             * (cos2sigma_m + 0.25*B \
+               * (cos_sigma*(-1. + 2.*cos2sigma_m**2.0) \
+                  - (1./6.)*B*cos2sigma_m*(-3. + 4.*sin_sigma**2.0)
+                   * (-3. + 4.*cos2sigma_m**2.0)))
+
+    s = b*A*(sigma-dsigma)
+
+    alpha1 = numpy.arctan2(cos_U2*numpy.sin(lmbda),
+                           (cos_U1*sin_U2 - sin_U1*cos_U2*numpy.cos(lmbda)))
+    alpha2 = numpy.arctan2(cos_U1*numpy.sin(lmbda),
+                           (-sin_U1*cos_U2 + cos_U1*sin_U2*numpy.cos(lmbda)))
+
+    alpha2 = numpy.where(alpha2 < pi, alpha2 + pi, alpha2 - pi)
+
+    alpha1 = (alpha1 + 2.*pi) % (2.*pi)
+    alpha2 = (alpha2 + 2.*pi) % (2.*pi)
+
+    # Coincident points.
+    same = (sin_sigma == 0) & (cos_sigma > 0)
+    s[same] = 0.
+    alpha1[same] = 0.
+    alpha2[same] = 0.
+
+    return (s.reshape(shape), numpy.degrees(alpha1).reshape(shape),
+            numpy.degrees(alpha2).reshape(shape))
+
 def to_dist_bear_vincenty(lat, lon, dist, bear, accuracy=1.0E-12):
     """
     Computes the latitude and longitude that is a specified distance
@@ -179,3 +297,109 @@ def to_dist_bear_vincenty(lat, lon, dist, bear, accuracy=1.0E-12):
 
     return degrees(phi2), degrees(L2), degrees(alpha2)
 
+def to_dist_bear_vincenty_array(lat, lon, dist, bear, accuracy=1.0E-12,
+                                max_iterations=100):
+    """
+    Array version of to_dist_bear_vincenty. The inputs may be scalars or
+    NumPy arrays of any shapes which broadcast together, for example a
+    column of bearings against a row of distances to compute a fan of
+    radials from one point. All elements are iterated at once; an element
+    stops iterating once its sigma has converged to the given accuracy, and
+    no element iterates more than max_iterations times.
+
+    Input lat/lon in deg, dist in km, bear in deg.
+
+    Returns arrays of final lat/lon in deg, and final bearing in deg.
+    """
+
+    a = 6378.1370        # semi-major axis (km), WGS84
+    f = 1./298.257223563 # flattening of the ellipsoid, WGS84
+    b = (1-f)*a          # semi-minor axis
+
+    lat, lon, dist, bear = numpy.broadcast_arrays(
+        numpy.asarray(lat, dtype=numpy.float64),
+        numpy.asarray(lon, dtype=numpy.float64),
+        numpy.asarray(dist, dtype=numpy.float64),
+        numpy.asarray(bear, dtype=numpy.float64))
+
+    phi1 = numpy.radians(lat)
+    L1   = numpy.radians(lon)
+    alpha1 = numpy.radians(bear)
+    s = dist
+
+    U1 = numpy.arctan((1-f)*numpy.tan(phi1))
+    sin_U1 = numpy.sin(U1)
+    cos_U1 = numpy.cos(U1)
+    sin_alpha1 = numpy.sin(alpha1)
+    cos_alpha1 = numpy.cos(alpha1)
+
+    sigma1 = numpy.arctan2(numpy.tan(U1), cos_alpha1)
+
+    sinalpha = cos_U1*sin_alpha1
+    cossq_alpha = (1. - sinalpha**2.0)
+    usq = cossq_alpha*(a**2.0-b**2.0)/b**2.0
+
+    A = 1 + usq/16384. * (4096. + usq*(-768 + usq*(320.-175.*usq)))
+    B = usq/1024.*(256. + usq*(-128. + usq*(74.-47.*usq)))
+
+    sigma = s/(b*A)
+    twosigmam = 2.*sigma1 + sigma
+
+    # Indices of the elements which have not converged yet.
+    active = numpy.arange(sigma.size)
+    sigma = sigma.ravel().copy()
+    twosigmam = twosigmam.ravel().copy()
+    s_A = (s/(b*A)).ravel()
+    B_r = B.ravel()
+    sigma1_r = sigma1.ravel()
+
+    for iteration in range(max_iterations):
+        if active.size == 0:
+            break
+
+        sig = sigma[active]
+        Bi = B_r[active]
+        tsm = 2.*sigma1_r[active] + sig
+        cos_tsm = numpy.cos(tsm)
+        dsigma = Bi*numpy.sin(sig) \
+                 *(cos_tsm + 0.25*Bi \
+                   *(numpy.cos(sig) \
+                     *(-1. + 2.*cos_tsm**2.0) \
+                     - (1./6.)*Bi*cos_tsm \
+                     * (-3. + 4. *numpy.sin(sig)**2.0) \
+                     * (-3. + 4.*cos_tsm**2.0)))
+        new_sigma = s_A[active] + dsigma
+
+        twosigmam[active] = tsm
+        sigma[active] = new_sigma
+        active = active[numpy.abs(new_sigma - sig) > accuracy]
+
+    sigma = sigma.reshape(s.shape)
+    twosigmam = twosigmam.reshape(s.shape)
+    sin_sigma = numpy.sin(sigma)
+    cos_sigma = numpy.cos(sigma)
+
+    num = sin_U1*cos_sigma + cos_U1*sin_sigma*cos_alpha1
+    den = (1.-f)*numpy.sqrt(sinalpha**2.0 +
+                            (sin_U1*sin_sigma - cos_U1*cos_sigma*cos_alpha1)**2.0)
+
+    phi2 = numpy.arctan2(num, den)
+
+    num = sin_sigma*sin_alpha1
+    den = cos_U1*cos_sigma - sin_U1*sin_sigma*cos_alpha1
+    lmbda = numpy.arctan2(num, den)
+
+    C = (f/16.)*cossq_alpha*(4. + f*(4. - 3.*cossq_alpha))
+
+    L = lmbda - (1. - C)*f*sinalpha \
+        * (sigma + C*sin_sigma \
+           *(numpy.cos(twosigmam) + C*cos_sigma \
+             * (-1. + 2.*numpy.cos(twosigmam)**2.0)))
+    L2 = L + L1
+
+    num = sinalpha
+    den = -sin_U1*sin_sigma + cos_U1*cos_sigma*cos_alpha1
+    alpha2 = numpy.arctan2(num, den)
+    alpha2 = (alpha2 + 2.*pi) % (2.*pi)
+
+    return numpy.degrees(phi2), numpy.degrees(L2), numpy.degrees(alpha2)
@@ -13,6 +13,7 @@
 #    limitations under the License.
 
 import math
+import numpy
 import vincenty
 import pygc
 import random
@@ -54,4 +55,46 @@ for i in range(1000):
   assert math.fabs(lngd - p['longitude']) < 1e-7
   assert math.fabs(az - p['reverse_azimuth']) < 1e-7, "%f and %f" % (az, p['reverse_azimuth'])
 
+print 'inverse array'
+
+lat1s = numpy.random.uniform(-80, 80, 1000)
+lng1s = numpy.random.uniform(-180, 180, 1000)
+lat2s = numpy.random.uniform(-80, 80, 1000)
+lng2s = numpy.random.uniform(-80, 80, 1000)
+ds, a_initials, a_finals = vincenty.dist_bear_vincenty_array(lat1s, lng1s, lat2s, lng2s)
+for i in range(1000):
+  d, a_initial, a_final = vincenty.dist_bear_vincenty(lat1s[i], lng1s[i], lat2s[i], lng2s[i])
+  assert math.fabs(d - ds[i]) < 1e-9
+  assert math.fabs(a_initial - a_initials[i]) < 1e-9
+  assert math.fabs(a_final - a_finals[i]) < 1e-9
+
+# Coincident points, and a column of points against a row of points.
+ds, a_initials, a_finals = vincenty.dist_bear_vincenty_array(
+    numpy.array([[40.0], [39.0]]), -105.0, numpy.array([[40.0, 39.5, 38.0]]), -105.0)
+assert ds.shape == (2, 3)
+assert ds[0, 0] == 0.0
+d, a_initial, a_final = vincenty.dist_bear_vincenty(39.0, -105.0, 38.0, -105.0)
+assert math.fabs(d - ds[1, 2]) < 1e-9
+
+print 'direct array'
+
+lats = numpy.random.uniform(-80, 80, 1000)
+lngs = numpy.random.uniform(-180, 180, 1000)
+dists = numpy.random.uniform(0, 1000, 1000)
+bearings = numpy.random.uniform(-180, 180, 1000)
+latds, lngds, azs = vincenty.to_dist_bear_vincenty_array(lats, lngs, dists, bearings)
+for i in range(1000):
+  latd, lngd, az = vincenty.to_dist_bear_vincenty(lats[i], lngs[i], dists[i], bearings[i])
+  assert math.fabs(latd - latds[i]) < 1e-10
+  assert math.fabs(lngd - lngds[i]) < 1e-10
+  assert math.fabs(az - azs[i]) < 1e-10
+
+# A fan of radials broadcasts bearings against distances.
+latds, lngds, azs = vincenty.to_dist_bear_vincenty_array(
+    40.0, -105.0, numpy.array([[0.0, 10.0, 80.0]]), numpy.array([[0.0], [90.0]]))
+assert latds.shape == (2, 3)
+latd, lngd, az = vincenty.to_dist_bear_vincenty(40.0, -105.0, 80.0, 90.0)
+assert math.fabs(latd - latds[1, 2]) < 1e-10
+assert math.fabs(lngd - lngds[1, 2]) < 1e-10
+
 print 'PASS'
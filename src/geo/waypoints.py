@@ -22,7 +22,7 @@ from lxml import etree
 import vincenty
 
 # This function computes the waypoint distances along a total
-# distance given in meters.
+# distance given in meters, returned as a numpy array.
 # It uses the algorithm of attempting to find evenly-spaced
 # distances as close to 30m separations as possible, up to
 # a total distance of 45000m.
@@ -34,30 +34,68 @@ import vincenty
 # returned: 0 and total_distance.
 def waypoint_distances(total_distance):
   if total_distance <= 30.0:
-    return [0, total_distance]
+    return numpy.array([0.0, total_distance])
 
   if total_distance >= 45000.0:
-    return [t for t in numpy.linspace(0, total_distance, 1500 + 1)]
+    return numpy.linspace(0, total_distance, 1500 + 1)
 
-  N = math.ceil(total_distance/30.0)
-  return [t for t in numpy.linspace(0, total_distance, N+1)]
+  N = int(math.ceil(total_distance/30.0))
+  return numpy.linspace(0, total_distance, N+1)
 
 # This function returns the waypoint latitudes and longitudes
 # to be used for the path between the given latlng coordinates.
 # Uses vincenty waypointing.
 def waypoints(lat1, lng1, lat2, lng2):
+  return waypoints_array(lat1, lng1, lat2, lng2).tolist()
+
+# Returns the waypoints of the path between the given latlng coordinates as
+# an (N, 2) numpy array of [lat, lng] rows, the same points as waypoints().
+# All of the waypoints are placed with one batched vincenty direct solve
+# along the initial azimuth of the path.
+def waypoints_array(lat1, lng1, lat2, lng2):
   d, az, raz = vincenty.dist_bear_vincenty(lat1, lng1, lat2, lng2)
   dist = waypoint_distances(d*1000.0)
 
-  way = [ [lat1, lng1] ]
-  for i in range(1, len(dist)):
-    d = dist[i]/1000.0
-    b = az
-    lt, ln, az_nn = vincenty.to_dist_bear_vincenty(lat1, lng1, d, b)
-    way.append([lt, ln])
-
+  lats, lngs, az_n = vincenty.to_dist_bear_vincenty_array(
+      lat1, lng1, dist[1:]/1000.0, az)
+  way = numpy.empty((len(dist), 2))
+  way[0] = [lat1, lng1]
+  way[1:, 0] = lats
+  way[1:, 1] = lngs
   return way
 
+# Returns the waypoints of many paths, given as arrays of the endpoint
+# coordinates, as a list of (N, 2) numpy arrays as returned by
+# waypoints_array. The endpoint arrays are broadcast against each other, so a
+# single start point may be given for many end points. The distances and
+# azimuths of all the paths are found with one batched inverse solve, and all
+# of the waypoints with one batched direct solve.
+def waypoints_array_many(lat1s, lng1s, lat2s, lng2s):
+  lat1s, lng1s, lat2s, lng2s = [
+      numpy.asarray(x, dtype=numpy.float64).ravel()
+      for x in numpy.broadcast_arrays(lat1s, lng1s, lat2s, lng2s)]
+  d, az, raz = vincenty.dist_bear_vincenty_array(lat1s, lng1s, lat2s, lng2s)
+  d = d.ravel()
+  az = az.ravel()
+
+  dists = [waypoint_distances(x*1000.0) for x in d]
+  counts = numpy.array([len(x) - 1 for x in dists])
+  path = numpy.repeat(numpy.arange(len(dists)), counts)
+  lats, lngs, az_n = vincenty.to_dist_bear_vincenty_array(
+      lat1s[path], lng1s[path],
+      numpy.concatenate([x[1:] for x in dists])/1000.0, az[path])
+
+  ways = []
+  start = 0
+  for i in range(len(dists)):
+    way = numpy.empty((counts[i] + 1, 2))
+    way[0] = [lat1s[i], lng1s[i]]
+    way[1:, 0] = lats[start:start + counts[i]]
+    way[1:, 1] = lngs[start:start + counts[i]]
+    ways.append(way)
+    start += counts[i]
+  return ways
+
 # When run as a command, emit a KML file with the waypoints in it.
 # command line arguments are lat/lng of first point and lat/lng of second point.
 if __name__ == '__main__':
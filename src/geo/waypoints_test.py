@@ -12,9 +12,12 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-import waypoints
-import unittest
+import numpy
 import random
+import unittest
+
+import vincenty
+import waypoints
 
 class TestDistance(unittest.TestCase):
   def test_short_distance(self):
@@ -87,6 +90,42 @@ class TestDistance(unittest.TestCase):
       self.assertGreater(30.0, d[1])
       self.assertEquals(int(x/30.0), int(len(d)-2))
 
+class TestWaypoints(unittest.TestCase):
+  def test_waypoints_array(self):
+    way = waypoints.waypoints_array(39.2, -104.2, 39.25, -104.3)
+    d, az, raz = vincenty.dist_bear_vincenty(39.2, -104.2, 39.25, -104.3)
+    dist = waypoints.waypoint_distances(d*1000.0)
+    self.assertEquals((len(dist), 2), way.shape)
+    self.assertEquals([39.2, -104.2], way[0].tolist())
+    for i in [1, 100, len(dist) - 1]:
+      lat, lng, az_n = vincenty.to_dist_bear_vincenty(39.2, -104.2,
+                                                      dist[i]/1000.0, az)
+      self.assertAlmostEqual(lat, way[i][0], places=10)
+      self.assertAlmostEqual(lng, way[i][1], places=10)
+    self.assertAlmostEqual(39.25, way[-1][0], places=8)
+    self.assertAlmostEqual(-104.3, way[-1][1], places=8)
+
+  def test_waypoints_array_many(self):
+    lat2s = [40.5, 39.2001, 39.25]
+    lng2s = [-105.6, -104.2, -104.3]
+    ways = waypoints.waypoints_array_many([39.2] * 3, [-104.2] * 3,
+                                          lat2s, lng2s)
+    self.assertEquals(3, len(ways))
+    for i in range(3):
+      way = waypoints.waypoints_array(39.2, -104.2, lat2s[i], lng2s[i])
+      self.assertEquals(way.shape, ways[i].shape)
+      self.assertTrue(numpy.allclose(way, ways[i], rtol=0, atol=1e-10))
+
+  def test_waypoints_array_many_scalar_start(self):
+    lat2s = [40.0, 41.0]
+    lng2s = [-105.0, -106.0]
+    ways = waypoints.waypoints_array_many(39.2, -104.2, lat2s, lng2s)
+    self.assertEquals(2, len(ways))
+    for i in range(2):
+      way = waypoints.waypoints_array(39.2, -104.2, lat2s[i], lng2s[i])
+      self.assertEquals(way.shape, ways[i].shape)
+      self.assertTrue(numpy.allclose(way, ways[i], rtol=0, atol=1e-10))
+
 if __name__ == '__main__':
   unittest.main()
 
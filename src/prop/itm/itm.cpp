@@ -176,7 +176,7 @@ double ahd(double td)
 
 double  adiff( double d, prop_type &prop, propa_type &propa)
 { complex<double> prop_zgnd(prop.zgndreal,prop.zgndimag);
-  static double wd1, xd1, afo, qk, aht, xht;
+  static ITM_THREAD_LOCAL double wd1, xd1, afo, qk, aht, xht;
   double a, q, pk, ds, th, wa, ar, wd, adiffv;
   if(d==0)
     { q=prop.hg[0]*prop.hg[1];
@@ -221,7 +221,7 @@ double  adiff( double d, prop_type &prop, propa_type &propa)
 
 double  ascat( double d, prop_type &prop, propa_type &propa)
 { complex<double> prop_zgnd(prop.zgndreal,prop.zgndimag);
-  static double ad, rr, etq, h0s;
+  static ITM_THREAD_LOCAL double ad, rr, etq, h0s;
   double h0, r1, r2, z0, ss, et, ett, th, q;
   double ascatv;
   if(d==0.0)
@@ -308,7 +308,7 @@ double abq_alos (complex<double> r)
 
 double  alos( double d, prop_type &prop, propa_type &propa)
 { complex<double> prop_zgnd(prop.zgndreal,prop.zgndimag);
-  static double wls;
+  static ITM_THREAD_LOCAL double wls;
   complex<double> r;
   double s, sps, q;
   double alosv;
@@ -369,8 +369,8 @@ void qlra( int kst[], int klimx, int mdvarx,
 
 void lrprop (double d,
           prop_type &prop, propa_type &propa)  // PaulM_lrprop
-{ static bool wlos, wscat;
-  static double dmin, xae;
+{ static ITM_THREAD_LOCAL bool wlos, wscat;
+  static ITM_THREAD_LOCAL double dmin, xae;
   complex<double> prop_zgnd(prop.zgndreal,prop.zgndimag);
   double a0, a1, a2, a3, a4, a5, a6;
   double d0, d1, d2, d3, d4, d5, d6;
@@ -529,8 +529,8 @@ double curve (double const &c1, double const &c2, double const &x1,
 
 double avar(double zzt, double zzl, double zzc,
          prop_type &prop, propv_type &propv)
-{ static int kdv;
-  static double dexa, de, vmd, vs0, sgl, sgtm, sgtp, sgtd, tgtd,
+{ static ITM_THREAD_LOCAL int kdv;
+  static ITM_THREAD_LOCAL double dexa, de, vmd, vs0, sgl, sgtm, sgtp, sgtd, tgtd,
                 gm, gp, cv1, cv2, yv1, yv2, yv3, csm1, csm2, ysm1, ysm2,
 				ysm3, csp1, csp2, ysp1, ysp2, ysp3, csd1, zd, cfm1, cfm2,
 				cfm3, cfp1, cfp2, cfp3;
@@ -557,7 +557,7 @@ double avar(double zzt, double zzl, double zzc,
   double bfp1[7]={1.0,0.93,1.0,0.93,0.93,1.0,1.0};
   double bfp2[7]={0.0,0.31,0.0,0.19,0.31,0.0,0.0};
   double bfp3[7]={0.0,2.00,0.0,1.79,2.00,0.0,0.0};
-  static bool ws, w1;
+  static ITM_THREAD_LOCAL bool ws, w1;
   double rt=7.8, rl=24.0, avarv, q, vs, zt, zl, zc;
   double sgt, yr;
   int temp_klim = propv.klim-1;
@@ -938,10 +938,10 @@ double deg2rad(double d)
 //* Point-To-Point Mode Calculations                     *
 //********************************************************
 
-void point_to_point(double elev[], double tht_m, double rht_m,
+void point_to_pointMode(double elev[], double tht_m, double rht_m,
           double eps_dielect, double sgm_conductivity, double eno_ns_surfref,
 		  double frq_mhz, int radio_climate, int pol, double conf, double rel,
-		  double &dbloss, char *strmode, int &errnum)
+		  double &dbloss, int &propmode, int &errnum)
 	// pol: 0-Horizontal, 1-Vertical
 	// radio_climate: 1-Equatorial, 2-Continental Subtropical, 3-Maritime Tropical,
 	//                4-Desert, 5-Continental Temperate, 6-Maritime Temperate, Over Land,
@@ -1005,22 +1005,57 @@ void point_to_point(double elev[], double tht_m, double rht_m,
   qlrpfl(elev,propv.klim,propv.mdvar,prop,propa,propv);
   fs = 32.45 + 20.0 * log10(frq_mhz) + 20.0 * log10(prop.dist / 1000.0);
   q = prop.dist - propa.dla;
+  propmode = PROPMODE_UNDEFINED;
   if(int(q)<0.0)
-    strcpy(strmode,"Line-Of-Sight Mode");
+    propmode = PROPMODE_LINE_OF_SIGHT;
   else
     { if(int(q)==0.0)
-        strcpy(strmode,"Single Horizon");
+        propmode = PROPMODE_SINGLE_HORIZON;
       else if(int(q)>0.0)
-        strcpy(strmode,"Double Horizon");
+        propmode = PROPMODE_DOUBLE_HORIZON;
       if(prop.dist<=propa.dlsa || prop.dist <= propa.dx)
-        strcat(strmode,", Diffraction Dominant");
+        propmode += 1; // Diffraction Dominant
       else if(prop.dist>propa.dx)
-        strcat(strmode, ", Troposcatter Dominant");
+        propmode += 2; // Troposcatter Dominant
     }
   dbloss = avar(zr,0.0,zc,prop,propv) + fs;
   errnum = prop.kwx;
 }
 
+void point_to_point(double elev[], double tht_m, double rht_m,
+          double eps_dielect, double sgm_conductivity, double eno_ns_surfref,
+		  double frq_mhz, int radio_climate, int pol, double conf, double rel,
+		  double &dbloss, char *strmode, int &errnum)
+	// As point_to_pointMode, with the dominant mode described by a string.
+{
+  int propmode;
+  point_to_pointMode(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
+                     eno_ns_surfref, frq_mhz, radio_climate, pol, conf, rel,
+                     dbloss, propmode, errnum);
+  strcpy(strmode, propmode_string(propmode));
+}
+
+const char* propmode_string(int propmode)
+{
+  switch(propmode)
+    { case PROPMODE_LINE_OF_SIGHT:
+        return STRMODE_LINE_OF_SIGHT;
+      case PROPMODE_SINGLE_HORIZON:
+        return STRMODE_SINGLE_HORIZON;
+      case PROPMODE_SINGLE_HORIZON_DIFFRACTION:
+        return STRMODE_SINGLE_HORIZON_DIFFRACTION;
+      case PROPMODE_SINGLE_HORIZON_TROPOSCATTER:
+        return STRMODE_SINGLE_HORIZON_TROPOSCATTER;
+      case PROPMODE_DOUBLE_HORIZON:
+        return STRMODE_DOUBLE_HORIZON;
+      case PROPMODE_DOUBLE_HORIZON_DIFFRACTION:
+        return STRMODE_DOUBLE_HORIZON_DIFFRACTION;
+      case PROPMODE_DOUBLE_HORIZON_TROPOSCATTER:
+        return STRMODE_DOUBLE_HORIZON_TROPOSCATTER;
+    }
+  return "";
+}
+
 
 void point_to_pointMDH (double elev[], double tht_m, double rht_m,
           double eps_dielect, double sgm_conductivity, double eno_ns_surfref,
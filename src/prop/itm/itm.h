@@ -12,6 +12,20 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+// The ITM routines keep state between calls in function-level static
+// variables (for example the coefficients set up by adiff(0.0, ...) and
+// used by later calls). These are made thread-local so that concurrent
+// calls from several threads do not overwrite each other's state.
+#ifndef ITM_THREAD_LOCAL
+#if defined(_MSC_VER)
+#define ITM_THREAD_LOCAL __declspec(thread)
+#elif defined(__GNUC__)
+#define ITM_THREAD_LOCAL __thread
+#else
+#define ITM_THREAD_LOCAL thread_local
+#endif
+#endif
+
 double ITMDLLVersion();
 
 // 'pol' values
@@ -47,15 +61,19 @@ double ITMDLLVersion();
 #define ERR_WARNING_COMBINATION_OUT_OF_RANGE 3
 
 // 'propmode' return settings
-#define PROPMODE_UNDEFINED = -1
-#define PROPMODE_LINE_OF_SIGHT = 0
+#define PROPMODE_UNDEFINED -1
+#define PROPMODE_LINE_OF_SIGHT 0
+#define PROPMODE_SINGLE_HORIZON 4
 #define PROPMODE_SINGLE_HORIZON_DIFFRACTION 5
 #define PROPMODE_SINGLE_HORIZON_TROPOSCATTER 6
+#define PROPMODE_DOUBLE_HORIZON 8
 #define PROPMODE_DOUBLE_HORIZON_DIFFRACTION 9
 #define PROPMODE_DOUBLE_HORIZON_TROPOSCATTER 10
 
 // 'strmode' return settings
 #define STRMODE_LINE_OF_SIGHT "Line-Of-Sight Mode"
+#define STRMODE_SINGLE_HORIZON "Single Horizon"
+#define STRMODE_DOUBLE_HORIZON "Double Horizon"
 #define STRMODE_SINGLE_HORIZON_DIFFRACTION "Single Horizon, Diffraction Dominant"
 #define STRMODE_SINGLE_HORIZON_TROPOSCATTER "Single Horizon, Troposcatter Dominant"
 #define STRMODE_DOUBLE_HORIZON_DIFFRACTION "Double Horizon, Diffraction Dominant"
@@ -107,6 +125,17 @@ void point_to_point(double elev[], double tht_m, double rht_m,
                     double conf, double rel,
                     double &dbloss, char *strmode, int &errnum);
 
+// As point_to_point, returning the dominant loss mode as one of the
+// PROPMODE_* values instead of a string.
+void point_to_pointMode(double elev[], double tht_m, double rht_m,
+                        double eps_dielect, double sgm_conductivity, double eno_ns_surfref,
+                        double frq_mhz, int radio_climate, int pol,
+                        double conf, double rel,
+                        double &dbloss, int &propmode, int &errnum);
+
+// Returns the STRMODE_* string for one of the PROPMODE_* values.
+const char* propmode_string(int propmode);
+
 void point_to_pointMDH(double elev[], double tht_m, double rht_m,
                        double eps_dielect, double sgm_conductivity, double eno_ns_surfref,
                        double frq_mhz, int radio_climate, int pol,
@@ -15,7 +15,97 @@
 #include "itm.h"
 #include <Python.h>
 
+#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+#include <numpy/arrayobject.h>
+
+#include <cstring>
 #include <iostream>
+#include <vector>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+// An elevation profile passed in from Python. A C-contiguous float64 buffer
+// (such as a NumPy array) whose first element already holds the number of
+// elevation points minus one is used in place; any other sequence of
+// numbers is copied.
+struct Profile {
+  Py_buffer view;
+  bool has_view;
+  std::vector<double> copy;
+  double* elev;
+  Py_ssize_t size;
+
+  Profile() : has_view(false), elev(NULL), size(0) {}
+  ~Profile() {
+    if (has_view) {
+      PyBuffer_Release(&view);
+    }
+  }
+};
+
+static bool IsFloat64Format(const char* format) {
+  if (format == NULL) {
+    return false;  // unsigned bytes
+  }
+  if (format[0] == '@' || format[0] == '=' || format[0] == '<') {
+    format++;
+  }
+  return strcmp(format, "d") == 0;
+}
+
+// Fills the profile from elev_obj. Returns false, with a Python exception
+// set, if the object is not a sequence of numbers.
+static bool GetProfile(PyObject* elev_obj, Profile* profile) {
+  if (PyObject_CheckBuffer(elev_obj) &&
+      PyObject_GetBuffer(elev_obj, &profile->view,
+                         PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == 0) {
+    profile->has_view = true;
+    Py_ssize_t size = profile->view.len / sizeof(double);
+    double* data = static_cast<double*>(profile->view.buf);
+    if (profile->view.itemsize == sizeof(double) &&
+        IsFloat64Format(profile->view.format) && size >= 3) {
+      if (data[0] == size - 3) {
+        profile->elev = data;
+        profile->size = size;
+        return true;
+      }
+      profile->copy.assign(data, data + size);
+    }
+    PyBuffer_Release(&profile->view);
+    profile->has_view = false;
+  } else {
+    // Objects without a usable buffer are read as sequences below.
+    PyErr_Clear();
+  }
+
+  if (profile->copy.empty()) {
+    PyObject* seq = PySequence_Fast(elev_obj, "elevations must be a sequence");
+    if (seq == NULL) {
+      return false;
+    }
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(seq);
+    profile->copy.resize(size);
+    for (Py_ssize_t i = 0; i < size; i++) {
+      profile->copy[i] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(seq, i));
+      if (PyErr_Occurred()) {
+        Py_DECREF(seq);
+        return false;
+      }
+    }
+    Py_DECREF(seq);
+  }
+
+  if (profile->copy.size() < 3) {
+    PyErr_SetString(PyExc_ValueError, "elevations must have at least 3 values");
+    return false;
+  }
+  profile->size = profile->copy.size();
+  profile->elev = &profile->copy[0];
+  profile->elev[0] = profile->size - 3;
+  return true;
+}
 
 static PyObject* itm_point_to_point(PyObject* self, PyObject* args) {
   PyObject* elev_obj = NULL;
@@ -30,40 +120,215 @@ static PyObject* itm_point_to_point(PyObject* self, PyObject* args) {
     return NULL;
   }
 
-  if (!PyList_Check(elev_obj)) {
+  Profile profile;
+  if (!GetProfile(elev_obj, &profile)) {
     return NULL;
   }
 
-  Py_ssize_t size = PyList_Size(elev_obj);
-  double* elev = new double[size];
-  for (Py_ssize_t i = 0; i < size; i++) {
-    PyObject* i_obj = PyList_GetItem(elev_obj, i);
-    double elev_val = PyFloat_AsDouble(i_obj);
-    if (PyErr_Occurred()) {
-      delete[] elev;
-      return NULL;
-    }
-    elev[i] = elev_val;
-  }
-
-  elev[0] = size-3;
   double dbloss;
   char strmode[100];
   int errnum;
-  point_to_point(elev, tht_m, rht_m, eps_dielect, sgm_conductivity, eno_ns_surfref,
+  // The profile is not modified, and the ITM state is thread-local, so
+  // other Python threads may run while the model is evaluated.
+  Py_BEGIN_ALLOW_THREADS
+  point_to_point(profile.elev, tht_m, rht_m, eps_dielect, sgm_conductivity, eno_ns_surfref,
                  frq_mhz, radio_climate, pol, conf, rel,
                  dbloss, strmode, errnum);
-  delete[] elev;
+  Py_END_ALLOW_THREADS
 
   return Py_BuildValue("dis", dbloss, errnum, strmode);
 }
 
+// A per-path parameter of point_to_point_many: a scalar, or a 1-D array
+// with one value per path.
+struct PathParam {
+  PyArrayObject* array;
+  double* data;
+  npy_intp stride;  // 0 for a scalar
+
+  PathParam() : array(NULL), data(NULL), stride(0) {}
+  ~PathParam() { Py_XDECREF(array); }
+
+  double operator[](npy_intp i) const { return data[i * stride]; }
+};
+
+// Converts obj to a PathParam for num_paths paths. Returns false, with a
+// Python exception set, on failure.
+static bool GetPathParam(PyObject* obj, const char* name, npy_intp num_paths,
+                         PathParam* param) {
+  param->array = reinterpret_cast<PyArrayObject*>(
+      PyArray_FROMANY(obj, NPY_DOUBLE, 0, 1, NPY_ARRAY_IN_ARRAY));
+  if (param->array == NULL) {
+    return false;
+  }
+  npy_intp size = PyArray_SIZE(param->array);
+  if (PyArray_NDIM(param->array) == 1 && size != num_paths) {
+    PyErr_Format(PyExc_ValueError, "%s has %ld values for %ld paths",
+                 name, static_cast<long>(size), static_cast<long>(num_paths));
+    return false;
+  }
+  param->data = static_cast<double*>(PyArray_DATA(param->array));
+  param->stride = PyArray_NDIM(param->array) == 1 ? 1 : 0;
+  return true;
+}
+
+static PyObject* itm_point_to_point_many(PyObject* self, PyObject* args,
+                                         PyObject* kwds) {
+  static const char* kwlist[] = {
+    "profiles", "tht_m", "rht_m", "eps_dielect", "sgm_conductivity",
+    "eno_ns_surfref", "frq_mhz", "radio_climate", "pol", "conf", "rel",
+    "offsets", "num_threads", NULL};
+  PyObject* profiles_obj = NULL;
+  PyObject* param_objs[10];
+  PyObject* offsets_obj = Py_None;
+  int num_threads = 0;
+  if (!PyArg_ParseTupleAndKeywords(
+          args, kwds, "OOOOOOOOOOO|Oi:point_to_point_many",
+          const_cast<char**>(kwlist), &profiles_obj,
+          &param_objs[0], &param_objs[1], &param_objs[2], &param_objs[3],
+          &param_objs[4], &param_objs[5], &param_objs[6], &param_objs[7],
+          &param_objs[8], &param_objs[9], &offsets_obj, &num_threads)) {
+    return NULL;
+  }
+
+  PyArrayObject* profiles = reinterpret_cast<PyArrayObject*>(
+      PyArray_FROMANY(profiles_obj, NPY_DOUBLE, 1, 2, NPY_ARRAY_IN_ARRAY));
+  if (profiles == NULL) {
+    return NULL;
+  }
+  const double* data = static_cast<double*>(PyArray_DATA(profiles));
+
+  // The start of each profile in data and the number of values available to
+  // it, from the rows of a 2-D array or the offsets into a 1-D array.
+  std::vector<npy_intp> starts, lengths;
+  if (offsets_obj == Py_None) {
+    if (PyArray_NDIM(profiles) != 2) {
+      Py_DECREF(profiles);
+      PyErr_SetString(PyExc_ValueError,
+                      "1-D profiles need offsets; pass a 2-D array of rows otherwise");
+      return NULL;
+    }
+    npy_intp rows = PyArray_DIM(profiles, 0), cols = PyArray_DIM(profiles, 1);
+    for (npy_intp i = 0; i < rows; i++) {
+      starts.push_back(i * cols);
+      lengths.push_back(cols);
+    }
+  } else {
+    PyArrayObject* offsets = reinterpret_cast<PyArrayObject*>(
+        PyArray_FROMANY(offsets_obj, NPY_INTP, 1, 1, NPY_ARRAY_IN_ARRAY));
+    if (offsets == NULL) {
+      Py_DECREF(profiles);
+      return NULL;
+    }
+    const npy_intp* off = static_cast<npy_intp*>(PyArray_DATA(offsets));
+    npy_intp num_offsets = PyArray_SIZE(offsets);
+    npy_intp total = PyArray_SIZE(profiles);
+    for (npy_intp i = 0; i + 1 < num_offsets; i++) {
+      if (off[i] < 0 || off[i] > off[i + 1] || off[i + 1] > total) {
+        Py_DECREF(offsets);
+        Py_DECREF(profiles);
+        PyErr_SetString(PyExc_ValueError,
+                        "offsets must be increasing indices into profiles");
+        return NULL;
+      }
+      starts.push_back(off[i]);
+      lengths.push_back(off[i + 1] - off[i]);
+    }
+    Py_DECREF(offsets);
+  }
+
+  // Each profile must hold at least the number of points given by its first
+  // value; trailing padding is ignored.
+  npy_intp num_paths = starts.size();
+  for (npy_intp i = 0; i < num_paths; i++) {
+    double np = lengths[i] > 0 ? data[starts[i]] : 0.0;
+    if (lengths[i] < 4 || np < 1 || np > lengths[i] - 3) {
+      Py_DECREF(profiles);
+      PyErr_Format(PyExc_ValueError,
+                   "profile %ld does not hold the number of points it gives",
+                   static_cast<long>(i));
+      return NULL;
+    }
+  }
+
+  static const char* param_names[10] = {
+    "tht_m", "rht_m", "eps_dielect", "sgm_conductivity", "eno_ns_surfref",
+    "frq_mhz", "radio_climate", "pol", "conf", "rel"};
+  PathParam params[10];
+  for (int k = 0; k < 10; k++) {
+    if (!GetPathParam(param_objs[k], param_names[k], num_paths, &params[k])) {
+      Py_DECREF(profiles);
+      return NULL;
+    }
+  }
+
+  npy_intp dims[1] = {num_paths};
+  PyArrayObject* loss = reinterpret_cast<PyArrayObject*>(
+      PyArray_SimpleNew(1, dims, NPY_DOUBLE));
+  PyArrayObject* err = reinterpret_cast<PyArrayObject*>(
+      PyArray_SimpleNew(1, dims, NPY_INT));
+  PyArrayObject* mode = reinterpret_cast<PyArrayObject*>(
+      PyArray_SimpleNew(1, dims, NPY_INT));
+  if (loss == NULL || err == NULL || mode == NULL) {
+    Py_XDECREF(loss);
+    Py_XDECREF(err);
+    Py_XDECREF(mode);
+    Py_DECREF(profiles);
+    return NULL;
+  }
+  double* loss_data = static_cast<double*>(PyArray_DATA(loss));
+  int* err_data = static_cast<int*>(PyArray_DATA(err));
+  int* mode_data = static_cast<int*>(PyArray_DATA(mode));
+
+  // The profiles are only read, and the ITM state is thread-local, so the
+  // paths may be evaluated in parallel without the GIL.
+  Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+  // The thread count applies to this loop only, not to later parallel
+  // regions of the process.
+  int n = num_threads > 0 ? num_threads : omp_get_max_threads();
+#pragma omp parallel for num_threads(n) schedule(dynamic, 16)
+#endif
+  for (npy_intp i = 0; i < num_paths; i++) {
+    point_to_pointMode(const_cast<double*>(data + starts[i]),
+                       params[0][i], params[1][i], params[2][i], params[3][i],
+                       params[4][i], params[5][i],
+                       static_cast<int>(params[6][i]), static_cast<int>(params[7][i]),
+                       params[8][i], params[9][i],
+                       loss_data[i], mode_data[i], err_data[i]);
+  }
+  Py_END_ALLOW_THREADS
+
+  Py_DECREF(profiles);
+  return Py_BuildValue("NNN", loss, err, mode);
+}
+
 static PyMethodDef ITMMethods[] = {
   {"point_to_point", itm_point_to_point, METH_VARARGS, "Point-to-point model"},
+  {"point_to_point_many", (PyCFunction)itm_point_to_point_many,
+   METH_VARARGS | METH_KEYWORDS,
+   "Point-to-point model for many paths. Returns arrays of loss, error code "
+   "and mode (one of the PROPMODE_* values)"},
   {NULL, NULL, 0, NULL}
 };
 
 PyMODINIT_FUNC inititm(void) {
-  Py_InitModule3("itm", ITMMethods, "Longley-Rice ITM Propagation Module");
+  PyObject* module = Py_InitModule3("itm", ITMMethods,
+                                    "Longley-Rice ITM Propagation Module");
+  if (module == NULL) {
+    return;
+  }
+  import_array();
+  PyModule_AddIntConstant(module, "PROPMODE_UNDEFINED", PROPMODE_UNDEFINED);
+  PyModule_AddIntConstant(module, "PROPMODE_LINE_OF_SIGHT", PROPMODE_LINE_OF_SIGHT);
+  PyModule_AddIntConstant(module, "PROPMODE_SINGLE_HORIZON", PROPMODE_SINGLE_HORIZON);
+  PyModule_AddIntConstant(module, "PROPMODE_SINGLE_HORIZON_DIFFRACTION",
+                          PROPMODE_SINGLE_HORIZON_DIFFRACTION);
+  PyModule_AddIntConstant(module, "PROPMODE_SINGLE_HORIZON_TROPOSCATTER",
+                          PROPMODE_SINGLE_HORIZON_TROPOSCATTER);
+  PyModule_AddIntConstant(module, "PROPMODE_DOUBLE_HORIZON", PROPMODE_DOUBLE_HORIZON);
+  PyModule_AddIntConstant(module, "PROPMODE_DOUBLE_HORIZON_DIFFRACTION",
+                          PROPMODE_DOUBLE_HORIZON_DIFFRACTION);
+  PyModule_AddIntConstant(module, "PROPMODE_DOUBLE_HORIZON_TROPOSCATTER",
+                          PROPMODE_DOUBLE_HORIZON_TROPOSCATTER);
 }
-
@@ -16,9 +16,27 @@
 # into the local directory. Run 'python setup.py build' to build the
 # module. See distutils documentation for more info.
 
+# Set ITM_OPENMP=1 in the environment to build point_to_point_many with
+# OpenMP, evaluating the paths of a batch on all cores.
+
+import numpy
+import os
+import sys
 from distutils.core import Extension, setup
 
-itm_module = Extension('itm', sources = ['itm.cpp', 'itm_py.cpp'])
+compile_args = []
+link_args = []
+if os.environ.get('ITM_OPENMP', '0') != '0':
+  if sys.platform == 'win32':
+    compile_args.append('/openmp')
+  else:
+    compile_args.append('-fopenmp')
+    link_args.append('-fopenmp')
+
+itm_module = Extension('itm', sources = ['itm.cpp', 'itm_py.cpp'],
+                       include_dirs = [numpy.get_include()],
+                       extra_compile_args = compile_args,
+                       extra_link_args = link_args)
 
 setup(name = 'itm',
       version = '1.0',
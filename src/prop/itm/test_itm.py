@@ -21,7 +21,7 @@
 #
 # Usage documentation:
 #   itm.point_to_point(
-#       elevations,
+#       elevations,  (a list, or a float64 NumPy array used without copying)
 #            The first item in the list is the number of elevation points
 #            minus one. The second is the distance in meters between elevation
 #            points in the profile. Thus the total distance is (first)*(second)
@@ -53,6 +53,7 @@
 #            station.
 
 import itm
+import numpy
 
 path = [ 156, 499,
          96,   84,   65,   46,   46,   46,   61,   41,   33,   27,   23,   19,   15,   15,   15,
@@ -77,3 +78,23 @@ if abs(loss-135.8) > 0.2:
 else:
   print "SUCCESS: expected 135.8, got ", loss
 
+
+# A float64 NumPy array is used without copying and gives the same result.
+np_loss, np_err, np_mode = itm.point_to_point(numpy.array(path, dtype=numpy.float64),
+                                              143.9, 8.5, 15, .005, 314, 41.5, 5, 0, .5, .5)
+if (np_loss, np_err, np_mode) != (loss, err, mode):
+  print "FAIL: expected the same result for a numpy array, got ", np_loss
+else:
+  print "SUCCESS: numpy array input"
+
+# point_to_point_many evaluates a batch of paths: here the same path as a
+# 2-D array of two rows, with per-path receiver heights.
+losses, errs, modes = itm.point_to_point_many(numpy.array([path, path], dtype=numpy.float64),
+                                              143.9, numpy.array([8.5, 8.5]), 15, .005, 314,
+                                              41.5, 5, 0, .5, .5)
+if list(losses) != [loss, loss] or list(errs) != [err, err]:
+  print "FAIL: expected the same losses from point_to_point_many, got ", losses
+elif list(modes) != [itm.PROPMODE_DOUBLE_HORIZON_DIFFRACTION] * 2:
+  print "FAIL: expected double horizon diffraction modes, got ", modes
+else:
+  print "SUCCESS: point_to_point_many"
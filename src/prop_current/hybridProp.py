@@ -9,6 +9,8 @@ from itm_wf import *
 from ehata_its_wf import *
 from nlcd_indexer import *
 import os
+import collections
+import threading
 import numpy as np
 import geo
 import terrain
@@ -16,6 +18,106 @@ import terrain
 global interValues
 interValues = InterValues()
 
+# Directory holding the NLCD data
+NLCD_DIR = "E:\\Google Drive\\BigFiles\\Google\\Databases\\NLCD"
+
+
+class NlcdRegionProvider:
+    """
+    Looks up NLCD region types through a single NlcdIndexer, which is only
+    created on the first lookup since initializing it takes a long time.
+    The regions of the most recently looked up max_entries locations are
+    remembered, so repeated lookups for the same CBSD are a dict access.
+    The provider may be shared between threads.
+
+    An indexer may be passed in instead of the NLCD directory.
+    """
+
+    def __init__(self, nlcd_dir = None, max_entries = 10000, indexer = None):
+        self.nlcd_dir = nlcd_dir # None uses NLCD_DIR
+        self.max_entries = max_entries
+        self.indexer = indexer
+        # (lat, lon) -> region. The first entry is the least recently used.
+        self.regions = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def getIndexer(self):
+        """
+        Returns the NlcdIndexer, creating it on first use.
+        """
+
+        with self.lock:
+            if self.indexer is None:
+                nlcd_dir = self.nlcd_dir
+                if nlcd_dir is None:
+                    nlcd_dir = NLCD_DIR
+
+#               The following line is needed because for some reason Windows GDAL environment
+#               variables won't stick:
+                os.putenv('GDAL_DATA', 'C:\Program Files (x86)\GDAL\gdal-data')
+
+                self.indexer = NlcdIndexer(nlcd_dir)
+            return self.indexer
+
+    def region(self, lat, lon):
+        """
+        Returns the NLCD region type ('URBAN', 'SUBURBAN' or 'RURAL') at
+        lat/lon.
+        """
+
+        key = (lat, lon)
+        with self.lock:
+            region = self.regions.pop(key, None)
+            if region is not None:
+                self.regions[key] = region
+                return region
+
+        code = self.getIndexer().NlcdCode(lat, lon)
+
+        if code == 22:
+            region = 'SUBURBAN'
+        elif code == 23 or code == 24:
+            region = 'URBAN'
+        else:
+            region = 'RURAL' # If not urban or suburban
+
+        with self.lock:
+            self.regions[key] = region
+            while len(self.regions) > self.max_entries:
+                self.regions.popitem(last=False)
+        return region
+
+
+# The provider used by get_NLCD_region; created on first use.
+NLCD_REGION_PROVIDER = None
+NLCD_REGION_PROVIDER_LOCK = threading.Lock()
+
+
+def getNlcdRegionProvider():
+    """
+    Returns the process-wide NlcdRegionProvider, creating it on first use.
+    """
+
+    global NLCD_REGION_PROVIDER
+
+    with NLCD_REGION_PROVIDER_LOCK:
+        if NLCD_REGION_PROVIDER is None:
+            NLCD_REGION_PROVIDER = NlcdRegionProvider()
+        return NLCD_REGION_PROVIDER
+
+
+def setNlcdRegionProvider(provider):
+    """
+    Replaces the process-wide NlcdRegionProvider, for example with one
+    reading a different NLCD directory or sharing an existing indexer.
+    """
+
+    global NLCD_REGION_PROVIDER
+
+    with NLCD_REGION_PROVIDER_LOCK:
+        NLCD_REGION_PROVIDER = provider
+
+
 def get_NLCD_region(lat, lon):
     """
     Returns the NLCD region type for the specified location. This implementation
@@ -24,30 +126,14 @@ def get_NLCD_region(lat, lon):
     ***TODO: WinnForum implementation involves calculating the region based on
     the preponderance of region types in the service area.
 
-    ***TODO: This code takes a long time to execute because it initializes some
-    stuff. Probably need to integrate the NlcdIndexer class into this code and
-    do the initialization once upon startup otherwise it will take a very long
-    time to calculate many prop losses.
+    The lookup goes through the process-wide NlcdRegionProvider, so the NLCD
+    indexer is initialized once, on the first call.
 
     Andrew Clegg
     February 2017
     """
 
-    nlcdDir = "E:\\Google Drive\\BigFiles\\Google\\Databases\\NLCD"
-
-#   The following line is needed because for some reason Windows GDAL environment
-#   variables won't stick:
-    os.putenv('GDAL_DATA', 'C:\Program Files (x86)\GDAL\gdal-data')
-
-    indx = NlcdIndexer(nlcdDir)
-    code = indx.NlcdCode(lat, lon)
-
-    if code == 22:
-        return 'SUBURBAN'
-    elif code == 23 or code == 24:
-        return 'URBAN'
-
-    return 'RURAL' # If not urban or suburban
+    return getNlcdRegionProvider().region(lat, lon)
 
     
 def hybrid_prop(lat_cbsd, lon_cbsd, h_cbsd,
@@ -80,9 +166,18 @@ def hybrid_prop(lat_cbsd, lon_cbsd, h_cbsd,
     region = region.strip().upper()
     mode = mode.strip().upper()
     
-#   Calculate the predicted ITM loss
-    dbloss_itm, errnum, strmode_itm, dist, bearing, d, elev = \
-           itm_wf(lat_cbsd, lon_cbsd, h_cbsd, lat2, lon2, h2, f, rel, conf)     
+#   Calculate the predicted ITM loss. The ITM median, which is needed
+#   below between 1 and 80 km, is computed along with it from the same path.
+    is_median = abs(rel-0.5) < 0.001 and abs(conf-0.5) < 0.001
+    if is_median:
+        quantiles = [(rel, conf)]
+    else:
+        quantiles = [(rel, conf), (0.5, 0.5)]
+    dblosses_itm, errnums, strmode_itm, dist, bearing, d, elev = \
+           itm_wf_quantiles(lat_cbsd, lon_cbsd, h_cbsd, lat2, lon2, h2, f,
+                            quantiles)
+    dbloss_itm = dblosses_itm[0]
+    errnum = errnums[0]
 
 #   Per R2-SGN-03, if mode = FSS or ESC, only ITM is used
     if mode == 'FSS' or mode == 'ESC': 
@@ -95,7 +190,7 @@ def hybrid_prop(lat_cbsd, lon_cbsd, h_cbsd,
     if h_cbsd_eff >= 200:
         return dbloss_itm, dbloss_itm, errnum, strmode_itm, 'Effective height > 200 m. Using ITM.', h_cbsd_eff
 
-#   Only call the NLCD indexer if region is not specified. The indexer is slow.
+#   Only call the NLCD indexer if region is not specified.
 #   TODO: Implement code to determine preponderance of NLCD value within
 #   coverage area.
     if region not in ['URBAN', 'SUBURBAN', 'RURAL']:
@@ -132,11 +227,7 @@ def hybrid_prop(lat_cbsd, lon_cbsd, h_cbsd,
         plb = [0.]
         ExtendedHata(elev, f, max(h_cbsd,20.), h2, enviro_code, plb)
         ehata_loss = plb[0] 
-        if abs(rel-0.5) < 0.001 and abs(conf-0.5) < 0.001:
-            dbloss_itm_med = dbloss_itm
-        else:
-            dbloss_itm_med, errnum_med, strmode_itm_med, dist_med, bearing_med, d_med, elev_med = \
-              itm_wf(lat_cbsd, lon_cbsd, h_cbsd, lat2, lon2, h2, f, 0.5, 0.5)
+        dbloss_itm_med = dblosses_itm[-1]
         if dbloss_itm_med >= ehata_loss:
             return dbloss_itm, dbloss_itm, errnum, strmode_itm, 'TR 15-517 mode. Using ITM because ITM_MED is >= eHata', h_cbsd_eff
         else:
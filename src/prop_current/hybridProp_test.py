@@ -0,0 +1,88 @@
+# Tests for the NLCD region lookups of the hybrid propagation model. The
+# AWC modules and the SAS geo modules imported by hybridProp.py must be
+# importable.
+
+import unittest
+
+import hybridProp
+
+
+class StubIndexer:
+    """
+    Stands in for an NlcdIndexer, returning fixed NLCD codes and recording
+    the lookups.
+    """
+
+    def __init__(self, codes):
+        self.codes = codes # (lat, lon) -> NLCD code
+        self.lookups = []
+
+    def NlcdCode(self, lat, lon):
+        self.lookups.append((lat, lon))
+        return self.codes.get((lat, lon), 41)
+
+
+class TestNlcdRegionProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.indexer = StubIndexer({(39.0, -105.0): 22, (39.1, -105.0): 23,
+                                    (39.2, -105.0): 24})
+        self.provider = hybridProp.NlcdRegionProvider(max_entries = 2,
+                                                      indexer = self.indexer)
+        self.saved_provider = hybridProp.NLCD_REGION_PROVIDER
+
+    def tearDown(self):
+        hybridProp.setNlcdRegionProvider(self.saved_provider)
+
+    def test_regions(self):
+        self.assertEquals('SUBURBAN', self.provider.region(39.0, -105.0))
+        self.assertEquals('URBAN', self.provider.region(39.1, -105.0))
+        self.assertEquals('URBAN', self.provider.region(39.2, -105.0))
+        self.assertEquals('RURAL', self.provider.region(39.3, -105.0))
+        self.assertTrue(self.provider.getIndexer() is self.indexer)
+
+    def test_memoization(self):
+        for i in range(3):
+            self.assertEquals('SUBURBAN', self.provider.region(39.0, -105.0))
+        self.assertEquals([(39.0, -105.0)], self.indexer.lookups)
+
+        # Only the most recently used max_entries locations are kept.
+        self.provider.region(39.1, -105.0)
+        self.provider.region(39.0, -105.0)
+        self.provider.region(39.2, -105.0) # forgets 39.1
+        self.assertEquals(3, len(self.indexer.lookups))
+        self.provider.region(39.0, -105.0)
+        self.assertEquals(3, len(self.indexer.lookups))
+        self.provider.region(39.1, -105.0)
+        self.assertEquals(4, len(self.indexer.lookups))
+
+    def test_injected_provider(self):
+        hybridProp.setNlcdRegionProvider(self.provider)
+        self.assertTrue(hybridProp.getNlcdRegionProvider() is self.provider)
+        self.assertEquals('URBAN', hybridProp.get_NLCD_region(39.1, -105.0))
+        self.assertEquals([(39.1, -105.0)], self.indexer.lookups)
+
+    def test_hybrid_prop_uses_injected_provider(self):
+        # The ITM loss and effective heights are fixed, so that only the
+        # region lookup is exercised.
+        def itm_wf_quantiles(lat1, lon1, h1, lat2, lon2, h2, f, quantiles):
+            return ([120.] * len(quantiles), [0] * len(quantiles), 'mode',
+                    10., 45., 10000., [99, 100.] + [0.] * 100)
+        def EffectiveHeights(h_b, h_m, pfl):
+            return h_b, h_m
+        saved = (hybridProp.itm_wf_quantiles, hybridProp.EffectiveHeights)
+        hybridProp.itm_wf_quantiles = itm_wf_quantiles
+        hybridProp.EffectiveHeights = EffectiveHeights
+        try:
+            hybridProp.setNlcdRegionProvider(self.provider)
+            result = hybridProp.hybrid_prop(39.3, -105.0, 30., 39.4, -105.0,
+                                            mode = 'CBSD')
+        finally:
+            hybridProp.itm_wf_quantiles, hybridProp.EffectiveHeights = saved
+        self.assertEquals([(39.3, -105.0)], self.indexer.lookups)
+        self.assertEquals(120., result[0])
+        self.assertEquals('Rural. Using ITM.', result[4])
+
+
+if __name__ == '__main__':
+    unittest.main()
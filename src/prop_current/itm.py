@@ -10,6 +10,13 @@
 # Last update: Nov 5, 2016
 
 import math
+import numpy
+
+# The terrain kernels hzns, z1sq1, qtile and d1thx are evaluated with NumPy
+# array operations. Set REFERENCE_KERNELS to True to run the original
+# element-by-element code instead, for example to validate the vectorized
+# kernels. Results agree to floating point rounding.
+REFERENCE_KERNELS = False
 
 # Static function variables in C++ implemented via global variables in Python
 global wd1, xd1, afo, qk, aht, xht                        # Function adiff
@@ -827,6 +834,59 @@ def hzns(pfl, prop):
     line-of-sight, the routine sets both horizon distances equal to dist.
 
     (Section 47)
+
+    A point raises the horizon angle when its elevation angle, (z - za)/s -
+    qc*s, exceeds the angle so far, so the horizon is the first point with
+    the largest elevation angle. The receiver horizon is only searched from
+    the first point which raises the transmitter horizon on.
+    """
+
+    if REFERENCE_KERNELS:
+        return hzns_reference(pfl, prop)
+
+    np = int(pfl[0])
+    xi = pfl[1]
+    za = pfl[2] + prop.hg[0]
+    zb = pfl[np+2] + prop.hg[1]
+    qc = 0.5*prop.gme
+    q = qc*prop.dist
+    prop.the[1] = (zb-za)/prop.dist
+    prop.the[0] = prop.the[1] - q
+    prop.the[1] = -prop.the[1] - q
+    prop.dl[0] = prop.dist
+    prop.dl[1] = prop.dist
+
+    if np >= 2:
+        z = numpy.asarray(pfl[3:np+2], dtype=float)
+#       Accumulated as in the reference, so the horizon distances are the same
+#       to the last bit; they decide the sample ranges of the fits in qlrpfl.
+        steps = numpy.full(np, xi)
+        sa = numpy.add.accumulate(steps)[:-1]
+        steps[0] = prop.dist
+        sb = numpy.subtract.accumulate(steps)[1:]
+        tha = (z - za)/sa - qc*sa
+        above = tha > prop.the[0]
+        if above.any():
+            i0 = int(numpy.argmax(above))
+            ia = int(numpy.argmax(tha))
+            prop.the[0] = float(tha[ia])
+            prop.dl[0] = float(sa[ia])
+            thb = (z[i0:] - zb)/sb[i0:] - qc*sb[i0:]
+            ib = int(numpy.argmax(thb))
+            if thb[ib] > prop.the[1]:
+                prop.the[1] = float(thb[ib])
+                prop.dl[1] = float(sb[i0+ib])
+
+
+def hzns_reference(pfl, prop):
+    """
+    Here we use the terrain profile pfl to find the two horizons. Output consists
+    of the horizon distances dl and the horizon take-off angles the. If the path is
+    line-of-sight, the routine sets both horizon distances equal to dist.
+
+    (Section 47)
+
+    Reference version of hzns, looping over the profile points.
     """
 
     np = int(pfl[0])
@@ -873,6 +933,54 @@ def z1sq1 (z, x1, x2, z0, zn):
     [Note: Changed to a function that returns z0 and zn, since Python functions
     cannot return modified parameters that are immutable objects. Because of this
     change, the code has been changed elsewhere, wherever z1sq1 is called. -- AWC]
+
+    The sums of the fit are taken with NumPy over the points between x1 and x2.
+    """
+
+    if REFERENCE_KERNELS:
+        return z1sq1_reference(z, x1, x2, z0, zn)
+
+    xn = z[0]
+    xa = int(fortran_dim(x1/z[1], 0.0))
+    xb = xn - int(fortran_dim(xn, x2/z[1]))
+
+    if xb <= xa:
+        xa = fortran_dim(xa, 1.0)
+        xb = xn - fortran_dim(xn, xb+1.0)
+
+    ja = int(xa)
+    jb = int(xb)
+    n = jb - ja
+    xa = xb - xa
+    x = -0.5*xa
+    xb += x
+    zi = numpy.asarray(z[ja+3:jb+2], dtype=float)
+    a = 0.5*(z[ja+2] + z[jb+2]) + zi.sum()
+    b = 0.5*(z[ja+2] - z[jb+2])*x + numpy.dot(zi, x + numpy.arange(1, n))
+
+    a /= xa
+    b = b*12.0/((xa*xa + 2.0)*xa)
+    z0 = a - b*xb
+    zn = a + b*(xn-xb)
+
+    return float(z0), float(zn)
+
+
+def z1sq1_reference(z, x1, x2, z0, zn):
+    """
+    A linear least squares fit between x1, x2 to the function described by the
+    array z. This array must have a special format: z(1) = en, the number of
+    equally large intervals, z(2) = epsilon, the interval length, and z(j+3),
+    j = 0, ..., n, function values. The output consists of values of the required
+    line, z0 at 0, zn at xt = n*epsilon.
+
+    (Section 53)
+
+    [Note: Changed to a function that returns z0 and zn, since Python functions
+    cannot return modified parameters that are immutable objects. Because of this
+    change, the code has been changed elsewhere, wherever z1sq1 is called. -- AWC]
+
+    Reference version of z1sq1, summing over the points in a loop.
     """
 
     xn = z[0]
@@ -907,6 +1015,24 @@ def z1sq1 (z, x1, x2, z0, zn):
 
 
 def qtile(nn, a, ir):
+    """
+    This routine provides a quantile: the value a(i_r) would have if a(0..nn)
+    were completely sorted in descending order.
+
+    (Section 52)
+
+    Unlike qtile_reference, the selection is done on a copy by
+    numpy.partition, so a is left unchanged.
+    """
+
+    if REFERENCE_KERNELS:
+        return qtile_reference(nn, a, ir)
+
+    k = min(max(0, ir), nn)
+    return -float(numpy.partition(-numpy.asarray(a[:nn+1], dtype=float), k)[k])
+
+
+def qtile_reference(nn, a, ir):
     """
     This routine provides a quantile. It reorders the array a so that a(j),
     j = 1...i_r are all greater than or equal to all a(i), i = i_r ... nn. In
@@ -914,6 +1040,8 @@ def qtile(nn, a, ir):
     sorted in descending order. The returned value is qtile = a(i_r).
 
     (Section 52)
+
+    Reference version of qtile, reordering a in place.
     """
 
     m = 0
@@ -1011,6 +1139,65 @@ def d1thx(pfl, x1, x2):
     elevations between the two points x1 and x2.
 
     (Section 48)
+
+    The profile is interpolated at all n points at once, detrended with the
+    least squares line, and both deciles are selected with one
+    numpy.partition.
+    """
+
+    if REFERENCE_KERNELS:
+        return d1thx_reference(pfl, x1, x2)
+
+    pfl = numpy.asarray(pfl, dtype=float)
+    np = int(pfl[0])
+    xa = x1/pfl[1]
+    xb = x2/pfl[1]
+    d1thxv = 0.0
+
+    if xb - xa < 2.0:  # exit out
+        return d1thxv
+
+    ka = int(0.1*(xb - xa + 8.0))
+    ka = min(max(4, ka), 25)
+
+    n = 10*ka - 5
+    kb = n-ka + 1
+    sn = n-1
+
+    xb = (xb - xa)/sn
+    k = int(xa + 1.0)
+    xa -= float(k)
+
+#   Point j lies xa + j*xb samples past sample k. It is interpolated from the
+#   sample after it (or extrapolated from the last two samples of the profile).
+    u = xa + xb*numpy.arange(n)
+    kj = k + numpy.where(u > 0.0, numpy.ceil(u), 0.0).astype(int)
+    kj = numpy.minimum(kj, max(k, np))
+    xj = u - (kj - k)
+    s = numpy.empty(n + 2)
+    s[0] = sn
+    s[1] = 1.0
+    s[2:] = pfl[kj+2] + (pfl[kj+2] - pfl[kj+1])*xj
+
+    xa, xb = z1sq1(s, 0.0, sn, 0.0, 0.0)
+    spartial = s[2:] - (xa + (xb - xa)/sn*numpy.arange(n))
+    spartial = -numpy.partition(-spartial, (ka-1, kb-1))
+
+    d1thxv = spartial[ka-1] - spartial[kb-1]
+    d1thxv /= 1.0 - 0.8*math.exp(-(x2 - x1)/50.0e3)
+
+    return float(d1thxv)
+
+
+def d1thx_reference(pfl, x1, x2):
+    """
+    Using the terrain profile pfl we find deltah, the interdecile range of
+    elevations between the two points x1 and x2.
+
+    (Section 48)
+
+    Reference version of d1thx, building the interpolated profile point by
+    point.
     """
 
     np = int(pfl[0])
@@ -1042,7 +1229,7 @@ def d1thx(pfl, x1, x2):
         s.append(pfl[k+2] + (pfl[k+2] - pfl[k+1])*xa)
         xa = xa + xb
 
-    xa, xb = z1sq1(s,0.0,sn,xa,xb) # Revised call to z1sq1
+    xa, xb = z1sq1_reference(s,0.0,sn,xa,xb) # Revised call to z1sq1
     xb = (xb - xa)/sn
     for j in range(n):
         s[j+2] -= xa
@@ -1050,11 +1237,13 @@ def d1thx(pfl, x1, x2):
 
     spartial = s[2:]
     
-    d1thxv = qtile(n-1, spartial, ka-1) - qtile(n-1, spartial, kb-1)
+    d1thxv = (qtile_reference(n-1, spartial, ka-1) -
+              qtile_reference(n-1, spartial, kb-1))
     d1thxv /= 1.0 - 0.8*math.exp(-(x2 - x1)/50.0e3)
 
     return d1thxv
 
+
 def qlrpfl(pfl, klimx, mdvarx, prop, propa, propv):
     """
     This subroutine may be used to prepare for the point-to-point mode. Since the
@@ -1067,6 +1256,8 @@ def qlrpfl(pfl, klimx, mdvarx, prop, propa, propv):
 
     xl = []
 
+    if not REFERENCE_KERNELS:
+        pfl = numpy.asarray(pfl, dtype=float)
     prop.dist = pfl[0] * pfl[1]
     np = int(pfl[0])
     hzns(pfl, prop)
@@ -1160,6 +1351,29 @@ def point_to_point(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
 ##         Other-  Warning: Some parameters are out of range.
 ##                          Results are probably invalid.
 
+    prop, propv, fs, strmode = prepare_point_to_point(
+        elev, tht_m, rht_m, eps_dielect, sgm_conductivity, eno_ns_surfref,
+        frq_mhz, radio_climate, pol)
+
+    zc = qerfi(conf)
+    zr = qerfi(rel)
+    dbloss = avar(zr, 0.0, zc, prop, propv) + fs
+    errnum = prop.kwx
+    
+    return dbloss, strmode, errnum
+
+
+def prepare_point_to_point(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
+                           eno_ns_surfref, frq_mhz, radio_climate, pol):
+    """
+    Does the part of point_to_point which does not depend on the
+    reliability and confidence: the terrain analysis of the path (qlrpfl)
+    and the reference attenuation. Returns (prop, propv, fs, strmode), where
+    fs is the free space loss (dB) and strmode describes the dominant
+    propagation mode. The loss for a reliability/confidence pair is then
+    avar(qerfi(rel), 0.0, qerfi(conf), prop, propv) + fs.
+    """
+
     prop = PropType()
     propv = PropvType()
     propa = PropaType()
@@ -1171,8 +1385,6 @@ def point_to_point(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
     prop.kwx = 0
     propv.lvar = 5
     prop.mdp = -1
-    zc = qerfi(conf)
-    zr = qerfi(rel)
     np = int(elev[0])
 
     eno = eno_ns_surfref
@@ -1205,10 +1417,40 @@ def point_to_point(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
         elif prop.dist > propa.dx:
             strmode += ", Troposcatter Dominant"
 
-    dbloss = avar(zr, 0.0, zc, prop, propv) + fs
-    errnum = prop.kwx
-    
-    return dbloss, strmode, errnum
+    return prop, propv, fs, strmode
+
+
+def point_to_point_quantiles(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
+                             eno_ns_surfref, frq_mhz, radio_climate, pol,
+                             quantiles):
+    """
+    Point-to-point loss for several (rel, conf) pairs of one path. The
+    terrain analysis is done once; only the variability (avar) is evaluated
+    for each pair. The results are the same as calling point_to_point with
+    each pair.
+
+    Returns (dblosses, strmode, errnums), with one loss and error code for
+    each pair in quantiles.
+    """
+
+    prop, propv, fs, strmode = prepare_point_to_point(
+        elev, tht_m, rht_m, eps_dielect, sgm_conductivity, eno_ns_surfref,
+        frq_mhz, radio_climate, pol)
+
+#   The first call of avar sets up the parameters it keeps between calls
+#   (and may flag substituted climate or variability parameters in kwx).
+#   The median gives no out of range warning of its own.
+    avar(0.0, 0.0, 0.0, prop, propv)
+    kwx = prop.kwx
+
+    dblosses = []
+    errnums = []
+    for rel, conf in quantiles:
+        prop.kwx = kwx
+        dblosses.append(avar(qerfi(rel), 0.0, qerfi(conf), prop, propv) + fs)
+        errnums.append(prop.kwx)
+
+    return dblosses, strmode, errnums
 
 
 def point_to_pointMDH(elev, tht_m, rht_m, eps_dielect, sgm_conductivity,
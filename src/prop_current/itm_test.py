@@ -0,0 +1,167 @@
+# Tests that the vectorized ITM terrain kernels give the same results as the
+# reference, element-by-element kernels selected by itm.REFERENCE_KERNELS,
+# and that point_to_point_quantiles gives the same results as separate
+# point_to_point calls.
+
+import numpy
+import unittest
+
+import itm
+
+
+def randomProfile(rng):
+    """
+    Returns a random terrain profile in the ITS format: the number of
+    points - 1, the point spacing (m), then the elevations (m).
+    """
+
+    np = rng.randint(5, 600)
+    xi = rng.uniform(10., 100.)
+    elev = 500. + numpy.cumsum(rng.normal(0., 5., np + 1))
+    return [float(np), xi] + elev.tolist()
+
+
+class TestKernels(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(11)
+        self.reference_kernels = itm.REFERENCE_KERNELS
+
+    def tearDown(self):
+        itm.REFERENCE_KERNELS = self.reference_kernels
+
+    def both(self, f):
+        """
+        Returns the results of f() with the vectorized and with the
+        reference kernels.
+        """
+
+        itm.REFERENCE_KERNELS = False
+        vectorized = f()
+        itm.REFERENCE_KERNELS = True
+        reference = f()
+        return vectorized, reference
+
+    def test_hzns(self):
+        for i in range(50):
+            pfl = randomProfile(self.rng)
+            hg = [self.rng.uniform(3., 100.), self.rng.uniform(1., 20.)]
+            def horizons():
+                prop = itm.PropType()
+                prop.dist = pfl[0] * pfl[1]
+                prop.hg = list(hg)
+                prop.gme = 157e-9
+                itm.hzns(pfl, prop)
+                return prop.dl, prop.the
+            (dl, the), (dl_ref, the_ref) = self.both(horizons)
+            self.assertEquals(dl_ref, list(dl))
+            for a, b in zip(the_ref, the):
+                self.assertAlmostEqual(a, b, places=12)
+
+    def test_z1sq1(self):
+        for i in range(50):
+            z = randomProfile(self.rng)
+            xt = z[0] * z[1]
+            x1 = self.rng.uniform(0., 0.5 * xt)
+            x2 = self.rng.uniform(0.5 * xt, xt)
+            (z0, zn), (z0_ref, zn_ref) = self.both(
+                lambda: itm.z1sq1(z, x1, x2, 0., 0.))
+            self.assertAlmostEqual(z0_ref, z0, places=7)
+            self.assertAlmostEqual(zn_ref, zn, places=7)
+
+    def test_qtile(self):
+        for i in range(50):
+            n = self.rng.randint(1, 200)
+            a = self.rng.normal(0., 100., n).tolist()
+            nn = self.rng.randint(0, n)
+            ir = self.rng.randint(-2, nn + 3)
+            for values in (a, numpy.array(a)):
+                original = list(values)
+                itm.REFERENCE_KERNELS = False
+                q = itm.qtile(nn, values, ir)
+                # The vectorized qtile leaves its input unchanged.
+                self.assertEquals(original, list(values))
+                itm.REFERENCE_KERNELS = True
+                self.assertEquals(itm.qtile(nn, list(values), ir), q)
+
+    def test_d1thx(self):
+        for i in range(50):
+            pfl = randomProfile(self.rng)
+            xt = pfl[0] * pfl[1]
+            x1 = self.rng.uniform(0., 0.3 * xt)
+            x2 = self.rng.uniform(0.7 * xt, xt)
+            dh, dh_ref = self.both(lambda: itm.d1thx(pfl, x1, x2))
+            self.assertAlmostEqual(dh_ref, dh, places=6)
+
+    def test_point_to_point(self):
+        for i in range(20):
+            pfl = randomProfile(self.rng)
+            tht = self.rng.uniform(3., 100.)
+            rht = self.rng.uniform(1., 20.)
+            conf = self.rng.uniform(0.1, 0.9)
+            rel = self.rng.uniform(0.1, 0.9)
+            result, result_ref = self.both(
+                lambda: itm.point_to_point(list(pfl), tht, rht, 15., 0.005,
+                                           314., 3625., 5, 1, conf, rel,
+                                           0., '', 0))
+            self.assertAlmostEqual(result_ref[0], result[0], places=8)
+            self.assertEquals(result_ref[1:], result[1:])
+
+
+# (rel, conf) pairs including, at rel = 0.0001 and conf = 0.9999, deviates
+# beyond 3.1 which set kwx = 1 for that pair only; the pairs after them must
+# not inherit the warning.
+QUANTILES = [(0.5, 0.5), (0.1, 0.9), (0.0001, 0.5), (0.5, 0.5),
+             (0.95, 0.05), (0.5, 0.9999), (0.9, 0.5)]
+
+
+class TestQuantiles(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(5)
+
+    def check(self, pfl, tht, rht, radio_climate):
+        """
+        Checks point_to_point_quantiles for the QUANTILES against separate
+        point_to_point calls, and returns the error codes.
+        """
+
+        dblosses, strmode, errnums = itm.point_to_point_quantiles(
+            list(pfl), tht, rht, 15., 0.005, 314., 3625., radio_climate, 1,
+            QUANTILES)
+        self.assertEquals(len(QUANTILES), len(dblosses))
+        for (rel, conf), dbloss, errnum in zip(QUANTILES, dblosses, errnums):
+            expected = itm.point_to_point(list(pfl), tht, rht, 15., 0.005,
+                                          314., 3625., radio_climate, 1,
+                                          conf, rel, 0., '', 0)
+            self.assertAlmostEqual(expected[0], dbloss, places=10)
+            self.assertEquals(expected[1], strmode)
+            self.assertEquals(expected[2], errnum)
+        return errnums
+
+    def test_point_to_point_quantiles(self):
+        for i in range(20):
+            pfl = randomProfile(self.rng)
+            tht = self.rng.uniform(3., 100.)
+            rht = self.rng.uniform(1., 20.)
+            errnums = self.check(pfl, tht, rht, 5)
+            self.assertTrue(errnums[2] >= 1)
+            self.assertTrue(errnums[5] >= 1)
+            self.assertEquals(errnums[0], errnums[3])
+
+    def test_out_of_range_warning(self):
+        # A short, flat path with no warning of its own.
+        pfl = [100., 50.] + [500.] * 101
+        errnums = self.check(pfl, 30., 10., 5)
+        self.assertEquals([0, 0, 1, 0, 0, 1, 0], errnums)
+
+    def test_substituted_climate(self):
+        # The note that the default climate was substituted, set by the
+        # first avar call, is given for every pair.
+        pfl = [100., 50.] + [500.] * 101
+        errnums = self.check(pfl, 30., 10., 0)
+        self.assertEquals([2, 2, 2, 2, 2, 2, 2], errnums)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,33 @@ from terrain import *
 from geo import *
 from tropoclim import *
 from refractivity import *
+import threading
+
+# Set once the climate and refractivity data have been read.
+ENVIRONMENT_LOADED = False
+ENVIRONMENT_LOCK = threading.Lock()
+
+
+def loadEnvironment():
+    """
+    Reads the ITU climate and refractivity data files, once per process.
+    Later calls return immediately.
+    """
+
+    global ENVIRONMENT_LOADED
+
+    with ENVIRONMENT_LOCK:
+        if not ENVIRONMENT_LOADED:
+            readTropoClim('')
+            readRefractivity('')
+            ENVIRONMENT_LOADED = True
+
 
 def itm_wf(lat1, lon1, h1,
            lat2, lon2, h2,
            f = 3625.,
-           rel = 0.5):
+           rel = 0.5,
+           conf = 0.5):
     """
     Implements the WinnForum-compliant ITM pt-to-pt propagation loss
     model.
@@ -17,6 +39,7 @@ def itm_wf(lat1, lon1, h1,
     lat2, lon2, h2      Lat/lon (deg) and height AGL (m) of point 2
     f                   Frequency (MHz). Default is mid-point of band.
     rel                 Reliability (for aggreg interf see R2-SGN-12)
+    conf                Confidence
    
     Returns the following values:
     dbloss              Loss in dB (>0)
@@ -40,8 +63,28 @@ def itm_wf(lat1, lon1, h1,
     Andrew Clegg
     February 2017
     """
+
+    dblosses, errnums, strmode, dist, bearing, d, t = \
+            itm_wf_quantiles(lat1, lon1, h1, lat2, lon2, h2, f, [(rel, conf)])
+
+    return dblosses[0], errnums[0], strmode, dist, bearing, d, t
+
+
+def itm_wf_quantiles(lat1, lon1, h1,
+                     lat2, lon2, h2,
+                     f = 3625.,
+                     quantiles = ((0.5, 0.5),)):
+    """
+    As itm_wf, for several (reliability, confidence) pairs of one path, such
+    as the quantiles of the statistical aggregate interference method
+    (R2-SGN-12). The terrain profile and the ITM path analysis are computed
+    once for all pairs.
+
+    Returns the same values as itm_wf, except that dbloss and errnum are
+    replaced by lists with one value for each pair in quantiles:
+    dblosses, errnums, strmode, dist, bearing, d, t
+    """
     
-    conf = 0.5
     dielec = 25.
     conduct = 0.02
     pol = 1
@@ -61,23 +104,23 @@ def itm_wf(lat1, lon1, h1,
     latmid, lonmid, backaz = to_dist_bear_vincenty(lat1, lon1, dist/2., bearing)
     
 #   Lookup the climate value at the path midpoint, if not explicitly provided
+    if climate < 0 or refract < 0:
+        loadEnvironment()
     if climate < 0:
-        readTropoClim('')
         climate = tropoClim(latmid, lonmid)
 
 #   Look up the refractivity at the path midpoint, if not explicitly provided
     if refract < 0:
-        readRefractivity('')
         refract = refractivity(latmid, lonmid)
 
 #   Call ITM prop loss.
-    dbloss, strmode, errnum = \
-            point_to_point(elev, h1, h2, dielec, conduct,
-                           refract, f, climate, pol,
-                           conf, rel, 0., '', 0)
+    dblosses, strmode, errnums = \
+            point_to_point_quantiles(elev, h1, h2, dielec, conduct,
+                                     refract, f, climate, pol,
+                                     quantiles)
 
 #   Create distance/terrain arrays for plotting if desired
     d = (elev[1]/1000.) * np.asarray(range(len(elev)-2))
     t = elev[2:]
     
-    return dbloss, errnum, strmode, dist, bearing, d, t
+    return dblosses, errnums, strmode, dist, bearing, d, t
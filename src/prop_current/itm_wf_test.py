@@ -0,0 +1,54 @@
+# Tests that itm_wf_quantiles gives the same losses and error codes as
+# separate itm_wf calls. The AWC modules and the SAS geo modules imported by
+# itm_wf.py must be importable; the terrain profile, climate and
+# refractivity lookups are replaced by fixed values.
+
+import unittest
+
+import itm
+import itm_wf
+
+
+# (rel, conf) pairs, including rel = 0.0001 which sets kwx = 1 for that pair
+# only.
+QUANTILES = [(0.5, 0.5), (0.0001, 0.5), (0.5, 0.5), (0.05, 0.95),
+             (0.95, 0.5)]
+
+
+class TestItmWfQuantiles(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = [200., 30.] + [600. + 40. * ((i % 25) - 12) ** 2 / 144.
+                                      for i in range(201)]
+        self.saved = (itm_wf.terrainProfile_vincenty, itm_wf.tropoClim,
+                      itm_wf.refractivity, itm_wf.loadEnvironment)
+        itm_wf.terrainProfile_vincenty = lambda **kwargs: list(self.profile)
+        itm_wf.tropoClim = lambda lat, lon: 5
+        itm_wf.refractivity = lambda lat, lon: 314.
+        itm_wf.loadEnvironment = lambda: None
+
+    def tearDown(self):
+        (itm_wf.terrainProfile_vincenty, itm_wf.tropoClim,
+         itm_wf.refractivity, itm_wf.loadEnvironment) = self.saved
+
+    def test_quantiles(self):
+        dblosses, errnums, strmode, dist, bearing, d, t = \
+            itm_wf.itm_wf_quantiles(39.5, -105.0, 30., 39.5, -104.93, 10.,
+                                    3625., QUANTILES)
+        self.assertEquals([0, 1, 0, 0, 0], errnums)
+        for (rel, conf), dbloss, errnum in zip(QUANTILES, dblosses, errnums):
+            result = itm_wf.itm_wf(39.5, -105.0, 30., 39.5, -104.93, 10.,
+                                   3625., rel, conf)
+            self.assertAlmostEqual(result[0], dbloss, places=10)
+            self.assertEquals(result[1], errnum)
+            self.assertEquals(result[2], strmode)
+            expected = itm.point_to_point(list(self.profile), 30., 10., 25.,
+                                          0.02, 314., 3625., 5, 1, conf, rel,
+                                          0., '', 0)
+            self.assertAlmostEqual(expected[0], dbloss, places=10)
+            self.assertEquals(expected[2], errnum)
+        self.assertEquals(self.profile[2:], t)
+
+
+if __name__ == '__main__':
+    unittest.main()
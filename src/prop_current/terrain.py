@@ -12,6 +12,13 @@
 #
 # To retrieve an elevation:
 #   getTerrainElevation3DEP1(lat, lon) retrieves elevation in meters
+#
+# Terrain tiles are held by a TerrainReader, which keeps the most recently
+# used tiles in memory and may be shared between threads. The routines here
+# use the module-level READER unless another reader is passed in.
+#
+# To compute many profiles, prefetchTerrain(paths) orders the paths by the
+# grid files they touch and reads upcoming grid files in background threads.
 
 # Set this path to the modules directory
 MODULES_PATH = 'E:\\Google Drive\\Google\\Programming\\python\\modules'
@@ -19,17 +26,28 @@ MODULES_PATH = 'E:\\Google Drive\\Google\\Programming\\python\\modules'
 import sys
 sys.path.insert(0, MODULES_PATH)
 
+import os
+
+# The SAS geo modules, for the tile cache, prefetching and vincenty routines
+# shared with the NED indexer
+GEO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'geo')
+sys.path.append(GEO_PATH)
+
 import matplotlib.pyplot as plt
 import numpy as np
 import math
 import geo # An AWC module
 import physics # An AWC module
+import tile_cache
+import tile_prefetch
+import vincenty
 
 # Set this to the directory where the terrain data files are located
 TERRAIN_DIR = 'E:\\Google Drive\\BigFiles\\Google\\Databases\\Terrain\\3dep-1\\'
 
-# These global variables are used to allow a terrain grid to be kept in memory
-# until it is no longer needed.
+# These global variables hold the grid last read by readGridFile3DEP1. The
+# routines below read tiles through a TerrainReader instead.
 CURRENT_GRID_FILE = ''
 TDATA = np.zeros((3612,3612))
 
@@ -74,6 +92,27 @@ def gridFile(lat, lon):
     return gridfile + '.dat'
 
 
+def loadGridFile3DEP1(gridfile, terrain_dir = None):
+    """
+    Reads a USGS 3DEP 1" terrain grid file and returns it as a 3612x3612
+    float32 array, or None if the file doesn't exist or can't be read.
+
+    Note that gridfile should be the grid file base name, without the
+    directory prepended. The directory defaults to the TERRAIN_DIR global
+    declared above.
+    """
+
+    if terrain_dir is None:
+        terrain_dir = TERRAIN_DIR
+
+    xdim = ydim = 3612
+
+    try:
+        return np.fromfile(terrain_dir + gridfile, dtype=np.float32).reshape(ydim,xdim)
+    except:
+        return None
+
+
 def readGridFile3DEP1(gridfile):
     """
     Reads a USGS 3DEP 1" terrain grid file into the global array TDATA.
@@ -84,6 +123,8 @@ def readGridFile3DEP1(gridfile):
 
     If the file doesn't exist or can't be read, TDATA[:,:] = 0 and
     the return code is -1.
+
+    The routines below read tiles through a TerrainReader instead.
     
     Andrew Clegg
     October 2016
@@ -92,143 +133,280 @@ def readGridFile3DEP1(gridfile):
     global TDATA
     global CURRENT_GRID_FILE
 
-    xdim = ydim = 3612
-    
-    try:
-        TDATA = np.fromfile(TERRAIN_DIR + gridfile, dtype=np.float32).reshape(ydim,xdim)
-        CURRENT_GRID_FILE= gridfile
-        return 0
-    except:
+    CURRENT_GRID_FILE = gridfile
+    TDATA = loadGridFile3DEP1(gridfile)
+    if TDATA is None:
         TDATA = np.zeros((3612,3612))
-        CURRENT_GRID_FILE = gridfile
         return -1
+    return 0
+
+
+# Memory taken by one 3DEP 1" grid tile
+TILE_BYTES = 3612 * 3612 * 4
 
+# Elevations below this (m) mark void (bad data) pixels
+VOID_ELEVATION = -9000.
 
-def getTerrainElevation3DEP1(lat, lon, interp='none'):
+
+def voidToZero(v):
     """
-    Retrieves an elevation corresponding to the given lat/lon. The terrain
-    data are 1" USGS 3DEP.
-    
-    Andrew Clegg
-    October 2016
+    Returns the elevation or array of elevations v with void pixels (below
+    VOID_ELEVATION) set to 0 m. The tile itself is not changed, since it may
+    be shared through the reader's cache.
     """
 
-    global CURRENT_GRID_FILE
-    global TDATA
-    global F_TEST #DEBUG
-    global IPOINT #DEBUG
-    
-#   Resolution of terrain grid file in arc seconds
-    res = 1.0
+    return np.where(v < VOID_ELEVATION, np.zeros_like(v), v)[()]
+
+
+class TerrainReader:
+    """
+    Keeps up to max_tiles 3DEP 1" terrain grid tiles in memory, evicting the
+    least recently used tile when a new one is needed. A path which zig-zags
+    across a tile boundary therefore reads each tile once.
+
+    Tiles are held in a tile_cache.TileCache, which may be passed in to share
+    one memory budget with other readers (max_tiles is then ignored). The
+    reader may be shared between threads; a thread asking for a tile which
+    another thread is reading waits for that read instead of repeating it.
+    """
+
+    def __init__(self, terrain_dir = None, max_tiles = 10, cache = None):
+        self.terrain_dir = terrain_dir # None uses TERRAIN_DIR
+        if cache is None:
+            cache = tile_cache.TileCache(max_tiles * TILE_BYTES)
+        self.cache = cache
+
+    def getTile(self, gridfile):
+        """
+        Returns the tile array for the grid file, reading it if it is not
+        already in memory, or None if the file can't be read.
+        """
 
-#   Number of overlapping pixels between neighboring terrain files
-    xoverlap = yoverlap = 6
+        return self.cache.GetOrLoad(gridfile, lambda: self._readTile(gridfile))
 
-#   Check if this requires reading a new grid file. If so, read it. If the
-#   file doesn't exist, display a warning and return 0 elevation.
-    gridfile = gridFile(lat, lon)
-    if gridfile <> CURRENT_GRID_FILE:
-        if readGridFile3DEP1(gridfile) < 0:
+    def _readTile(self, gridfile):
+        tdata = loadGridFile3DEP1(gridfile, self.terrain_dir)
+        if tdata is None:
+            # Remembered, so that the file is only tried once
             print 'No terrain file. Setting elevations to 0. ', gridfile
+            return None, 0
+        return tdata, tdata.nbytes
+
+    def elevation(self, lat, lon, interp='none'):
+        """
+        Retrieves an elevation corresponding to the given lat/lon. See
+        getTerrainElevation3DEP1.
+        """
+
+        global F_TEST #DEBUG
+        global IPOINT #DEBUG
+
+#       Resolution of terrain grid file in arc seconds
+        res = 1.0
+
+#       Number of overlapping pixels between neighboring terrain files
+        xoverlap = yoverlap = 6
+
+#       Find the tile for this lat/lon. If the file doesn't exist, return 0
+#       elevation.
+        tdata = self.getTile(gridFile(lat, lon))
+        if tdata is None:
             return 0.0
 
-    # Find the coordinates of this lat/lon in the tile file,
-    # in floating point units. The -0.5 factor at the end compensates for
-    # the half-pixel offset of the center from the edge.
-    float_x = float(xoverlap) + 3600.*(lon - math.floor(lon))/res - 0.5
-    float_y = float(yoverlap) + 3600.*(math.ceil(lat) - lat)/res - 0.5
-
-    if interp.lower().strip() == 'bilinear':
-
-        # Bilinear interpolation
-
-        # Calculate the integer coordinates of the tile points that
-        # are just below and just above the floating point coordinates
-        xm = math.floor(float_x)
-        xp = xm + 1
-        ym = math.floor(float_y)
-        yp = ym + 1
-
-#       Calculate the areas used for weighting
-        area_xm_ym = abs((float_x-xm)*(float_y-ym))
-        area_xm_yp = abs((float_x-xm)*(float_y-yp))
-        area_xp_yp = abs((float_x-xp)*(float_y-yp))
-        area_xp_ym = abs((float_x-xp)*(float_y-ym))
-
-#       Find and warn of bad data
-        if TDATA[yp, xp] < -9000:
-            TDATA[yp, xp] = 0.
-            print 'Bad terrain data'
-        if TDATA[ym, xp] < -9000:
-            TDATA[ym, xp] = 0.
-            print 'Bad terrain data'
-        if TDATA[ym, xm] < -9000:
-            TDATA[ym, xm] = 0.
-            print 'Bad terrain data'
-        if TDATA[yp, xm] < -9000:
-            TDATA[yp, xm] = 0.
-            print 'Bad terrain data'
+        # Find the coordinates of this lat/lon in the tile file,
+        # in floating point units. The -0.5 factor at the end compensates for
+        # the half-pixel offset of the center from the edge.
+        float_x = float(xoverlap) + 3600.*(lon - math.floor(lon))/res - 0.5
+        float_y = float(yoverlap) + 3600.*(math.ceil(lat) - lat)/res - 0.5
+
+        if interp.lower().strip() == 'bilinear':
+
+            # Bilinear interpolation
+
+            # Calculate the integer coordinates of the tile points that
+            # are just below and just above the floating point coordinates
+            xm = int(math.floor(float_x))
+            xp = xm + 1
+            ym = int(math.floor(float_y))
+            yp = ym + 1
+
+#           Calculate the areas used for weighting
+            area_xm_ym = abs((float_x-xm)*(float_y-ym))
+            area_xm_yp = abs((float_x-xm)*(float_y-yp))
+            area_xp_yp = abs((float_x-xp)*(float_y-yp))
+            area_xp_ym = abs((float_x-xp)*(float_y-ym))
+
+#           Weight each of the four grid points by the opposite area
+            value =  area_xm_ym * voidToZero(tdata[yp, xp]) \
+                   + area_xm_yp * voidToZero(tdata[ym, xp]) \
+                   + area_xp_yp * voidToZero(tdata[ym, xm]) \
+                   + area_xp_ym * voidToZero(tdata[yp, xm])
             
-#       Weight each of the four grid points by the opposite area
-        value =  area_xm_ym * TDATA[yp, xp] \
-               + area_xm_yp * TDATA[ym, xp] \
-               + area_xp_yp * TDATA[ym, xm] \
-               + area_xp_ym * TDATA[yp, xm]
-            
-        if DEBUG == True:
-            IPOINT += 1
-            F_TEST.write(        str(IPOINT)
-                         + ',' + str(lat)
-                         + ',' + str(lon)
-                         + ',' + interp
-                         + ',' + str(float_x)
-                         + ',' + str(float_y)
-                         + ',' + str(xm)
-                         + ',' + str(xp)
-                         + ',' + str(ym)
-                         + ',' + str(yp)
-                         + ',' + str(area_xm_ym)
-                         + ',' + str(TDATA[yp, xp])
-                         + ',' + str(area_xm_yp)
-                         + ',' + str(TDATA[ym, xp])
-                         + ',' + str(area_xp_yp)
-                         + ',' + str(TDATA[ym, xm])
-                         + ',' + str(area_xp_ym)
-                         + ',' + str(TDATA[yp, xm])
-                         + ',' + str(value)
-                         + '\n')
-                                 
-        return value
-    
-    else:
+            if DEBUG == True:
+                IPOINT += 1
+                F_TEST.write(        str(IPOINT)
+                             + ',' + str(lat)
+                             + ',' + str(lon)
+                             + ',' + interp
+                             + ',' + str(float_x)
+                             + ',' + str(float_y)
+                             + ',' + str(xm)
+                             + ',' + str(xp)
+                             + ',' + str(ym)
+                             + ',' + str(yp)
+                             + ',' + str(area_xm_ym)
+                             + ',' + str(tdata[yp, xp])
+                             + ',' + str(area_xm_yp)
+                             + ',' + str(tdata[ym, xp])
+                             + ',' + str(area_xp_yp)
+                             + ',' + str(tdata[ym, xm])
+                             + ',' + str(area_xp_ym)
+                             + ',' + str(tdata[yp, xm])
+                             + ',' + str(value)
+                             + '\n')
+                                     
+            return value
+        
+        else:
 
-        # Return the elevation of the nearest point
-        # The +0.5 factor compensates for the half-pixel offset
-        # previously added to compensate for the half-width of the pixel.
-        ix = int(float_x + 0.5)
-        iy = int(float_y + 0.5)
-
-        if DEBUG == True:
-            IPOINT += 1
-            F_TEST.write(        str(IPOINT)
-                         + ',' + str(lat)
-                         + ',' + str(lon)
-                         + ',' + interp
-                         + ',' + str(float_x)
-                         + ',' + str(float_y)
-                         + ',' + str(ix)
-                         + ',' + str(iy)
-                         + ',' + str(TDATA[iy,ix])
-                         + '\n')
-        if TDATA[iy, ix] < -9000:
-            print 'Bad terrain point'
-            return 0
+            # Return the elevation of the nearest point
+            # The +0.5 factor compensates for the half-pixel offset
+            # previously added to compensate for the half-width of the pixel.
+            ix = int(float_x + 0.5)
+            iy = int(float_y + 0.5)
+
+            if DEBUG == True:
+                IPOINT += 1
+                F_TEST.write(        str(IPOINT)
+                             + ',' + str(lat)
+                             + ',' + str(lon)
+                             + ',' + interp
+                             + ',' + str(float_x)
+                             + ',' + str(float_y)
+                             + ',' + str(ix)
+                             + ',' + str(iy)
+                             + ',' + str(tdata[iy,ix])
+                             + '\n')
+
+            return voidToZero(tdata[iy, ix])
+
+
+    def elevations(self, lats, lons, interp='none'):
+        """
+        Retrieves the elevations at arrays of lats/lons, giving the same
+        values as elevation() at each point. The points are grouped by tile
+        so that each tile is looked up once and its values are gathered with
+        array indexing. Returns a float64 array for bilinear interpolation,
+        otherwise the float32 values of the nearest points. Points are not
+        written to the DEBUG file.
+        """
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+#       Resolution of terrain grid file in arc seconds
+        res = 1.0
+
+#       Number of overlapping pixels between neighboring terrain files
+        xoverlap = yoverlap = 6
+
+        bilinear = interp.lower().strip() == 'bilinear'
+        if bilinear:
+            elev = np.zeros(lats.shape, dtype=np.float64)
         else:
-            return TDATA[iy, ix]
+            elev = np.zeros(lats.shape, dtype=np.float32)
+
+        ilat = np.ceil(lats)
+        ilon = np.floor(lons)
+        tiles, tile_index = np.unique(np.column_stack((ilat, ilon)), axis=0,
+                                      return_inverse=True)
+
+        for i in range(len(tiles)):
+            tdata = self.getTile(gridFile(tiles[i][0] - 0.5, tiles[i][1] + 0.5))
+            if tdata is None:
+                continue
+            sel = np.nonzero(tile_index == i)[0]
+
+            # As in elevation(), including the half-pixel offset.
+            float_x = float(xoverlap) + 3600.*(lons[sel] - ilon[sel])/res - 0.5
+            float_y = float(yoverlap) + 3600.*(ilat[sel] - lats[sel])/res - 0.5
+
+            if bilinear:
+                xm = np.floor(float_x).astype(int)
+                xp = xm + 1
+                ym = np.floor(float_y).astype(int)
+                yp = ym + 1
+
+                area_xm_ym = np.abs((float_x-xm)*(float_y-ym))
+                area_xm_yp = np.abs((float_x-xm)*(float_y-yp))
+                area_xp_yp = np.abs((float_x-xp)*(float_y-yp))
+                area_xp_ym = np.abs((float_x-xp)*(float_y-ym))
+
+                elev[sel] =  area_xm_ym * voidToZero(tdata[yp, xp]) \
+                           + area_xm_yp * voidToZero(tdata[ym, xp]) \
+                           + area_xp_yp * voidToZero(tdata[ym, xm]) \
+                           + area_xp_ym * voidToZero(tdata[yp, xm])
+            else:
+                ix = (float_x + 0.5).astype(int)
+                iy = (float_y + 0.5).astype(int)
+                elev[sel] = voidToZero(tdata[iy, ix])
+
+        return elev
+
+# The reader used by the routines below unless another one is passed in.
+READER = TerrainReader()
+
+
+def pathGridFiles(lat1, lon1, lat2, lon2):
+    """
+    Returns the sorted list of grid files touched by the vincenty path between
+    the two lat/lon pairs. See tile_prefetch.PathTiles.
+    """
+
+    return sorted(gridFile(ilat - 0.5, ilon + 0.5) for ilat, ilon in
+                  tile_prefetch.PathTiles(lat1, lon1, lat2, lon2))
+
+
+def prefetchTerrain(paths, lookahead = 8, nthreads = 2, reader = None):
+    """
+    Generator which yields the given paths, each a tuple beginning with
+    (lat1, lon1, lat2, lon2), reordered so that paths touching the same grid
+    files are adjacent. While the caller computes each path, background
+    threads read the grid files needed by the next lookahead paths into the
+    reader, so that a tile change no longer stalls on a synchronous file
+    read. The lookahead should be small enough that its tiles fit in the
+    reader. See tile_prefetch.PrefetchPaths.
+
+    Example:
+        for path in prefetchTerrain(paths):
+            elev = terrainProfile_vincenty(*path[:4])
+    """
+
+    if reader is None:
+        reader = READER
+
+    path_files = [pathGridFiles(*p[:4]) for p in paths]
+    return tile_prefetch.PrefetchPaths(paths, path_files, reader.getTile,
+                                       lookahead, nthreads)
+
+
+def getTerrainElevation3DEP1(lat, lon, interp='none', reader = None):
+    """
+    Retrieves an elevation corresponding to the given lat/lon. The terrain
+    data are 1" USGS 3DEP. Void pixels (below VOID_ELEVATION) are taken as
+    0 m.
+    
+    Andrew Clegg
+    October 2016
+    """
+
+    if reader is None:
+        reader = READER
+    return reader.elevation(lat, lon, interp)
 
 
 def terrainProfile(lat1, lon1, lat2, lon2, target_dx = -1, interp = 'bilinear',
-                   winnf=False, res = 1.):
+                   winnf=False, res = 1., reader = None):
     """
     Returns the terrain profile along the great circle path between the two
     lat/lon pairs. If npts > 2, the profile consists of npts equally-spaced points
@@ -244,6 +422,7 @@ def terrainProfile(lat1, lon1, lat2, lon2, target_dx = -1, interp = 'bilinear',
         target_dx       Target resolution between points (m) (>= 1 m)
         res             Dataset resolution (arc seconds)
         winnf           If True, uses WinnForum requirement for paths over 45 km
+        reader          TerrainReader to use (defaults to READER)
 
     Output:
         elev[npts+2]    Elevation array in ITS format
@@ -257,6 +436,9 @@ def terrainProfile(lat1, lon1, lat2, lon2, target_dx = -1, interp = 'bilinear',
 
     d = geo.dist(lat1, lon1, lat2, lon2, 'm') # Distance between end points (m)
 
+    if reader is None:
+        reader = READER
+
     if target_dx < 1:
         target_dx = 1000. * physics.Re * math.radians(res/3600.)
 
@@ -270,19 +452,20 @@ def terrainProfile(lat1, lon1, lat2, lon2, target_dx = -1, interp = 'bilinear',
     lat = lat1
     lon = lon1
 
-    elev = [npts-1, dx, getTerrainElevation3DEP1(lat, lon, interp)]
+    elev = [npts-1, dx, reader.elevation(lat, lon, interp)]
     
     for i in range(1, npts-1):
         b = geo.bearing(lat, lon, lat2, lon2)
         lat, lon = geo.to_dist_bearing(lat, lon, dx, b, 'm')
-        elev.append(getTerrainElevation3DEP1(lat, lon, interp))
+        elev.append(reader.elevation(lat, lon, interp))
 
-    elev.append(getTerrainElevation3DEP1(lat2, lon2, interp))
+    elev.append(reader.elevation(lat2, lon2, interp))
 
     return elev
 
 def terrainProfile_vincenty(lat1, lon1, lat2, lon2, target_dx = -1,
-                            interp = 'none', winnf=False, res = 1.):
+                            interp = 'none', winnf=False, res = 1.,
+                            reader = None):
     """
     Returns the terrain profile along the vincenty path between the two
     lat/lon pairs. If npts > 2, the profile consists of npts equally-spaced points
@@ -298,6 +481,7 @@ def terrainProfile_vincenty(lat1, lon1, lat2, lon2, target_dx = -1,
         target_dx       Target resolution between points (m) (>= 1 m)
         res             Dataset resolution (arc seconds)
         winnf           If True, uses WinnForum requirement for paths over 45 km
+        reader          TerrainReader to use (defaults to READER)
 
     Output:
         elev[npts+2]    Elevation array in ITS format
@@ -305,6 +489,9 @@ def terrainProfile_vincenty(lat1, lon1, lat2, lon2, target_dx = -1,
                         elev[1] = distance between sample points (m)
                         elev[2]...elev[npts+1] = Terrain elevation (m)
 
+    The vincenty path is solved once, and the points along it are found
+    together with vincenty.to_dist_bear_vincenty_array.
+
     Andrew Clegg
     November 2016
     """
@@ -313,6 +500,9 @@ def terrainProfile_vincenty(lat1, lon1, lat2, lon2, target_dx = -1,
        geo.dist_bear_vincenty(lat1, lon1, lat2, lon2) # Distance between end points (m)
     d *= 1000. # convert to m
     
+    if reader is None:
+        reader = READER
+
     if target_dx < 1:
         target_dx = 1000. * physics.Re * math.radians(res/3600.)
 
@@ -323,16 +513,15 @@ def terrainProfile_vincenty(lat1, lon1, lat2, lon2, target_dx = -1,
         
     dx = d/float(npts-1)
     
-    lat = lat1
-    lon = lon1
-
-    elev = [npts-1, dx, getTerrainElevation3DEP1(lat, lon, interp)]
-    
-    for i in range(1, npts-1):
-        d, b, backaz = geo.dist_bear_vincenty(lat, lon, lat2, lon2)
-        lat, lon, az = geo.to_dist_bear_vincenty(lat, lon, dx/1000., b)
-        elev.append(getTerrainElevation3DEP1(lat, lon, interp))
-
-    elev.append(getTerrainElevation3DEP1(lat2, lon2, interp))
+    # The interior points are all generated from the single solution of the
+    # path above, spaced dx apart along the geodesic leaving lat1/lon1 at
+    # azstart, and their elevations are looked up together.
+    lats, lons, az = vincenty.to_dist_bear_vincenty_array(
+        lat1, lon1, np.arange(1, npts-1) * (dx/1000.), azstart)
+    lats = np.concatenate(([lat1], lats, [lat2]))
+    lons = np.concatenate(([lon1], lons, [lon2]))
+
+    elev = [npts-1, dx]
+    elev.extend(reader.elevations(lats, lons, interp).tolist())
 
     return elev
@@ -0,0 +1,283 @@
+# Tests for the terrain profile routines. The AWC geo and physics modules
+# (see MODULES_PATH in terrain.py) must be importable.
+
+import math
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import geo # An AWC module
+import physics # An AWC module
+import terrain
+import tile_cache
+
+
+class FakeReader:
+    """
+    Stands in for a TerrainReader, recording the grid files read.
+    """
+
+    def __init__(self, delay = 0.):
+        self.delay = delay
+        self.read = []
+        self.lock = threading.Lock()
+
+    def getTile(self, gridfile):
+        time.sleep(self.delay)
+        with self.lock:
+            self.read.append(gridfile)
+        return None
+
+
+class TestTerrainReader(unittest.TestCase):
+
+    def setUp(self):
+        self.loads = []
+        self.lock = threading.Lock()
+        self.loadGridFile3DEP1 = terrain.loadGridFile3DEP1
+        terrain.loadGridFile3DEP1 = self.fakeLoad
+
+    def tearDown(self):
+        terrain.loadGridFile3DEP1 = self.loadGridFile3DEP1
+
+    def fakeLoad(self, gridfile, terrain_dir = None):
+        """
+        Returns a small tile whose values are the number of loads so far,
+        or None for the grid file 'missing.dat'.
+        """
+
+        time.sleep(0.02)
+        with self.lock:
+            self.loads.append(gridfile)
+            n = len(self.loads)
+        if gridfile == 'missing.dat':
+            return None
+        return np.full((10, 10), n, dtype=np.float32)
+
+    def test_eviction(self):
+        nbytes = 10 * 10 * 4
+        reader = terrain.TerrainReader(cache=tile_cache.TileCache(2 * nbytes))
+        a = reader.getTile('a.dat')
+        reader.getTile('b.dat')
+        self.assertTrue(reader.getTile('a.dat') is a)
+        reader.getTile('c.dat') # evicts b
+        self.assertEquals(['a.dat', 'b.dat', 'c.dat'], self.loads)
+        self.assertTrue(reader.getTile('a.dat') is a)
+        self.assertEquals(4., reader.getTile('b.dat')[0, 0])
+        self.assertEquals(['a.dat', 'b.dat', 'c.dat', 'b.dat'], self.loads)
+
+    def test_concurrent_loads_of_one_tile(self):
+        reader = terrain.TerrainReader()
+        tiles = []
+        def get():
+            tiles.append(reader.getTile('a.dat'))
+        threads = [threading.Thread(target=get) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEquals(['a.dat'], self.loads)
+        self.assertEquals(8, len(tiles))
+        for tile in tiles:
+            self.assertTrue(tile is tiles[0])
+
+    def test_missing_tile(self):
+        reader = terrain.TerrainReader()
+        self.assertEquals(None, reader.getTile('missing.dat'))
+        self.assertEquals(None, reader.getTile('missing.dat'))
+        self.assertEquals(['missing.dat'], self.loads)
+
+
+class TestGridFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp() + os.sep
+        self.data = np.zeros((3612, 3612), dtype=np.float32)
+        self.data[100, 200] = 1234.5
+        self.data[101, 200] = -9999. # void, looked up as 0
+        self.data.tofile(self.directory + 'N40W106.dat')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load(self):
+        tdata = terrain.loadGridFile3DEP1('N40W106.dat', self.directory)
+        self.assertEquals((3612, 3612), tdata.shape)
+        self.assertEquals(1234.5, tdata[100, 200])
+        # Voids are substituted on lookup, not in the loaded tile.
+        self.assertEquals(-9999., tdata[101, 200])
+        self.assertEquals(None,
+                          terrain.loadGridFile3DEP1('N41W106.dat',
+                                                    self.directory))
+
+    def test_read_global(self):
+        terrain_dir = terrain.TERRAIN_DIR
+        terrain.TERRAIN_DIR = self.directory
+        try:
+            self.assertEquals(0, terrain.readGridFile3DEP1('N40W106.dat'))
+            self.assertEquals(1234.5, terrain.TDATA[100, 200])
+            self.assertEquals(-1, terrain.readGridFile3DEP1('N41W106.dat'))
+            self.assertEquals('N41W106.dat', terrain.CURRENT_GRID_FILE)
+            self.assertEquals(0., np.abs(terrain.TDATA).max())
+        finally:
+            terrain.TERRAIN_DIR = terrain_dir
+
+    def test_reader_elevation(self):
+        reader = terrain.TerrainReader(self.directory)
+        # The center of pixel (100, 200), allowing for the 6 pixel overlap.
+        lat = 40. - (100 - 6 + 0.5) / 3600.
+        lon = -106. + (200 - 6 + 0.5) / 3600.
+        self.assertEquals(1234.5, reader.elevation(lat, lon))
+        self.assertAlmostEqual(1234.5, reader.elevation(lat, lon, 'bilinear'))
+        self.assertEquals(0., reader.elevation(41.5, -105.5))
+
+    def test_reader_void(self):
+        reader = terrain.TerrainReader(self.directory)
+        # The center of the void pixel (101, 200), and a point between it and
+        # pixel (100, 200).
+        lat = 40. - (101 - 6 + 0.5) / 3600.
+        lon = -106. + (200 - 6 + 0.5) / 3600.
+        self.assertEquals(0., reader.elevation(lat, lon))
+        self.assertAlmostEqual(0., reader.elevation(lat, lon, 'bilinear'))
+        self.assertAlmostEqual(617.25,
+                               reader.elevation(lat + 0.5 / 3600., lon,
+                                                'bilinear'))
+        self.assertEquals([0., 1234.5],
+                          reader.elevations([lat, lat + 1. / 3600.],
+                                            [lon, lon]).tolist())
+        self.assertAlmostEqual(
+            0., reader.elevations([lat], [lon], 'bilinear')[0])
+        # The cached tile keeps the void value.
+        self.assertEquals(-9999., reader.getTile('N40W106.dat')[101, 200])
+
+
+class TestTerrainProfile(unittest.TestCase):
+
+    def setUp(self):
+        # A smooth synthetic tile, so that nearby points have nearby
+        # elevations.
+        y, x = np.mgrid[0:3612, 0:3612]
+        tile = (1000. + 0.5 * x + 0.25 * y).astype(np.float32)
+        self.reader = terrain.TerrainReader()
+        self.reader.cache.Put('N40W106.dat', tile, tile.nbytes)
+
+    def loopProfile(self, lat1, lon1, lat2, lon2, interp):
+        """
+        The profile computed point by point, re-solving the path from each
+        point to the end point as terrainProfile_vincenty originally did.
+        Returns the profile and the lats and lons of its interior points.
+        """
+
+        d, azstart, backaz = geo.dist_bear_vincenty(lat1, lon1, lat2, lon2)
+        d *= 1000.
+        target_dx = 1000. * physics.Re * math.radians(1./3600.)
+        npts = int(d/target_dx) + 1
+        dx = d/float(npts-1)
+        lat = lat1
+        lon = lon1
+        elev = [npts-1, dx, self.reader.elevation(lat, lon, interp)]
+        lats = []
+        lons = []
+        for i in range(1, npts-1):
+            d, b, backaz = geo.dist_bear_vincenty(lat, lon, lat2, lon2)
+            lat, lon, az = geo.to_dist_bear_vincenty(lat, lon, dx/1000., b)
+            lats.append(lat)
+            lons.append(lon)
+            elev.append(self.reader.elevation(lat, lon, interp))
+        elev.append(self.reader.elevation(lat2, lon2, interp))
+        return elev, lats, lons
+
+    def test_matches_point_loop(self):
+        for lat1, lon1, lat2, lon2 in [(39.2, -105.8, 39.7, -105.1),
+                                       (39.9, -105.01, 39.05, -105.9),
+                                       (39.5, -105.5, 39.5, -105.45)]:
+            for interp in ('bilinear', 'none'):
+                elev = terrain.terrainProfile_vincenty(lat1, lon1, lat2, lon2,
+                                                       interp=interp,
+                                                       reader=self.reader)
+                expected, loop_lats, loop_lons = self.loopProfile(
+                    lat1, lon1, lat2, lon2, interp)
+                self.assertEquals(expected[0], elev[0])
+                self.assertAlmostEqual(expected[1], elev[1], places=9)
+                self.assertEquals(len(expected), len(elev))
+
+                # The interior points are placed along the initial azimuth
+                # from lat1/lon1 rather than re-solved from each step, so
+                # they are compared by position: they must lie within
+                # 10 cm of the stepwise points, far below a pixel (~30 m).
+                # Over such small offsets a flat earth distance will do.
+                d, az, backaz = geo.dist_bear_vincenty(lat1, lon1,
+                                                       lat2, lon2)
+                dists = np.arange(1, elev[0]) * (elev[1]/1000.)
+                lats, lons, az = terrain.vincenty.to_dist_bear_vincenty_array(
+                    lat1, lon1, dists, az)
+                m_per_deg = 1000. * physics.Re * math.radians(1.)
+                dy = (lats - np.array(loop_lats)) * m_per_deg
+                dx = ((lons - np.array(loop_lons)) * m_per_deg *
+                      np.cos(np.radians(lats)))
+                self.assertTrue(np.hypot(dx, dy).max() < 0.1)
+
+                # At those points the profile holds the elevations of point
+                # by point lookups.
+                self.assertAlmostEqual(expected[2], elev[2], places=9)
+                self.assertAlmostEqual(expected[-1], elev[-1], places=9)
+                for i in range(len(lats)):
+                    self.assertAlmostEqual(
+                        self.reader.elevation(lats[i], lons[i], interp),
+                        elev[i+3], places=9)
+
+                self.assertTrue(isinstance(elev, list))
+                self.assertTrue(isinstance(elev[0], int))
+                for v in elev[1:]:
+                    self.assertTrue(type(v) is float)
+
+    def test_winnf_points(self):
+        elev = terrain.terrainProfile_vincenty(39.1, -105.9, 39.9, -105.1,
+                                               winnf=True, reader=self.reader)
+        self.assertEquals(1499, elev[0])
+        self.assertEquals(1502, len(elev))
+
+
+class TestPrefetchTerrain(unittest.TestCase):
+
+    def test_path_grid_files(self):
+        self.assertEquals(['N40W106.dat'],
+                          terrain.pathGridFiles(39.2, -105.8, 39.7, -105.1))
+        files = terrain.pathGridFiles(39.5, -105.5, 40.5, -104.5)
+        self.assertTrue('N40W106.dat' in files)
+        self.assertTrue('N41W105.dat' in files)
+
+    def test_prefetch_order_and_reads(self):
+        paths = [(40.5, -104.5, 40.6, -104.4, 'b'),
+                 (39.5, -105.5, 39.6, -105.4, 'a'),
+                 (40.2, -104.2, 40.3, -104.3, 'b'),
+                 (39.2, -105.2, 39.3, -105.3, 'a')]
+        reader = FakeReader()
+        result = []
+        for path in terrain.prefetchTerrain(paths, lookahead=4,
+                                            reader=reader):
+            time.sleep(0.01)
+            result.append(path[4])
+        self.assertEquals(['a', 'a', 'b', 'b'], result)
+        self.assertEquals(['N40W106.dat', 'N41W105.dat'], sorted(reader.read))
+
+    def test_prefetch_closed_early(self):
+        # Closing the generator does not wait for the queued reads.
+        paths = [(lat + 0.5, -105.5, lat + 0.6, -105.4)
+                 for lat in range(20, 40)]
+        reader = FakeReader(delay=0.05)
+        prefetch = terrain.prefetchTerrain(paths, lookahead=20, nthreads=1,
+                                           reader=reader)
+        prefetch.next()
+        start = time.time()
+        prefetch.close()
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertTrue(len(reader.read) < 5)
+
+
+if __name__ == '__main__':
+    unittest.main()